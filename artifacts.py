@@ -0,0 +1,126 @@
+# artifacts.py - Compressed storage of intermediate CSV artifacts
+#
+# With POPEYES_ARTIFACT_COMPRESSION=gzip (or zstd), part1's converted CSVs
+# and payroll's _Formatted/_Pivot CSVs are uploaded as <name>.gz / <name>.zst
+# instead of plain CSV. The CSV text is streamed through the compressor into
+# a temp file, so no compressed copy is held in memory, and part2 streams
+# the download through the decompressor straight into pd.read_csv. The
+# workbooks, summaries and tracking sheets are unchanged.
+# bench/artifact_bench.py compares bytes and time against plain CSV.
+#
+# Compressed output is byte-for-byte reproducible (gzip mtime is fixed), so
+# upsert_file still skips re-uploads of unchanged content.
+import io
+import os
+import gzip
+import tempfile
+import contextlib
+
+import pandas as pd
+
+from drive_io import upsert_file, budgeted_download, find_first, SPOOL_DIR
+from metrics import incr
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+# '' (plain CSV, the default), 'gzip' or 'zstd'; zstd needs the zstandard package
+COMPRESSION = os.environ.get('POPEYES_ARTIFACT_COMPRESSION', '').lower()
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+MIMETYPES = {'gzip': 'application/gzip', 'zstd': 'application/zstd'}
+
+_warned = False
+
+# ==============================================================================
+# HELPERS
+# ==============================================================================
+def codec():
+    """The configured codec ('gzip' / 'zstd'), or None for plain CSV."""
+    global _warned
+    if COMPRESSION not in EXTENSIONS:
+        return None
+    if COMPRESSION == 'zstd' and not HAS_ZSTD:
+        if not _warned:
+            print("⚠️ zstandard is not installed; compressing artifacts with gzip")
+            _warned = True
+        return 'gzip'
+    return COMPRESSION
+
+def enabled():
+    return codec() is not None
+
+def compressed_name(name, method=None):
+    return name + EXTENSIONS[method or codec()]
+
+def codec_of(name):
+    """Codec of an artifact name (by extension), or None for plain CSV."""
+    for method, extension in EXTENSIONS.items():
+        if name.endswith(extension):
+            return method
+    return None
+
+@contextlib.contextmanager
+def _compressor(fh, method):
+    if method == 'gzip':
+        with gzip.GzipFile(filename='', mode='wb', fileobj=fh, compresslevel=GZIP_LEVEL, mtime=0) as stream:
+            yield stream
+    else:
+        with zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(fh, closefd=False) as stream:
+            yield stream
+
+def spool_compressed(write, method=None):
+    """
+    Calls write(text_stream) and compresses what it writes into a temp file
+    as it goes. Returns the file's path; the caller removes the file.
+    """
+    method = method or codec()
+    fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=EXTENSIONS[method])
+    try:
+        with os.fdopen(fd, 'wb') as fh, _compressor(fh, method) as stream:
+            text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+            write(text)
+            text.detach()
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+def read_csv(fh, method, **kwargs):
+    """pd.read_csv over a (compressed) binary file object, decompressing as it parses."""
+    return pd.read_csv(fh, compression=method, **kwargs)
+
+# ==============================================================================
+# DRIVE
+# ==============================================================================
+def upload_compressed(folder_id, name, write):
+    """
+    Uploads what write(text_stream) writes as `name` + the codec's extension.
+    Returns (file_id, action, uploaded_name) like upsert_file.
+    """
+    method = codec()
+    path = spool_compressed(write, method)
+    try:
+        upload_name = compressed_name(name, method)
+        file_id, action = upsert_file(folder_id, upload_name, MIMETYPES[method], path=path)
+        incr('artifacts_compressed')
+        return file_id, action, upload_name
+    finally:
+        os.remove(path)
+
+def find_compressed(folder_id, name):
+    """`name` + any codec's extension in `folder_id`, or None."""
+    return find_first(folder_id, [name + extension for extension in EXTENSIONS.values()])
+
+def download_csv(artifact, **kwargs):
+    """Downloads a file found by find_compressed and parses it with read_csv."""
+    size = int(artifact.get('size') or 0) or None
+    with budgeted_download(artifact['id'], size=size) as fh:
+        return read_csv(fh, codec_of(artifact['name']), **kwargs)
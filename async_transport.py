@@ -0,0 +1,257 @@
+# async_transport.py - asyncio Drive/Sheets transport (optional, needs aiohttp)
+#
+# An alternative to the threaded googleapiclient path for workloads with many
+# small transfers: one event loop keeps hundreds of requests in flight over a
+# pooled aiohttp connector, instead of one thread plus one httplib2
+# connection per concurrent request.
+#
+#   async with AsyncGoogleClient() as client:
+#       await client.download_many(file_ids, handle)   # handle(file_id, body)
+#       rows = await client.values_get(sheet_id, "Sheet1!A2:F")
+#
+#   download_many(file_ids, handle)   # sync wrapper
+#
+# Rate limits, retry policy and per-endpoint stats are shared with
+# google_clients, so API_STATS / metrics summaries cover both transports,
+# and downloads reserve their bodies against drive_io.memory_budget.
+#
+# Bench-only for now: bench/transport_bench.py measures it against the
+# threaded path, and part1, part2 and payroll do not use it.
+import os
+import json
+import time
+import uuid
+import types
+import asyncio
+import urllib.parse
+
+from google_clients import (get_credentials, RATE_LIMITS, MAX_RETRIES, TokenBucket, is_retryable, is_rate_limited,
+                            backoff_delay, record_call)
+from drive_io import memory_budget, DEFAULT_DOWNLOAD_CHUNK
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+DRIVE_ROOT = "https://www.googleapis.com"
+SHEETS_ROOT = "https://sheets.googleapis.com"
+# Connections in the pool (and so the most requests in flight at once)
+MAX_CONNECTIONS = int(os.environ.get('POPEYES_ASYNC_CONNECTIONS', 100))
+# download_many keeps at most this many bodies in flight (and within the memory budget)
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('POPEYES_ASYNC_DOWNLOADS', 32))
+# Multipart uploads send the whole body in one request; bigger files belong
+# on drive_io's resumable path.
+MAX_MULTIPART_UPLOAD = 5 * 1024 * 1024
+
+# ==============================================================================
+# ERRORS & RATE LIMITING
+# ==============================================================================
+class AsyncHttpError(Exception):
+    """
+    Non-2xx response. Exposes `resp.status` and `content` like googleapiclient's
+    HttpError, so google_clients.is_retryable/error_status apply unchanged.
+    """
+
+    def __init__(self, status, content, url):
+        super().__init__(f"HTTP {status} for {url}: {content[:200]}")
+        self.resp = types.SimpleNamespace(status=status)
+        self.content = content
+
+async def acquire_token(bucket):
+    """google_clients.TokenBucket.acquire without blocking the event loop."""
+    while True:
+        wait = bucket.take()
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+
+# ==============================================================================
+# CLIENT
+# ==============================================================================
+class AsyncGoogleClient:
+    """
+    Async client for the Drive and Sheets calls the pipeline makes. Use as
+    `async with`; the aiohttp session and its connection pool live for the
+    duration of the block.
+
+    `credentials=None` uses the service account from google_clients; pass
+    `anonymous=True` (and local roots) to talk to a stand-in server.
+    """
+
+    def __init__(self, credentials=None, anonymous=False, drive_root=DRIVE_ROOT, sheets_root=SHEETS_ROOT,
+                 max_connections=MAX_CONNECTIONS, rate_limits=None, max_downloads=MAX_CONCURRENT_DOWNLOADS):
+        self.credentials = None if anonymous else (credentials or get_credentials())
+        self.drive_root = drive_root.rstrip('/')
+        self.sheets_root = sheets_root.rstrip('/')
+        self.max_connections = max_connections
+        self.max_downloads = max_downloads
+        self.buckets = {api: TokenBucket(rate, capacity)
+                        for api, (rate, capacity) in (rate_limits or RATE_LIMITS).items()}
+        self.session = None
+        self._refresh_lock = None
+
+    async def __aenter__(self):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError("async_transport needs aiohttp (pip install aiohttp)") from e
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections)
+        self.session = aiohttp.ClientSession(connector=connector)
+        self._refresh_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _auth_headers(self):
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            # google-auth refreshes synchronously; one refresh for all waiters
+            async with self._refresh_lock:
+                if not self.credentials.valid:
+                    from google.auth.transport.requests import Request
+
+                    await asyncio.get_running_loop().run_in_executor(None, self.credentials.refresh, Request())
+        return {'Authorization': f"Bearer {self.credentials.token}"}
+
+    async def request(self, method, url, endpoint, params=None, json_body=None, data=None, headers=None, raw=False):
+        """
+        Sends one API request under the rate limiter for the endpoint's API,
+        retrying like google_clients.call_with_retry. Returns parsed JSON, or
+        the body bytes when `raw`.
+        """
+        import aiohttp
+
+        bucket = self.buckets.get(endpoint.split('.')[0]) or self.buckets['drive']
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            await acquire_token(bucket)
+            try:
+                request_headers = {**(headers or {}), **await self._auth_headers()}
+                async with self.session.request(method, url, params=params, json=json_body, data=data,
+                                                headers=request_headers) as resp:
+                    body = await resp.read()
+                    if resp.status >= 300:
+                        raise AsyncHttpError(resp.status, body.decode('utf-8', 'replace'), url)
+            except Exception as e:
+                retryable = isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError)) or is_retryable(e)
+                if attempt >= MAX_RETRIES or not retryable:
+                    record_call(endpoint, time.perf_counter() - start, attempt, failed=True)
+                    raise
+                if is_rate_limited(e):
+                    bucket.drain()
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            record_call(endpoint, time.perf_counter() - start, attempt)
+            if raw:
+                return body
+            return json.loads(body) if body else {}
+
+    # ---------------------------------------------------------------- Drive
+    def _file_url(self, file_id=''):
+        return f"{self.drive_root}/drive/v3/files" + (f"/{urllib.parse.quote(file_id)}" if file_id else '')
+
+    async def download(self, file_id):
+        return await self.request('GET', self._file_url(file_id), 'drive.files.get_media',
+                                  params={'alt': 'media', 'supportsAllDrives': 'true'}, raw=True)
+
+    async def download_range(self, file_id, start, end):
+        return await self.request('GET', self._file_url(file_id), 'drive.files.get_media',
+                                  params={'alt': 'media', 'supportsAllDrives': 'true'},
+                                  headers={'Range': f"bytes={start}-{end}"}, raw=True)
+
+    async def download_many(self, file_ids, handle, sizes=None):
+        """
+        Calls handle(file_id, body) as each download completes. At most
+        `max_downloads` run at once, each holding its size (from `sizes`,
+        {file_id: bytes}) of memory_budget until handle returns.
+        """
+        sizes = sizes or {}
+        slots = asyncio.Semaphore(self.max_downloads)
+        loop = asyncio.get_running_loop()
+
+        async def fetch(file_id):
+            async with slots:
+                cost = int(sizes.get(file_id) or DEFAULT_DOWNLOAD_CHUNK)
+                held = memory_budget.try_acquire(cost)
+                if held is None:
+                    # Other threads hold the budget: wait for it off the event loop
+                    held = await loop.run_in_executor(None, memory_budget.acquire, cost)
+                try:
+                    handle(file_id, await self.download(file_id))
+                finally:
+                    memory_budget.release(held)
+
+        await asyncio.gather(*(fetch(file_id) for file_id in file_ids))
+
+    async def get_metadata(self, file_id, fields="id, name, size, md5Checksum"):
+        return await self.request('GET', self._file_url(file_id), 'drive.files.get',
+                                  params={'fields': fields, 'supportsAllDrives': 'true'})
+
+    async def list_files(self, query, fields="id, name"):
+        """All files matching `query`, following nextPageToken."""
+        files = []
+        params = {'q': query, 'fields': f"nextPageToken, files({fields})",
+                  'includeItemsFromAllDrives': 'true', 'supportsAllDrives': 'true'}
+        while True:
+            result = await self.request('GET', self._file_url(), 'drive.files.list', params=params)
+            files.extend(result.get('files', []))
+            if not result.get('nextPageToken'):
+                return files
+            params['pageToken'] = result['nextPageToken']
+
+    async def upload(self, name, mimetype, data, folder_id=None, file_id=None):
+        """
+        Creates `name` in `folder_id`, or replaces the content of `file_id` in
+        place, with a single multipart request. Returns the file resource.
+        """
+        if len(data) > MAX_MULTIPART_UPLOAD:
+            raise ValueError("payload too large for a multipart upload; use drive_io.upsert_file")
+        boundary = uuid.uuid4().hex
+        metadata = {} if file_id else {'name': name, 'parents': [folder_id]}
+        body = (
+            f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(metadata)}\r\n"
+            f"--{boundary}\r\nContent-Type: {mimetype}\r\n\r\n"
+        ).encode('utf-8') + data + f"\r\n--{boundary}--".encode('utf-8')
+        url = f"{self.drive_root}/upload/drive/v3/files" + (f"/{urllib.parse.quote(file_id)}" if file_id else '')
+        return await self.request('PATCH' if file_id else 'POST', url,
+                                  'drive.files.update' if file_id else 'drive.files.create',
+                                  params={'uploadType': 'multipart', 'supportsAllDrives': 'true', 'fields': 'id'},
+                                  data=body, headers={'Content-Type': f"multipart/related; boundary={boundary}"})
+
+    # --------------------------------------------------------------- Sheets
+    def _values_url(self, sheet_id, suffix):
+        return f"{self.sheets_root}/v4/spreadsheets/{sheet_id}/values{suffix}"
+
+    async def values_get(self, sheet_id, range_name):
+        result = await self.request('GET', self._values_url(sheet_id, f"/{urllib.parse.quote(range_name)}"),
+                                    'sheets.spreadsheets.values.get')
+        return result.get('values', [])
+
+    async def values_batch_get(self, sheet_id, ranges):
+        result = await self.request('GET', self._values_url(sheet_id, ':batchGet'),
+                                    'sheets.spreadsheets.values.batchGet', params=[('ranges', r) for r in ranges])
+        return [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+
+    async def values_batch_update(self, sheet_id, data):
+        return await self.request('POST', self._values_url(sheet_id, ':batchUpdate'),
+                                  'sheets.spreadsheets.values.batchUpdate',
+                                  json_body={'valueInputOption': 'RAW', 'data': data})
+
+    async def values_append(self, sheet_id, range_name, values):
+        return await self.request('POST', self._values_url(sheet_id, f"/{urllib.parse.quote(range_name)}:append"),
+                                  'sheets.spreadsheets.values.append',
+                                  params={'valueInputOption': 'RAW'}, json_body={'values': values})
+
+# ==============================================================================
+# SYNC WRAPPERS
+# ==============================================================================
+def download_many(file_ids, handle, sizes=None, **client_kwargs):
+    """AsyncGoogleClient.download_many from synchronous code."""
+    async def run():
+        async with AsyncGoogleClient(**client_kwargs) as client:
+            await client.download_many(list(file_ids), handle, sizes)
+    asyncio.run(run())
@@ -0,0 +1,204 @@
+# backfill.py - Rebuild part1 and part2 outputs from the source sales folder
+#
+#   python backfill.py --stores 1234,5678     # those stores
+#   python backfill.py --all --workers 4      # every store found, 4 at a time
+#   python backfill.py --all --list           # only show what would be processed
+#   python backfill.py --stores 1234 --part1-only
+#
+# Source exports are listed straight from SALES_ROOT_FOLDER_ID (the whole
+# folder tree), not from the tracking sheet, and the tracking sheet is not
+# written. Per store:
+#   1. its fingerprints and order history are reset, then every export is run
+#      through part1 in chronological (file name) order, one month per batch,
+#      so dedup sees the store's full history in order;
+#   2. part2 rebuilds the monthly workbooks from scratch (each month is
+#      rewritten from the converted outputs part1 just wrote under
+#      CONVERTED_FOLDER_ID, not appended to) and the summary. A batch of
+#      duplicate or empty exports only has nothing to add and is checkpointed.
+# Progress is checkpointed after every batch in the state dir; re-running the
+# same command resumes. Use --restart to discard the checkpoint.
+#
+# Pause the cron/worker for these stores while a backfill runs: rows it later
+# consolidates from the tracking sheet would be appended to the rebuilt months.
+import time
+import argparse
+import itertools
+import threading
+import concurrent.futures
+
+import part1
+import part2
+import rollup
+from dedup import reset_history
+from drive_io import walk_folder, get_or_create_folder
+from fingerprints import forget_store, save_fingerprints
+from google_clients import report_client_stats, report_api_stats
+from metrics import timer, incr, write_summary
+from scheduler import Schedule, start_window
+from state import load_state, save_state
+from tracking import in_shard
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+CHECKPOINT_NAME = "backfill.json"
+DEFAULT_WORKERS = 4
+# Files per part1/part2 call, within one month
+MAX_BATCH_FILES = 40
+SOURCE_EXTENSIONS = ('.csv',)
+
+_checkpoint_lock = threading.Lock()
+
+# ==============================================================================
+# CHECKPOINT
+# ==============================================================================
+def load_checkpoint():
+    return load_state(CHECKPOINT_NAME, {'stores': {}})
+
+def update_checkpoint(checkpoint, store, update):
+    """Applies `update(entry)` to the store's entry and saves, under one lock."""
+    with _checkpoint_lock:
+        entry = checkpoint['stores'].setdefault(store, {'part1_done': [], 'rebuilt_months': {}, 'part2_done': []})
+        update(entry)
+        save_state(CHECKPOINT_NAME, checkpoint)
+
+# ==============================================================================
+# DISCOVERY
+# ==============================================================================
+def list_source_files(stores=None):
+    """{store: [(folder_name, file)]} for every source export, sorted by file name."""
+    by_store = {}
+    with timer('backfill.list'):
+        for folder_name, item in walk_folder(part1.SALES_ROOT_FOLDER_ID):
+            if not item['name'].lower().endswith(SOURCE_EXTENSIONS):
+                continue
+            store = part1.get_store_number(item['name'])
+            if store == "Unknown" or (stores and store not in stores) or not in_shard(store):
+                continue
+            by_store.setdefault(store, []).append((folder_name, item))
+    for files in by_store.values():
+        files.sort(key=lambda f: f[1]['name'])
+    return by_store
+
+def month_batches(files, key=lambda f: f[1]['name']):
+    """Consecutive files of the same month, at most MAX_BATCH_FILES per batch."""
+    for _, month_files in itertools.groupby(files, key=lambda f: part1.get_month_folder_name(key(f))):
+        month_files = list(month_files)
+        for start in range(0, len(month_files), MAX_BATCH_FILES):
+            yield month_files[start:start + MAX_BATCH_FILES]
+
+# ==============================================================================
+# PER STORE
+# ==============================================================================
+def backfill_part1(store, files, checkpoint):
+    entry = checkpoint['stores'].get(store)
+    done = set(entry['part1_done']) if entry else set()
+    if not done:
+        # Fresh start: dedup and the pre-check rebuild the store's history as we go
+        forget_store(store)
+        reset_history(store)
+        save_fingerprints()
+
+    pending = [f for f in files if f[1]['id'] not in done]
+    print(f"🧱 Store {store}: {len(pending)} of {len(files)} export(s) to process")
+    for batch in month_batches(pending):
+        # The row_num slot carries the file ID; nothing is marked in the tracking sheet
+        items = [(f['id'], f['id'], f['name']) for _, f in batch]
+        with timer('backfill.part1'):
+            processed = part1.process_store_batch(store, items, mark_done=False)
+        incr('backfill_files', len(processed))
+        update_checkpoint(checkpoint, store, lambda e: e['part1_done'].extend(processed))
+        missed = len(items) - len(processed)
+        if missed:
+            print(f"⚠️ Store {store}: {missed} export(s) not processed (download failed); re-run to retry")
+
+def backfill_part2(store, files, checkpoint):
+    entry = checkpoint['stores'].get(store, {'part1_done': [], 'rebuilt_months': {}, 'part2_done': []})
+    ready = set(entry['part1_done']) - set(entry['part2_done'])
+    # part2 groups by the source file's parent folder, as its main() does
+    groups = {}
+    for folder_name, f in files:
+        if f['id'] in ready:
+            groups.setdefault(folder_name, []).append((f['id'], f['name']))
+
+    for store_name, group in groups.items():
+        dest_id = get_or_create_folder(part2.DEST_ROOT_ID, store_name)
+        rebuilt = set(entry['rebuilt_months'].get(store_name, []))
+        for batch in month_batches(group, key=lambda f: f[1]):
+            with timer('backfill.part2'):
+                ok = part2.process_store_batch(store_name, batch, dest_id, rebuilt_months=rebuilt)
+            if not ok:
+                print(f"❌ Store {store_name}: consolidation failed; re-run to resume")
+                return False
+
+            def record(e):
+                e['rebuilt_months'][store_name] = sorted(rebuilt, key=str)
+                e['part2_done'].extend(file_id for file_id, _ in batch)
+            update_checkpoint(checkpoint, store, record)
+    return True
+
+def backfill_store(store, files, checkpoint, plan, part1_only=False):
+    start = time.perf_counter()
+    try:
+        with plan.running(store):
+            backfill_part1(store, files, checkpoint)
+            if not part1_only and not backfill_part2(store, files, checkpoint):
+                return False
+            rollup.save()
+        print(f"✅ Store {store} done in {time.perf_counter() - start:.0f}s")
+        return True
+    except Exception as e:
+        # One failing store must not stop the others
+        print(f"❌ Store {store} failed: {e}")
+        return False
+
+# ==============================================================================
+# MAIN
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Re-process stores' history from the source sales folder.")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--stores', help="comma-separated store numbers")
+    scope.add_argument('--all', action='store_true', help="every store found in the source folder")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="stores processed in parallel")
+    parser.add_argument('--part1-only', action='store_true', help="convert only; do not rebuild part2 workbooks")
+    parser.add_argument('--list', action='store_true', help="list the stores and file counts, then exit")
+    parser.add_argument('--restart', action='store_true', help="ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    stores = {s.strip() for s in args.stores.split(',') if s.strip()} if args.stores else None
+    by_store = list_source_files(stores)
+    print(f"📦 {sum(len(f) for f in by_store.values())} export(s) across {len(by_store)} store(s)")
+    if args.list:
+        for store, files in sorted(by_store.items()):
+            print(f"  {store}: {len(files)} file(s), {files[0][1]['name']} .. {files[-1][1]['name']}")
+        return
+
+    checkpoint = {'stores': {}} if args.restart else load_checkpoint()
+    if args.restart:
+        save_state(CHECKPOINT_NAME, checkpoint)
+
+    # Longest stores first (by export size and past backfill times), so the
+    # workers finish close together; a backfill has no time budget
+    start_window(0)
+    plan = Schedule('backfill')
+    order = plan.ordered({store: (files, sum(int(f.get('size') or 0) for _, f in files))
+                          for store, files in by_store.items()})
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(backfill_store, store, by_store[store], checkpoint, plan, args.part1_only): store
+                   for store in order if plan.admit(store)}
+        failed = [futures[f] for f in concurrent.futures.as_completed(futures) if not f.result()]
+    plan.finish()
+    rollup.save()
+
+    part1.flush_logs_to_sheet()
+    report_client_stats()
+    report_api_stats()
+    write_summary('backfill')
+    if failed:
+        print(f"🏁 Backfill finished with failures: {', '.join(sorted(failed))}")
+    else:
+        print("🏁 Backfill complete.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench/artifact_bench.py - Plain vs. compressed intermediate CSV artifacts
+#
+#   python bench/artifact_bench.py                    # 1x, 10x, 100x at 50 Mbit/s
+#   python bench/artifact_bench.py --scales 10 --mbps 20
+#
+# For part1's converted CSV and payroll's _Formatted CSV, per codec: bytes
+# stored (= bytes uploaded by the writer and downloaded by the reader), time
+# to produce the upload body, time to parse it back as part2 does, and the
+# estimated end-to-end time with both transfers at --mbps. "plain" is the
+# current path (encoded CSV bytes, pd.read_csv on the buffer).
+import io
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+import synthetic
+import payroll
+import artifacts
+
+BASE_ORDERS = 200
+BASE_EMPLOYEES = 20
+
+# ==============================================================================
+# INPUTS
+# ==============================================================================
+def converted_writer(scale):
+    text = synthetic.converted_csv(orders=BASE_ORDERS * scale)
+    return lambda out: out.write(text)
+
+def formatted_writer(scale):
+    df, store_no = payroll.parse_payroll_content(synthetic.payroll_report(employees=BASE_EMPLOYEES * scale), 2025)
+    formatted = payroll.prepare_formatted_df(df, store_no)
+    return lambda out: formatted.to_csv(out, index=False)
+
+ARTIFACTS = [
+    ('converted_csv', converted_writer),
+    ('payroll_formatted', formatted_writer),
+]
+
+# ==============================================================================
+# MEASUREMENT
+# ==============================================================================
+def best_of(repeat, fn):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def measure_plain(write, repeat):
+    def produce():
+        buffer = io.StringIO()
+        write(buffer)
+        return buffer.getvalue().encode('utf-8')
+    write_s, data = best_of(repeat, produce)
+    read_s, _ = best_of(repeat, lambda: pd.read_csv(io.BytesIO(data), dtype=str, low_memory=False))
+    return len(data), write_s, read_s
+
+def measure_codec(write, method, repeat):
+    paths = []
+    def produce():
+        paths.append(artifacts.spool_compressed(write, method))
+        return paths[-1]
+    try:
+        write_s, path = best_of(repeat, produce)
+        def parse():
+            with open(path, 'rb') as fh:
+                return artifacts.read_csv(fh, method, dtype=str, low_memory=False)
+        read_s, _ = best_of(repeat, parse)
+        return os.path.getsize(path), write_s, read_s
+    finally:
+        for path in paths:
+            os.remove(path)
+
+# ==============================================================================
+# MAIN
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', default='1,10,100', help="comma-separated size multipliers")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--mbps', type=float, default=50.0, help="link speed for the transfer estimate (Mbit/s)")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    codecs = ['gzip'] + (['zstd'] if artifacts.HAS_ZSTD else [])
+    bytes_per_second = args.mbps * 1e6 / 8
+
+    print(f"{'artifact':18} {'scale':>5} {'codec':6} {'bytes':>11} {'ratio':>6} {'write':>9} {'read':>9} {'total@link':>11}")
+    for name, build in ARTIFACTS:
+        for scale in scales:
+            write = build(scale)
+            plain_bytes = None
+            rows = [('plain', measure_plain(write, args.repeat))]
+            rows += [(method, measure_codec(write, method, args.repeat)) for method in codecs]
+            for method, (size, write_s, read_s) in rows:
+                plain_bytes = plain_bytes or size
+                # Written once, uploaded once, downloaded once, parsed once
+                total = write_s + read_s + 2 * size / bytes_per_second
+                print(f"{name:18} {scale:>4}x {method:6} {size:>11,} {plain_bytes / size:>5.1f}x "
+                      f"{write_s * 1000:>7.1f}ms {read_s * 1000:>7.1f}ms {total * 1000:>9.1f}ms")
+    if not artifacts.HAS_ZSTD:
+        print("(zstd skipped: zstandard not installed)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# bench/pipeline_bench.py - Time and peak memory of the pure processing functions
+#
+#   python bench/pipeline_bench.py                          # 1x, 10x, 100x
+#   python bench/pipeline_bench.py --scales 1,10 --only payroll
+#   python bench/pipeline_bench.py --json results.json      # save a baseline
+#   python bench/pipeline_bench.py --baseline results.json  # exit 1 on regressions
+#
+# Inputs come from bench/synthetic.py. 1x is one store-day (200 orders, 5
+# exports with 20% overlap for dedup) or one store's pay period (20
+# employees). Time is the best of --repeat runs; peak memory is measured in
+# a separate run under tracemalloc, so tracing does not skew the timings.
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Caches the code under test persists (e.g. part1's schema cache) stay out of .state
+os.environ.setdefault('POPEYES_STATE_DIR', tempfile.mkdtemp(prefix='popeyes-bench-'))
+
+import pandas as pd
+
+import synthetic
+import part1
+import part2
+import payroll
+import sidecar
+import dedup
+
+BASE_ORDERS = 200
+BASE_FILES = 5
+BASE_EMPLOYEES = 20
+PAY_PERIOD_START = datetime.datetime(2025, 1, 6)
+
+# ==============================================================================
+# CASES
+# ==============================================================================
+# Each case is (name, build(scale) -> inputs, run(inputs)). build() is not
+# timed and is called again before every run, so run() may mutate its inputs.
+def _parsed_series(scale):
+    series = synthetic.pos_series(files=BASE_FILES, orders=BASE_ORDERS * scale, overlap=0.2)
+    return [(name, part1.parse_pos_csv(content)[1]) for name, content in series]
+
+def _dedup(parsed):
+    seen_orders = {}
+    for name, blocks in parsed:
+        part1.drop_duplicate_blocks(blocks, name, seen_orders)
+
+def _converted_df(scale):
+    return pd.read_csv(io.StringIO(synthetic.converted_csv(orders=BASE_ORDERS * scale)), dtype=str, low_memory=False)
+
+def _dated_df(scale):
+    df = part2.add_date_columns(_converted_df(scale))
+    return df, part2.add_line_totals(df)
+
+# A week of one store with every pivot category on the menu, so the wide
+# pivots are as sparse as a real store's
+def _pivot_inputs(scale):
+    menu = synthetic.menu_from_codes(set().union(*part2.pivot_categories().values()))
+    df = pd.concat([pd.read_csv(io.StringIO(synthetic.converted_csv(day=PAY_PERIOD_START.date() + datetime.timedelta(days=d),
+                                                                    orders=BASE_ORDERS * scale, seed=d, menu=menu)),
+                                dtype=str, low_memory=False) for d in range(7)], ignore_index=True)
+    df = part2.add_date_columns(df)
+    return df, part2.add_line_totals(df)
+
+def _write_pivots(pivots):
+    with pd.ExcelWriter(io.BytesIO(), engine='openpyxl') as writer:
+        for sheet_name, table in pivots:
+            table.to_excel(writer, sheet_name=sheet_name, index=not isinstance(table.index, pd.RangeIndex))
+
+def _pivots_wide(inputs):
+    _write_pivots(part2.build_pivot_tables(inputs[0], *inputs[1]))
+
+def _pivots_long(inputs):
+    split_0_col, split_1_col, split_5_col, split_35_col = inputs[1]
+    long_df = part2.build_long_table(inputs[0], split_0_col, split_1_col, split_5_col, split_35_col)
+    _write_pivots(part2.build_long_pivot_tables(long_df, split_0_col, split_1_col, split_5_col))
+
+def _payroll_df(scale):
+    return payroll.parse_payroll_content(synthetic.payroll_report(employees=BASE_EMPLOYEES * scale), 2025)
+
+CASES = [
+    ('part1.parse_pos_csv',
+     lambda scale: synthetic.pos_export(orders=BASE_ORDERS * scale),
+     part1.parse_pos_csv),
+    ('part1.drop_duplicate_blocks',
+     _parsed_series,
+     _dedup),
+    # Same batch through the packed-key engine part1 uses
+    ('dedup.dedup_files',
+     _parsed_series,
+     dedup.dedup_files),
+    # Warm schema cache after the first run (same store on every call)
+    ('part1.convert_to_final_format',
+     lambda scale: synthetic.pos_export(orders=BASE_ORDERS * scale),
+     lambda content: part1.convert_to_final_format(content, '12345_2025-01-06.csv')),
+    ('part2.read_csv',
+     lambda scale: synthetic.converted_csv(orders=BASE_ORDERS * scale).encode('utf-8'),
+     lambda data: pd.read_csv(io.BytesIO(data), dtype=str, low_memory=False)),
+    ('part2.add_date_columns',
+     _converted_df,
+     part2.add_date_columns),
+    # Same end state as read_csv + add_date_columns, from part1's Parquet sidecar
+    ('part2.sidecar_to_dated_df',
+     lambda scale: sidecar.to_parquet_bytes(synthetic.converted_csv(orders=BASE_ORDERS * scale)),
+     lambda data: part2.add_date_columns(pd.read_parquet(io.BytesIO(data)))),
+    ('part2.build_pivot_tables',
+     _dated_df,
+     lambda inputs: part2.build_pivot_tables(inputs[0], *inputs[1])),
+    # PIVOT_LAYOUT comparison: build + write the category sheets, wide vs. long
+    ('part2.pivots_write[wide]',
+     _pivot_inputs,
+     _pivots_wide),
+    ('part2.pivots_write[long]',
+     _pivot_inputs,
+     _pivots_long),
+    ('payroll.parse_payroll_content',
+     lambda scale: synthetic.payroll_report(employees=BASE_EMPLOYEES * scale),
+     lambda content: payroll.parse_payroll_content(content, 2025)),
+    ('payroll.parse_timeclock_content',
+     lambda scale: synthetic.timeclock_report(employees=BASE_EMPLOYEES * scale),
+     payroll.parse_timeclock_content),
+    ('payroll.prepare_formatted_df',
+     _payroll_df,
+     lambda parsed: payroll.prepare_formatted_df(*parsed)),
+    ('payroll.prepare_pivot_df',
+     _payroll_df,
+     lambda parsed: payroll.prepare_pivot_df(parsed[0], parsed[1], PAY_PERIOD_START)),
+]
+
+# ==============================================================================
+# MEASUREMENT
+# ==============================================================================
+def measure(build, run, scale, repeat):
+    """Returns (best seconds, peak traced bytes)."""
+    best = None
+    for _ in range(repeat):
+        inputs = build(scale)
+        start = time.perf_counter()
+        run(inputs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    inputs = build(scale)
+    tracemalloc.start()
+    try:
+        run(inputs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def compare(results, baseline, tolerance):
+    """Returns the keys that got slower than baseline by more than `tolerance`."""
+    regressions = []
+    for key, current in results.items():
+        before = baseline.get(key)
+        if before and current['seconds'] > before['seconds'] * (1 + tolerance):
+            regressions.append((key, before['seconds'], current['seconds']))
+    return regressions
+
+# ==============================================================================
+# MAIN
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', default='1,10,100', help="comma-separated size multipliers")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', default='', help="run cases whose name contains this text")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="compare against a previous --json file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown vs. baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    results = {}
+
+    print(f"{'case':36} {'scale':>6} {'time':>10} {'peak mem':>10}")
+    for name, build, run in CASES:
+        if args.only and args.only not in name:
+            continue
+        if name.startswith('part2.sidecar') and not sidecar.HAS_PARQUET:
+            print(f"{name:36} skipped (pyarrow not installed)")
+            continue
+        for scale in scales:
+            seconds, peak = measure(build, run, scale, args.repeat)
+            results[f"{name}@{scale}x"] = {'seconds': round(seconds, 6), 'peak_bytes': peak}
+            print(f"{name:36} {scale:>5}x {seconds * 1000:>8.1f}ms {peak / 2**20:>8.1f}MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for key, before, after in regressions:
+            print(f"⚠️ Regression: {key} {before * 1000:.1f}ms -> {after * 1000:.1f}ms")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
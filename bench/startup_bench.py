@@ -0,0 +1,54 @@
+# bench/startup_bench.py - Startup cost of the "nothing to do" path
+#
+#   python bench/startup_bench.py [--repeat 5]
+#
+# Each measurement runs in a fresh interpreter so nothing is cached in-process.
+# The live check (one real pending-work probe) only runs when
+# SERVICE_ACCOUNT_KEY is set.
+import os
+import sys
+import time
+import argparse
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ('light entry (worker + tracking)', "import worker"),
+    ('stage modules (part1 + part2 + payroll)', "import part1, part2, payroll"),
+]
+
+def time_snippet(code, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        samples.append(elapsed)
+    return samples, None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = list(CASES)
+    if 'SERVICE_ACCOUNT_KEY' in os.environ:
+        cases.append((
+            'live pending check, all stages',
+            "import tracking; [tracking.has_pending_work(s) for s in tracking.STAGE_TRACKING]"
+        ))
+
+    print(f"{'case':45} {'median':>10} {'min':>10}")
+    for name, code in cases:
+        samples, error = time_snippet(code, args.repeat)
+        if samples is None:
+            print(f"{name:45} {'skipped':>10}   ({error})")
+            continue
+        print(f"{name:45} {statistics.median(samples) * 1000:>8.0f}ms {min(samples) * 1000:>8.0f}ms")
+
+if __name__ == "__main__":
+    main()
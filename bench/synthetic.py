@@ -0,0 +1,159 @@
+# bench/synthetic.py - Synthetic inputs shaped like the real exports
+#
+# Every generator is deterministic for a given seed, so benchmark runs are
+# comparable across commits.
+#
+#   pos_export(...)          raw POS export, as part1.parse_pos_csv reads it
+#   pos_series(...)          several exports for one store with overlapping orders
+#   converted_csv(...)       part1 output, as part2 reads it
+#   menu_from_codes(...)     a larger MENU, e.g. every code part2 pivots on
+#   payroll_report(...)      "Previous Payroll Report" (payroll.parse_payroll_content)
+#   timeclock_report(...)    "Timeclock Report" (payroll.parse_timeclock_content)
+import random
+import datetime
+
+# (item code, name, price). Codes come from part2's pivot categories so the
+# pivots built from generated data are not empty.
+MENU = [
+    ('10000000', '2pc Chicken', 5.99),
+    ('30004001', 'Biscuit', 1.29),
+    ('30004002', 'Cajun Fries', 2.79),
+    ('30009112', 'Chicken Sandwich', 4.49),
+    ('30004025', 'Delivery Combo', 9.99),
+    ('20000002', 'Fountain Drink', 1.99),
+    ('20000030', 'Sweet Tea', 1.79),
+    ('40001001', 'Family Meal', 24.99),
+    ('7019910', 'Donation', 1.00),
+]
+FIRST_NAMES = ['James', 'Maria', 'Robert', 'Linda', 'David', 'Aisha', 'Carlos', 'Mei', 'Tyrone', 'Priya']
+LAST_NAMES = ['Smith', 'Garcia', 'Johnson', 'Nguyen', 'Brown', 'Patel', 'Lee', 'Davis', 'Lopez', 'Khan']
+
+def _pos_timestamp(dt):
+    # e.g. "Mon Jan 6, 2025 10:31:22 AM"
+    return f"{dt.strftime('%a %b')} {dt.day}, {dt.strftime('%Y %I:%M:%S %p')}"
+
+def menu_from_codes(codes, seed=0):
+    """A MENU-shaped list for `codes` (e.g. every code part2 pivots on), with made-up names and prices."""
+    rng = random.Random(seed)
+    return [(code.rstrip(','), f"Item {code.rstrip(',')}", round(rng.uniform(0.99, 19.99), 2)) for code in sorted(set(codes))]
+
+def _orders(rng, day, count, first_order, menu=MENU):
+    """[(timestamp, order_num, [(code, name, qty, price)])] spread over the business day."""
+    start = datetime.datetime.combine(day, datetime.time(10, 30))
+    step = (14 * 3600) / max(count, 1)
+    orders = []
+    for i in range(count):
+        dt = start + datetime.timedelta(seconds=int(i * step) + rng.randint(0, max(int(step) - 1, 0)))
+        items = [(code, name, rng.randint(1, 3), price) for code, name, price in rng.sample(menu, rng.randint(1, 4))]
+        orders.append((_pos_timestamp(dt), str(first_order + i), items))
+    return orders
+
+def _render_pos(store, day, orders, rng, log_on_every):
+    lines = [
+        f'"Popeyes #{store} Detail Report",,,\n',
+        # Report-start stamp; part1 gives it a Date_time like any order row
+        f'"{_pos_timestamp(datetime.datetime.combine(day, datetime.time(0)))}  ",Report Start,,\n',
+    ]
+    for i, (timestamp, order_num, items) in enumerate(orders):
+        if log_on_every and i % log_on_every == 0:
+            lines.append(f'"{timestamp}  ",LOG ON,Emp {rng.randint(100, 999)},\n')
+        lines.append(f'"{timestamp}  ",Order #:,{order_num},Register {rng.randint(1, 3)}\n')
+        for code, name, qty, price in items:
+            lines.append(f'{code},{name},{qty},{price:.2f}\n')
+    return "".join(lines)
+
+def pos_file_name(store, day):
+    # Same shape as the uploads: store number first, ISO date inside
+    return f"{store}_{day.isoformat()}.csv"
+
+def pos_export(store='12345', day=datetime.date(2025, 1, 6), orders=200, log_on_every=25, seed=0):
+    """One raw POS export with `orders` order blocks and a LOG ON block every `log_on_every` orders."""
+    rng = random.Random(seed)
+    return _render_pos(store, day, _orders(rng, day, orders, 1000), rng, log_on_every)
+
+def pos_series(store='12345', files=5, orders=200, overlap=0.2, log_on_every=25, seed=0,
+               start=datetime.date(2025, 1, 6)):
+    """
+    [(file_name, content)] for consecutive days. Each export after the first
+    repeats the last `overlap` fraction of the previous export's orders
+    (same timestamp and order number), like a register re-sending a window.
+    """
+    rng = random.Random(seed)
+    series = []
+    previous = []
+    next_order = 1000
+    for n in range(files):
+        day = start + datetime.timedelta(days=n)
+        repeated = previous[len(previous) - int(len(previous) * overlap):] if previous else []
+        fresh = _orders(rng, day, orders - len(repeated), next_order)
+        next_order += len(fresh)
+        orders_in_file = repeated + fresh
+        series.append((pos_file_name(store, day), _render_pos(store, day, orders_in_file, rng, log_on_every)))
+        previous = orders_in_file
+    return series
+
+def converted_csv(store='12345', day=datetime.date(2025, 1, 6), orders=200, seed=0, menu=MENU):
+    """A part1-converted CSV (Date_time plus the POPEYES # <store>_split_* columns)."""
+    rng = random.Random(seed)
+    prefix = f"POPEYES # {store}"
+    lines = [f"Date_time,{prefix}_split_0,{prefix}_split_1,{prefix}_split_3,{prefix}_split_5\n"]
+    for timestamp, order_num, items in _orders(rng, day, orders, 1000, menu):
+        stamp = f'"{timestamp},"'
+        lines.append(f'{stamp},{stamp},Order #:,{order_num},Register {rng.randint(1, 3)}\n')
+        for code, name, qty, price in items:
+            lines.append(f'{stamp},"{code},",{name},{qty},{price:.2f}\n')
+    return "".join(lines)
+
+def _employees(rng, count):
+    return [(str(1000 + i), rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)) for i in range(count)]
+
+def _shifts(rng, start, employees):
+    """Yields (emp, date, clock_in, hours) for a two-week pay period."""
+    for emp in employees:
+        for offset in range(14):
+            if rng.random() < 0.3:
+                continue
+            clock_in = datetime.datetime.combine(start + datetime.timedelta(days=offset),
+                                                 datetime.time(rng.randint(6, 14), rng.choice([0, 15, 30, 45])))
+            yield emp, clock_in, rng.randint(16, 40) / 4
+
+def payroll_report(store='12345', employees=20, start=datetime.date(2025, 1, 6), seed=0):
+    """A 'Previous Payroll Report' for one store and a two-week period starting on `start`."""
+    rng = random.Random(seed)
+    staff = _employees(rng, employees)
+    end = start + datetime.timedelta(days=13)
+    lines = [
+        '"Previous Payroll Report"\n',
+        f'"Period: {start.strftime("%m/%d/%Y")} - {end.strftime("%m/%d/%Y")}"\n',
+        f'"Popeye\'s #{store}"\n',
+    ]
+    weekly = {}
+    for (emp_id, first, last), clock_in, hours in _shifts(rng, start, staff):
+        hhmm = f"{int(hours)}:{int(round((hours % 1) * 60)):02d}"
+        fields = [clock_in.strftime('%a'), clock_in.strftime('%m-%d'), hhmm, f"{hours:.2f}", "", "",
+                  f"{emp_id}--", "", f"{first}--", f"{last}--", ""]
+        lines.append('"' + '","'.join(fields) + '"\n')
+        week = (clock_in.date() - start).days // 7
+        weekly[(emp_id, week)] = weekly.get((emp_id, week), 0) + hours
+    for emp_id, _, _ in staff:
+        overtime = sum(max(0, weekly.get((emp_id, w), 0) - 40) for w in (0, 1))
+        if overtime:
+            lines.append(f'"{emp_id} {overtime:.2f}"\n')
+    return "".join(lines)
+
+def timeclock_report(store='12345', employees=20, start=datetime.date(2025, 1, 6), seed=0):
+    """A 'Timeclock Report' for one store and a two-week period starting on `start`."""
+    rng = random.Random(seed)
+    staff = _employees(rng, employees)
+    lines = ['Timeclock Report,,\n', f'"Popeye\'s #{store}",,\n']
+    shifts = {}
+    for emp, clock_in, hours in _shifts(rng, start, staff):
+        shifts.setdefault(emp, []).append((clock_in, hours))
+    for emp_id, first, last in staff:
+        lines.append(f'{emp_id},{first},{last}\n')
+        for clock_in, hours in shifts.get((emp_id, first, last), []):
+            clock_out = clock_in + datetime.timedelta(hours=hours)
+            duration = f"{int(hours)}:{int(round((hours % 1) * 60)):02d}"
+            lines.append(f',*I,{clock_in.strftime("%a")},{clock_in.strftime("%m/%d/%Y %H:%M")},'
+                         f'{clock_out.strftime("%H:%M")},Clockset,{duration}\n')
+    return "".join(lines)
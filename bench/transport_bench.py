@@ -0,0 +1,119 @@
+# bench/transport_bench.py - Threaded googleapiclient vs. asyncio transport
+#
+#   python bench/transport_bench.py [--files 300] [--size-kb 256] [--latency-ms 50]
+#
+# Both paths download the same files from a local stand-in for the Drive API
+# that adds a fixed per-request latency (a stand-in for network round trips).
+# The threaded path is the real one (drive_io.download_bytes on a thread
+# pool, per-thread clients from google_clients) with the discovery document
+# pointed at the local server; the async path is async_transport.
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+import concurrent.futures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The local server has no quota; keep the token buckets out of the comparison
+os.environ.setdefault('POPEYES_RATE_DRIVE', '1000000')
+
+import google_clients
+import drive_io
+import async_transport
+
+# ==============================================================================
+# STAND-IN SERVER
+# ==============================================================================
+# Runs in its own process (aiohttp.web), so serving does not compete with the
+# client under test for the GIL.
+def serve(port_queue, size, latency):
+    import asyncio
+    from aiohttp import web
+
+    payload = os.urandom(size)
+
+    async def files(request):
+        await asyncio.sleep(latency)
+        if 'file_id' in request.match_info and request.query.get('alt') == 'media':
+            return web.Response(body=payload, content_type='application/octet-stream')
+        return web.json_response({'files': [{'id': 'f0', 'name': 'f0.csv'}]})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/drive/v3/files', files)
+        app.router.add_get('/drive/v3/files/{file_id}', files)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0, backlog=2048)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+def start_server(size, latency):
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(port_queue, size, latency), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+def point_threaded_path_at(base_url):
+    """Makes google_clients build Drive clients against the stand-in, without credentials."""
+    from google.auth.credentials import AnonymousCredentials
+
+    doc = dict(google_clients._get_discovery_doc('drive', 'v3'))
+    doc['rootUrl'] = base_url + '/'
+    doc['baseUrl'] = base_url + '/drive/v3/'
+    google_clients._discovery_docs[('drive', 'v3')] = doc
+    google_clients._creds = AnonymousCredentials()
+
+# ==============================================================================
+# RUNS
+# ==============================================================================
+def run_threaded(file_ids, workers):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(len(b.getvalue()) for b in pool.map(drive_io.download_bytes, file_ids))
+
+def run_async(file_ids, size, base_url, connections):
+    total = 0
+
+    def handle(file_id, body):
+        nonlocal total
+        total += len(body)
+    async_transport.download_many(file_ids, handle, sizes=dict.fromkeys(file_ids, size), anonymous=True,
+                                  drive_root=base_url, max_connections=connections, max_downloads=connections,
+                                  rate_limits={'drive': (1e9, 1e9), 'sheets': (1e9, 1e9)})
+    return total
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--threads', default='15,100', help="thread pool sizes to try")
+    parser.add_argument('--connections', default='100,300', help="async connection pool sizes to try")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.size_kb * 1024, args.latency_ms / 1000)
+    point_threaded_path_at(base_url)
+    file_ids = [f"f{i}" for i in range(args.files)]
+    expected = args.files * args.size_kb * 1024
+
+    runs = [(f"threads ({n})", lambda n=n: run_threaded(file_ids, n)) for n in map(int, args.threads.split(','))]
+    runs += [(f"asyncio ({n} conns)", lambda n=n: run_async(file_ids, args.size_kb * 1024, base_url, n))
+             for n in map(int, args.connections.split(','))]
+
+    print(f"{args.files} files x {args.size_kb} KB, {args.latency_ms:.0f} ms per request")
+    print(f"{'transport':24} {'wall':>9} {'files/s':>9} {'MB/s':>8}")
+    for name, run in runs:
+        start = time.perf_counter()
+        total = run()
+        elapsed = time.perf_counter() - start
+        assert total == expected, f"{name}: got {total} bytes, expected {expected}"
+        print(f"{name:24} {elapsed:>8.2f}s {args.files / elapsed:>9.0f} {total / 2**20 / elapsed:>8.1f}")
+    server.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# dedup.py - Vectorized order dedup for POS exports
+#
+# Every order block is packed into one int64: (epoch seconds << 31) | order
+# number. A batch of files is then deduplicated with a single sort +
+# np.unique over those keys, and each store's history of processed orders
+# is a sorted int64 array searched with np.searchsorted (12 bytes per order
+# instead of a dict of string tuples).
+#
+# Semantics match part1.drop_duplicate_blocks: files are visited in name
+# order and the first file containing an order keeps it; repeats inside the
+# same file are kept. Orders from earlier runs (the store's history) count
+# as seen before any file in the batch.
+import os
+import calendar
+import datetime
+
+import numpy as np
+
+from state import state_path
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+HISTORY_SUBDIR = "order_keys"
+# "Mon Jan 6, 2025" part of a POS timestamp; the clock part is parsed by hand
+POS_DATE_FORMAT = '%a %b %d, %Y'
+ORDER_BITS = 31
+MAX_ORDER = (1 << ORDER_BITS) - 1
+MAX_EPOCH = (1 << 32) - 1
+# Set to 0 to dedup only within each batch (no history from earlier runs)
+HISTORY_ENABLED = os.environ.get('POPEYES_ORDER_HISTORY', '1') != '0'
+
+# store -> OrderHistory; kept warm across cycles in the long-running worker
+_histories = {}
+# "Mon Jan 6, 2025" -> epoch seconds at midnight (a batch spans a few days)
+_day_epochs = {}
+
+# ==============================================================================
+# KEYS
+# ==============================================================================
+# Both helpers return -1 for values that cannot be packed
+def _order_number(order_num):
+    # Only canonical decimals pack, so distinct order strings never share a key
+    if isinstance(order_num, str) and order_num.isdigit() and (order_num == '0' or order_num[0] != '0'):
+        value = int(order_num)
+        if value <= MAX_ORDER:
+            return value
+    return -1
+
+def _epoch_seconds(timestamp):
+    # strptime once per day, integer math for the clock: ~4x faster than
+    # pd.to_datetime on the same strings
+    try:
+        date, clock, half = timestamp.rsplit(' ', 2)
+        day = _day_epochs.get(date)
+        if day is None:
+            day = _day_epochs[date] = calendar.timegm(datetime.datetime.strptime(date, POS_DATE_FORMAT).timetuple())
+        hours, minutes, seconds = clock.split(':')
+        hours, minutes, seconds = int(hours), int(minutes), int(seconds)
+    except (ValueError, AttributeError):
+        return -1
+    if half not in ('AM', 'PM') or not (1 <= hours <= 12 and minutes < 60 and seconds < 60):
+        return -1
+    return day + ((hours % 12) + (12 if half == 'PM' else 0)) * 3600 + minutes * 60 + seconds
+
+def pack_keys(ids):
+    """
+    Packs [(timestamp, order_num)] into int64 keys. Returns (keys, packed)
+    where `packed` is a bool mask; ids that cannot be packed (unparseable
+    timestamp, non-numeric order) get key 0 and packed=False.
+    """
+    epochs = np.fromiter((_epoch_seconds(ts) for ts, _ in ids), dtype=np.int64, count=len(ids))
+    orders = np.fromiter((_order_number(num) for _, num in ids), dtype=np.int64, count=len(ids))
+    packed = (epochs >= 0) & (epochs <= MAX_EPOCH) & (orders >= 0)
+    return np.where(packed, (epochs << ORDER_BITS) | orders, 0), packed
+
+def pack_key(timestamp, order_num):
+    keys, packed = pack_keys([(timestamp, order_num)])
+    return int(keys[0]) if packed[0] else None
+
+# ==============================================================================
+# HISTORY
+# ==============================================================================
+class OrderHistory:
+    """A store's processed order keys (sorted) and the file each came from."""
+
+    def __init__(self, store, keys=None, files=None, names=None):
+        self.store = str(store)
+        self.keys = keys if keys is not None else np.empty(0, dtype=np.int64)
+        self.files = files if files is not None else np.empty(0, dtype=np.int32)
+        self.names = list(names or [])
+
+    def path(self):
+        return state_path(os.path.join(HISTORY_SUBDIR, f"{self.store}.npz"))
+
+    @classmethod
+    def load(cls, store):
+        history = cls(store)
+        try:
+            with np.load(history.path(), allow_pickle=False) as data:
+                return cls(store, data['keys'], data['files'], data['names'].tolist())
+        except (OSError, KeyError, ValueError):
+            return history
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path()), exist_ok=True)
+        tmp_path = self.path() + ".tmp.npz"
+        np.savez(tmp_path, keys=self.keys, files=self.files, names=np.array(self.names, dtype=str))
+        os.replace(tmp_path, self.path())
+
+    def lookup(self, keys):
+        """(found mask, index into self.names) for each key."""
+        if not len(self.keys) or not len(keys):
+            return np.zeros(len(keys), dtype=bool), np.zeros(len(keys), dtype=np.int32)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return self.keys[pos] == keys, self.files[pos]
+
+    def add(self, keys, file_name):
+        """Adds keys first seen in `file_name`; keys already present keep their original file."""
+        keys = np.unique(keys)
+        found, _ = self.lookup(keys)
+        new = keys[~found]
+        if not len(new):
+            return
+        if file_name in self.names:
+            name_idx = self.names.index(file_name)
+        else:
+            name_idx = len(self.names)
+            self.names.append(file_name)
+        merged = np.concatenate([self.keys, new])
+        order = np.argsort(merged, kind='stable')
+        self.keys = merged[order]
+        self.files = np.concatenate([self.files, np.full(len(new), name_idx, dtype=np.int32)])[order]
+
+def load_history(store):
+    """The store's history (cached per process), or None when history is disabled."""
+    if not HISTORY_ENABLED:
+        return None
+    store = str(store)
+    if store not in _histories:
+        _histories[store] = OrderHistory.load(store)
+    return _histories[store]
+
+def reset_history(store):
+    """Starts the store over with an empty history (saved by the next batch)."""
+    _histories[str(store)] = OrderHistory(store)
+
+# ==============================================================================
+# BATCH DEDUP
+# ==============================================================================
+def _details(block, original_file):
+    timestamp, order_num = block['id']
+    return f"[{timestamp} | Order #{order_num} | Dup of: {original_file}]"
+
+def dedup_files(files, history=None, seen_orders=None):
+    """
+    `files` is [(file_name, blocks)] in processing (name) order. Returns one
+    (kept_blocks, deleted_details, keys, new_ids) tuple per file, where `keys`
+    are the file's packed order keys (for OrderHistory.add once the file is
+    done) and `new_ids` ({id: file name}) its ids that do not pack and were
+    not seen before. `seen_orders` ({id: file name}, read only) carries those
+    ids across calls, when a batch is deduplicated one file at a time: the
+    caller adds `new_ids` to it together with the keys.
+    """
+    refs = [(f, b) for f, (_, blocks) in enumerate(files) for b, block in enumerate(blocks) if block['id']]
+    keys, packed = pack_keys([files[f][1][b]['id'] for f, b in refs])
+    file_idx = np.array([f for f, _ in refs], dtype=np.int32)
+
+    # Packed keys: the owner is the first file (in order) that contains the key
+    owner = file_idx.copy()
+    p = np.flatnonzero(packed)
+    if len(p):
+        order = p[np.lexsort((file_idx[p], keys[p]))]
+        _, first, inverse = np.unique(keys[order], return_index=True, return_inverse=True)
+        owner[order] = file_idx[order][first][inverse.ravel()]
+
+    # History wins over the whole batch (as if seeded into the seen-orders map)
+    in_history = np.zeros(len(refs), dtype=bool)
+    history_file = np.zeros(len(refs), dtype=np.int32)
+    if history is not None and len(p):
+        found, names = history.lookup(keys[p])
+        in_history[p] = found
+        history_file[p] = names
+
+    dropped = {}
+    for i in np.flatnonzero(packed & ((owner != file_idx) | in_history)):
+        f, b = refs[i]
+        original = history.names[history_file[i]] if in_history[i] else files[owner[i]][0]
+        if original != files[f][0]:
+            dropped[(f, b)] = original
+
+    # Ids that do not pack take the original dict path
+    seen_orders = seen_orders or {}
+    new_ids = [{} for _ in files]
+    for i in np.flatnonzero(~packed):
+        f, b = refs[i]
+        bid = files[f][1][b]['id']
+        original = seen_orders.get(bid)
+        if original is None:
+            original = next((ids[bid] for ids in new_ids if bid in ids), None)
+        if original is None:
+            new_ids[f][bid] = original = files[f][0]
+        if original != files[f][0]:
+            dropped[(f, b)] = original
+
+    results = []
+    for f, (_, blocks) in enumerate(files):
+        kept, deleted = [], []
+        for b, block in enumerate(blocks):
+            if (f, b) in dropped:
+                deleted.append(_details(block, dropped[(f, b)]))
+            else:
+                kept.append(block)
+        results.append((kept, deleted, keys[packed & (file_idx == f)], new_ids[f]))
+    return results
@@ -0,0 +1,424 @@
+# drive_io.py - Shared Drive file helpers for part1, part2 and payroll
+import io
+import os
+import hashlib
+import tempfile
+import threading
+import contextlib
+import concurrent.futures
+
+from google_clients import get_service, execute, call_with_retry
+from metrics import incr
+
+# ==============================================================================
+# TRANSFER TUNING
+# ==============================================================================
+# Files up to this size go up/down in a single request; larger ones are
+# transferred in resumable chunks.
+SIMPLE_TRANSFER_LIMIT = 5 * 1024 * 1024
+# Drive requires resumable chunks to be multiples of 256 KB.
+CHUNK_GRANULARITY = 256 * 1024
+MIN_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Used when the size is unknown: big enough that typical files finish in one request.
+DEFAULT_DOWNLOAD_CHUNK = 32 * 1024 * 1024
+
+# Downloads larger than this go to a temp file on disk instead of memory.
+SPOOL_THRESHOLD = int(os.environ.get('POPEYES_SPOOL_THRESHOLD_MB', 16)) * 1024 * 1024
+# Total bytes of download buffers held in memory at once, across all threads.
+MEMORY_BUDGET = int(os.environ.get('POPEYES_MEMORY_BUDGET_MB', 512)) * 1024 * 1024
+SPOOL_DIR = os.environ.get('POPEYES_SPOOL_DIR') or None
+
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+
+# (parent_id, folder_name) -> folder_id. Folder IDs never change, so in a
+# long-running worker this saves a files().list per store/month per cycle.
+_folder_cache = {}
+_folder_lock = threading.Lock()
+
+def _quote(name):
+    """Escapes a name for a Drive query string literal."""
+    return name.replace("\\", "\\\\").replace("'", "\\'")
+
+# ==============================================================================
+# HASHING
+# ==============================================================================
+def md5_of_bytes(data):
+    return hashlib.md5(data).hexdigest()
+
+def md5_of_file(path, block_size=1024 * 1024):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# ==============================================================================
+# MEMORY BUDGET
+# ==============================================================================
+class MemoryBudget:
+    """
+    Caps the bytes of download buffers held in memory across threads.
+    reserve(n) blocks until n bytes are free; a single request larger than
+    the whole budget waits until it can run alone.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n):
+        """Blocks until `n` bytes are free and takes them. Returns the bytes taken."""
+        n = min(n, self.limit)
+        with self.cond:
+            if self.used + n > self.limit:
+                incr('memory_budget_waits')
+            while self.used + n > self.limit:
+                self.cond.wait()
+            self.used += n
+        return n
+
+    def try_acquire(self, n):
+        """Takes `n` bytes if they are free right now. Returns the bytes taken, or None."""
+        n = min(n, self.limit)
+        with self.cond:
+            if self.used + n > self.limit:
+                return None
+            self.used += n
+        return n
+
+    def adjust(self, held, n):
+        """
+        Turns a held reservation of `held` bytes into `n` bytes without
+        waiting (the holder is already running). Returns the bytes now held.
+        """
+        n = min(n, self.limit)
+        with self.cond:
+            self.used += n - held
+            if n < held:
+                self.cond.notify_all()
+        return n
+
+    def release(self, n):
+        with self.cond:
+            self.used -= n
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def reserve(self, n):
+        n = self.acquire(n)
+        try:
+            yield
+        finally:
+            self.release(n)
+
+memory_budget = MemoryBudget(MEMORY_BUDGET)
+
+def download_cost(size):
+    """Memory a download holds: the whole file, or one chunk once it is spooled to disk."""
+    if not size:
+        return DEFAULT_DOWNLOAD_CHUNK
+    return pick_chunk_size(size) if size > SPOOL_THRESHOLD else size
+
+@contextlib.contextmanager
+def budgeted_download(file_id, size=None):
+    """
+    Reserves memory for the download, then yields it as a binary file object
+    (see spool_download). Buffer and reservation are released on exit, so
+    parse inside the block.
+    """
+    if size is None:
+        size = get_file_size(file_id)
+    with memory_budget.reserve(download_cost(size)):
+        fh = spool_download(file_id, size=size)
+        try:
+            yield fh
+        finally:
+            fh.close()
+
+# ==============================================================================
+# TRANSFERS
+# ==============================================================================
+def pick_chunk_size(size):
+    """Targets ~8 chunks per file, clamped to [8 MB, 64 MB] on the 256 KB grid."""
+    if not size:
+        return DEFAULT_DOWNLOAD_CHUNK
+    target = min(max(size // 8, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    return max(CHUNK_GRANULARITY, (target // CHUNK_GRANULARITY) * CHUNK_GRANULARITY)
+
+def download_to(file_id, fh, size=None):
+    """
+    Downloads `file_id` into the binary file object `fh`.
+
+    Small (or unknown-size) files complete in a single ranged request; large
+    files are fetched in tuned chunks. A failed chunk resumes from the last
+    byte received instead of restarting the whole file.
+    """
+    from googleapiclient.http import MediaIoBaseDownload
+
+    request = get_service().files().get_media(fileId=file_id)
+    chunksize = pick_chunk_size(size) if size and size > SIMPLE_TRANSFER_LIMIT else DEFAULT_DOWNLOAD_CHUNK
+    downloader = MediaIoBaseDownload(fh, request, chunksize=chunksize)
+    start = fh.tell()
+    done = False
+    while not done:
+        # A retried chunk re-requests the same byte range, so progress is kept
+        _, done = call_with_retry(downloader.next_chunk, 'drive.files.get_media')
+    incr('bytes_downloaded', fh.tell() - start)
+    incr('files_downloaded')
+    return fh
+
+def download_bytes(file_id, size=None):
+    """Downloads into memory and returns the buffer rewound to the start."""
+    fh = download_to(file_id, io.BytesIO(), size=size)
+    fh.seek(0)
+    return fh
+
+def spool_download(file_id, size=None):
+    """
+    Downloads into memory, or into an anonymous temp file when the file is
+    larger than SPOOL_THRESHOLD. Returns a binary file object rewound to the
+    start; closing it frees the memory or deletes the temp file.
+    """
+    if size is None:
+        size = get_file_size(file_id)
+    spooled = bool(size) and size > SPOOL_THRESHOLD
+    fh = tempfile.TemporaryFile(dir=SPOOL_DIR) if spooled else io.BytesIO()
+    try:
+        download_to(file_id, fh, size=size)
+    except Exception:
+        fh.close()
+        raise
+    if spooled:
+        incr('downloads_spooled')
+    fh.seek(0)
+    return fh
+
+def open_text_stream(file_id, encoding='utf-8', errors='strict', size=None):
+    """
+    Returns a text stream over the download (in memory or spooled to disk)
+    so parsers can iterate lines directly, without materialising a decoded
+    copy of the whole file. Line endings are passed through untouched
+    (newline='').
+    """
+    return io.TextIOWrapper(spool_download(file_id, size=size), encoding=encoding, errors=errors, newline='')
+
+def make_media(mimetype, data=None, path=None):
+    """Single-request upload for small payloads, resumable chunks for large ones."""
+    from googleapiclient.http import MediaIoBaseUpload, MediaFileUpload
+
+    size = len(data) if data is not None else os.path.getsize(path)
+    resumable = size > SIMPLE_TRANSFER_LIMIT
+    chunksize = pick_chunk_size(size) if resumable else -1
+    if data is not None:
+        return MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype, chunksize=chunksize, resumable=resumable)
+    return MediaFileUpload(path, mimetype=mimetype, chunksize=chunksize, resumable=resumable)
+
+def run_upload(request):
+    """
+    Executes a create/update request carrying media. Resumable uploads are
+    driven chunk by chunk; after a transient failure the next call asks Drive
+    how many bytes it already has and continues from there.
+    """
+    if not request.resumable:
+        return execute(request)
+
+    endpoint = f"{request.methodId}.chunk"
+    response = None
+    while response is None:
+        _, response = call_with_retry(request.next_chunk, endpoint)
+    return response
+
+# ==============================================================================
+# FOLDERS
+# ==============================================================================
+def get_or_create_folder(parent_id, folder_name):
+    """Returns the ID of `folder_name` under `parent_id`, creating it if needed (cached)."""
+    key = (parent_id, folder_name)
+    folder_id = _folder_cache.get(key)
+    if folder_id:
+        return folder_id
+
+    # Serialised so two threads never create the same folder twice
+    with _folder_lock:
+        folder_id = _folder_cache.get(key)
+        if folder_id:
+            return folder_id
+        service = get_service()
+        query = f"'{parent_id}' in parents and mimeType='{FOLDER_MIMETYPE}' and name='{_quote(folder_name)}' and trashed=false"
+        files = execute(service.files().list(
+            q=query,
+            fields="files(id)",
+            includeItemsFromAllDrives=True,
+            supportsAllDrives=True
+        )).get('files', [])
+        if files:
+            folder_id = files[0]['id']
+        else:
+            metadata = {'name': folder_name, 'mimeType': FOLDER_MIMETYPE, 'parents': [parent_id]}
+            folder_id = execute(service.files().create(body=metadata, fields='id', supportsAllDrives=True))['id']
+            print(f"📁 Created folder: {folder_name}")
+        _folder_cache[key] = folder_id
+    return folder_id
+
+def find_folder(parent_id, folder_name):
+    """Returns the ID of `folder_name` under `parent_id`, or None; never creates it."""
+    key = (parent_id, folder_name)
+    folder_id = _folder_cache.get(key)
+    if folder_id:
+        return folder_id
+    files = execute(get_service().files().list(
+        q=f"'{parent_id}' in parents and mimeType='{FOLDER_MIMETYPE}' and name='{_quote(folder_name)}' and trashed=false",
+        fields="files(id)",
+        includeItemsFromAllDrives=True,
+        supportsAllDrives=True
+    )).get('files', [])
+    if not files:
+        return None
+    with _folder_lock:
+        _folder_cache.setdefault(key, files[0]['id'])
+    return files[0]['id']
+
+def list_children(folder_id, fields="id, name, mimeType, size, md5Checksum"):
+    """Yields every non-trashed item directly inside `folder_id` (all pages)."""
+    service = get_service()
+    page_token = None
+    while True:
+        response = execute(service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields=f"nextPageToken, files({fields})",
+            pageSize=1000,
+            pageToken=page_token,
+            includeItemsFromAllDrives=True,
+            supportsAllDrives=True
+        ))
+        yield from response.get('files', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+def walk_folder(folder_id, folder_name=""):
+    """
+    Yields (parent_folder_name, file) for every file below `folder_id`,
+    descending into subfolders. Each file dict carries list_children's fields.
+    """
+    pending = [(folder_id, folder_name)]
+    while pending:
+        current_id, current_name = pending.pop()
+        for item in list_children(current_id):
+            if item.get('mimeType') == FOLDER_MIMETYPE:
+                pending.append((item['id'], item['name']))
+            else:
+                yield current_name, item
+
+# ==============================================================================
+# UPSERT
+# ==============================================================================
+def get_file_metadata(file_id, fields="id, name, size, md5Checksum"):
+    return execute(get_service().files().get(fileId=file_id, fields=fields, supportsAllDrives=True))
+
+def get_file_size(file_id):
+    """Size in bytes, or None (e.g. for Google-native documents)."""
+    size = get_file_metadata(file_id, fields="size").get('size')
+    return int(size) if size else None
+
+def get_file_sizes(file_ids, workers=8):
+    """{file_id: size or None}, looked up concurrently; failed lookups give None."""
+    def lookup(file_id):
+        try:
+            return get_file_size(file_id)
+        except Exception:
+            return None
+    file_ids = list(dict.fromkeys(file_ids))
+    if not file_ids:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(file_ids))) as pool:
+        return dict(zip(file_ids, pool.map(lookup, file_ids)))
+
+def find_file(folder_id, name, fields="id, md5Checksum"):
+    """Returns the first non-trashed file called `name` in `folder_id`, or None."""
+    service = get_service()
+    query = f"'{folder_id}' in parents and name='{_quote(name)}' and trashed=false"
+    files = execute(service.files().list(
+        q=query,
+        fields=f"files({fields})",
+        includeItemsFromAllDrives=True,
+        supportsAllDrives=True
+    )).get('files', [])
+    return files[0] if files else None
+
+def find_first(folder_id, names, fields="id, name, size"):
+    """
+    Returns the non-trashed file in `folder_id` called by the earliest of
+    `names` that exists (one files().list for all of them), or None.
+    """
+    if 'name' not in [f.strip() for f in fields.split(',')]:
+        fields += ", name"
+    query = " or ".join(f"name='{_quote(name)}'" for name in names)
+    files = execute(get_service().files().list(
+        q=f"'{folder_id}' in parents and ({query}) and trashed=false",
+        fields=f"files({fields})",
+        includeItemsFromAllDrives=True,
+        supportsAllDrives=True
+    )).get('files', [])
+    by_name = {}
+    for f in files:
+        by_name.setdefault(f['name'], f)
+    return next((by_name[name] for name in names if name in by_name), None)
+
+def fetch_copy(folder_id, name, path):
+    """
+    Makes the local file `path` a copy of `name` in `folder_id`, downloading
+    only when Drive's md5Checksum differs from the local file. Returns True
+    when Drive has the file; otherwise `path` is left as it is.
+    """
+    remote = find_file(folder_id, name, fields="id, md5Checksum, size")
+    if remote is None:
+        return False
+    if os.path.exists(path) and md5_of_file(path) == remote.get('md5Checksum'):
+        return True
+    tmp_path = path + ".download"
+    with open(tmp_path, 'wb') as fh:
+        download_to(remote['id'], fh, size=int(remote.get('size') or 0) or None)
+    os.replace(tmp_path, path)
+    return True
+
+def upsert_file(folder_id, name, mimetype, data=None, path=None):
+    """
+    Creates or updates `name` in `folder_id` from in-memory bytes (`data`) or a
+    local file (`path`), keeping the Drive file ID stable across updates.
+
+    Skips the upload entirely when Drive's md5Checksum already matches the
+    local content. Returns (file_id, action) with action in
+    'created' | 'updated' | 'unchanged'.
+    """
+    if (data is None) == (path is None):
+        raise ValueError("upsert_file needs exactly one of data or path")
+
+    local_md5 = md5_of_bytes(data) if data is not None else md5_of_file(path)
+    existing = find_file(folder_id, name)
+
+    if existing and existing.get('md5Checksum') == local_md5:
+        incr('uploads_skipped_unchanged')
+        return existing['id'], 'unchanged'
+
+    media = make_media(mimetype, data=data, path=path)
+    incr('bytes_uploaded', len(data) if data is not None else os.path.getsize(path))
+
+    service = get_service()
+    if existing:
+        run_upload(service.files().update(
+            fileId=existing['id'],
+            media_body=media,
+            supportsAllDrives=True
+        ))
+        return existing['id'], 'updated'
+
+    created = run_upload(service.files().create(
+        body={'name': name, 'parents': [folder_id]},
+        media_body=media,
+        fields='id',
+        supportsAllDrives=True
+    ))
+    return created['id'], 'created'
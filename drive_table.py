@@ -0,0 +1,126 @@
+# drive_table.py - A Parquet table kept on Drive, with the state dir as its cache
+#
+# rollup (daily sales per store) and hours_index (hours per employee and pay
+# week) are both small tables that several runs update: rows are staged as a
+# run goes, and save() merges them into the file on Drive. The copy in the
+# state dir is only a cache, refreshed when Drive's copy changes, since the
+# CI state cache is per run and can be evicted.
+#
+# Each staged entry is (store, scope, rows): the rows replace what the table
+# holds for the store within `scope`, as decided by the table's `replaces`
+# function, so re-processed inputs are not counted twice. save() re-reads
+# Drive's copy right before merging, so overlapping runs only lose updates
+# when their saves land within the same few seconds. Queries only look for
+# a newer copy on Drive every QUERY_SYNC_SECONDS.
+import os
+import time
+import threading
+
+import pandas as pd
+
+from drive_io import fetch_copy, upsert_file
+from sidecar import PARQUET_MIMETYPE
+from state import state_path
+
+# Queries re-check Drive's copy at most this often (a files.list and a local md5)
+QUERY_SYNC_SECONDS = float(os.environ.get('POPEYES_TABLE_SYNC_SECONDS', 300))
+
+
+class DriveTable:
+    """
+    `name` in Drive folder `folder_id`, cached as state_path(name). `empty`
+    is the frame of a table that does not exist yet; `key` the columns a row
+    is unique on (the latest staged row wins) and `sort` its order on disk.
+    `replaces(frame, store, scope)` is the mask of the rows a staged entry
+    replaces. `label` and `unit` name the table and its rows in messages.
+    """
+
+    def __init__(self, name, folder_id, empty, key, sort, replaces, label, unit):
+        self.name = name
+        self.folder_id = folder_id
+        self.empty = empty
+        self.key = key
+        self.sort = sort
+        self.replaces = replaces
+        self.label = label
+        self.unit = unit
+        self._lock = threading.Lock()
+        # Held for a whole read-merge-write of the file
+        self._save_lock = threading.Lock()
+        # [(store, scope, rows)] waiting for save()
+        self._staged = []
+        # (mtime, frame) of the last file read
+        self._cache = None
+        # time.monotonic() of the last sync with Drive
+        self._synced_at = None
+
+    @property
+    def path(self):
+        return state_path(self.name)
+
+    def stage(self, store, scope, rows):
+        with self._lock:
+            self._staged.append((store, scope, rows))
+
+    def sync(self):
+        """Refreshes the cached copy from Drive; keeps using it when Drive cannot be reached."""
+        try:
+            fetch_copy(self.folder_id, self.name, self.path)
+            self._synced_at = time.monotonic()
+        except Exception as e:
+            print(f"⚠️ {self.label}: Drive copy unavailable ({e}), using the cached copy")
+
+    def query(self):
+        """The table for queries, synced with Drive when the last sync is older than QUERY_SYNC_SECONDS."""
+        stale = self._synced_at is None or time.monotonic() - self._synced_at >= QUERY_SYNC_SECONDS
+        if stale or not os.path.exists(self.path):
+            self.sync()
+        return self.read()
+
+    def read(self):
+        """The cached copy (parsed again only when the file changed)."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return self.empty()
+        if self._cache is None or self._cache[0] != mtime:
+            self._cache = (mtime, pd.read_parquet(self.path))
+        return self._cache[1]
+
+    def save(self):
+        """Merges the staged rows into the table on Drive. Returns the rows it holds."""
+        with self._save_lock:
+            with self._lock:
+                staged = self._staged[:]
+                del self._staged[:]
+            if not staged:
+                return 0
+            self.sync()
+            total = self._merge(staged)
+            try:
+                upsert_file(self.folder_id, self.name, PARQUET_MIMETYPE, path=self.path)
+            except Exception as e:
+                # Kept for the next save (the worker's next cycle); the cache may be replaced before then
+                print(f"⚠️ {self.label} upload failed ({e}); will retry on the next save")
+                with self._lock:
+                    self._staged[:0] = staged
+            return total
+
+    def _merge(self, staged):
+        frame = self.read()
+        replaced = pd.Series(False, index=frame.index)
+        if len(frame):
+            for store, scope, _ in staged:
+                replaced |= self.replaces(frame, store, scope)
+
+        kept = [frame[~replaced]] if len(frame) else []
+        frame = pd.concat(kept + [rows for _, _, rows in staged], ignore_index=True)
+        # A key staged twice in one run keeps its latest row
+        frame = frame.drop_duplicates(self.key, keep='last')
+        frame = frame.sort_values(self.sort, kind='stable').reset_index(drop=True)
+
+        tmp_path = self.path + ".tmp"
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+        print(f"{self.label}: {sum(len(rows) for _, _, rows in staged)} {self.unit} updated, {len(frame)} total")
+        return len(frame)
@@ -0,0 +1,71 @@
+# fingerprints.py - What part1 has already processed, for the pre-download duplicate check
+#
+# The Drive md5Checksum of each processed source export -> store, file name,
+# persisted in the state dir. A pending file whose md5 is known is a
+# byte-identical re-upload, skipped without downloading it. Re-exports that
+# differ in bytes are downloaded and left to the store's OrderHistory.
+import os
+import threading
+
+from state import load_state, save_state
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+FINGERPRINTS_NAME = "fingerprints_part1.json"
+# Set to 0 to process every file in full (e.g. to deliberately re-run a file)
+FINGERPRINTS_ENABLED = os.environ.get('POPEYES_FINGERPRINTS', '1') != '0'
+# Oldest entries are dropped beyond this size
+MAX_HASHES = 20000
+
+# Loaded once per process; a long-running worker keeps it warm
+_fingerprints = None
+# Backfill runs several stores on threads; writers and save() take the lock
+_lock = threading.Lock()
+
+# ==============================================================================
+# STATE
+# ==============================================================================
+def load_fingerprints():
+    global _fingerprints
+    if _fingerprints is None:
+        _fingerprints = load_state(FINGERPRINTS_NAME, {'md5': {}})
+        # Order ranges of earlier versions are no longer used
+        _fingerprints.pop('ranges', None)
+    return _fingerprints
+
+def save_fingerprints():
+    fingerprints = load_fingerprints()
+    with _lock:
+        hashes = fingerprints['md5']
+        for md5 in list(hashes)[:max(0, len(hashes) - MAX_HASHES)]:
+            del hashes[md5]
+        save_state(FINGERPRINTS_NAME, fingerprints)
+
+# ==============================================================================
+# LOOKUPS
+# ==============================================================================
+def find_identical(md5):
+    """Name of an already-processed file with this md5Checksum, or None."""
+    if not FINGERPRINTS_ENABLED or not md5:
+        return None
+    entry = load_fingerprints()['md5'].get(md5)
+    return entry['file'] if entry else None
+
+def remember(store, file_name, md5=None):
+    """
+    Records a processed export, converted or Full Duplicate (call
+    save_fingerprints() afterwards). A known md5 keeps its first file name.
+    """
+    fingerprints = load_fingerprints()
+    with _lock:
+        if md5:
+            fingerprints['md5'].setdefault(md5, {'store': str(store), 'file': file_name})
+
+def forget_store(store):
+    """Drops everything recorded for `store` (a backfill re-processes its history from scratch)."""
+    fingerprints = load_fingerprints()
+    with _lock:
+        for md5, entry in list(fingerprints['md5'].items()):
+            if entry['store'] == str(store):
+                del fingerprints['md5'][md5]
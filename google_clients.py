@@ -0,0 +1,297 @@
+# google_clients.py - Shared Google API clients for part1, part2 and payroll
+import os
+import json
+import time
+import random
+import socket
+import threading
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
+
+# Credentials are parsed once per process and shared by every worker thread.
+_creds = None
+_creds_lock = threading.Lock()
+
+# Parsed discovery documents, shared by every thread (read-only after load).
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+# Each thread owns its own authorized HTTP session (httplib2 is not thread-safe).
+thread_local = threading.local()
+
+# Rate limits per API as (requests per second, burst). Defaults sit just under
+# the per-user quotas: Drive 12,000 req/min, Sheets 60 req/min.
+RATE_LIMITS = {
+    'drive': (float(os.environ.get('POPEYES_RATE_DRIVE', 150)), 50),
+    'sheets': (float(os.environ.get('POPEYES_RATE_SHEETS', 0.9)), 5),
+}
+MAX_RETRIES = int(os.environ.get('POPEYES_MAX_RETRIES', 6))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 64.0
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded')
+
+# Timing instrumentation
+_stats_lock = threading.Lock()
+CLIENT_STATS = {
+    'discovery_loads': 0,
+    'discovery_seconds': 0.0,
+    'builds': 0,
+    'build_seconds': 0.0,
+    'reuses': 0,
+}
+# endpoint (e.g. 'drive.files.list') -> {'calls', 'retries', 'failures', 'seconds'}
+API_STATS = {}
+
+# ==============================================================================
+# CREDENTIALS
+# ==============================================================================
+def get_credentials():
+    """Parses SERVICE_ACCOUNT_KEY on first use. Returns None if it is not set."""
+    global _creds
+    if _creds is None:
+        with _creds_lock:
+            if _creds is None:
+                if 'SERVICE_ACCOUNT_KEY' not in os.environ:
+                    print("⚠️ SERVICE_ACCOUNT_KEY not found. Authentication may fail.")
+                    return None
+                from google.oauth2.service_account import Credentials
+
+                info = json.loads(os.environ['SERVICE_ACCOUNT_KEY'])
+                _creds = Credentials.from_service_account_info(info, scopes=SCOPES)
+    return _creds
+
+# ==============================================================================
+# DISCOVERY DOCUMENTS
+# ==============================================================================
+def _get_discovery_doc(service_name, version):
+    """
+    Loads the discovery document bundled with googleapiclient (no network fetch)
+    and parses it once per process.
+    """
+    key = (service_name, version)
+    doc = _discovery_docs.get(key)
+    if doc is not None:
+        return doc
+
+    with _discovery_lock:
+        doc = _discovery_docs.get(key)
+        if doc is None:
+            from googleapiclient.discovery_cache import get_static_doc
+
+            start = time.perf_counter()
+            raw = get_static_doc(service_name, version)
+            if raw is None:
+                raise ValueError(f"No bundled discovery document for {service_name} {version}")
+            doc = json.loads(raw)
+            _discovery_docs[key] = doc
+            with _stats_lock:
+                CLIENT_STATS['discovery_loads'] += 1
+                CLIENT_STATS['discovery_seconds'] += time.perf_counter() - start
+    return doc
+
+# ==============================================================================
+# SERVICES
+# ==============================================================================
+def _new_http():
+    import httplib2
+    import google_auth_httplib2
+
+    return google_auth_httplib2.AuthorizedHttp(get_credentials(), http=httplib2.Http())
+
+def get_service(service_name='drive', version='v3'):
+    """
+    Returns a client for the calling thread, building it on first use only.
+    Clients reuse a per-thread authorized session and the shared parsed
+    discovery document, so repeated calls cost a dict lookup.
+    """
+    key = f"service_{service_name}_{version}"
+    service = getattr(thread_local, key, None)
+    if service is not None:
+        with _stats_lock:
+            CLIENT_STATS['reuses'] += 1
+        return service
+
+    from googleapiclient.discovery import build_from_document
+
+    doc = _get_discovery_doc(service_name, version)
+    start = time.perf_counter()
+    if not hasattr(thread_local, 'http'):
+        thread_local.http = _new_http()
+    service = build_from_document(doc, http=thread_local.http)
+    setattr(thread_local, key, service)
+    with _stats_lock:
+        CLIENT_STATS['builds'] += 1
+        CLIENT_STATS['build_seconds'] += time.perf_counter() - start
+    return service
+
+def report_client_stats():
+    """Prints how many clients were built vs. reused and the overhead avoided."""
+    with _stats_lock:
+        stats = dict(CLIENT_STATS)
+    builds = stats['builds']
+    if not builds:
+        return stats
+    per_build = (stats['build_seconds'] + stats['discovery_seconds']) / builds
+    saved = per_build * stats['reuses']
+    print(
+        f"🔌 API clients: {builds} built ({stats['build_seconds']:.3f}s), "
+        f"{stats['discovery_loads']} discovery docs parsed ({stats['discovery_seconds']:.3f}s), "
+        f"{stats['reuses']} reuses (~{saved:.2f}s of rebuild overhead avoided)"
+    )
+    return stats
+
+def get_authorized_session():
+    """
+    A requests-based session for lightweight REST calls (no discovery, no
+    googleapiclient import). Used by the startup pending-work check.
+    """
+    session = getattr(thread_local, 'rest_session', None)
+    if session is None:
+        from google.auth.transport.requests import AuthorizedSession
+
+        session = thread_local.rest_session = AuthorizedSession(get_credentials())
+    return session
+
+# ==============================================================================
+# REQUEST EXECUTOR (RATE LIMITING + RETRY)
+# ==============================================================================
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Takes a token if one is available. Returns 0, or the seconds until one is."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def drain(self):
+        """Called after a rate-limit response so every thread backs off together."""
+        with self.lock:
+            self.tokens = 0
+            self.updated = time.monotonic()
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_bucket(api):
+    bucket = _buckets.get(api)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(api)
+            if bucket is None:
+                rate, capacity = RATE_LIMITS.get(api, RATE_LIMITS['drive'])
+                bucket = _buckets[api] = TokenBucket(rate, capacity)
+    return bucket
+
+def error_status(error):
+    """HTTP status of a googleapiclient HttpError or a requests HTTPError, else None."""
+    resp = getattr(error, 'resp', None)
+    if resp is not None:
+        return getattr(resp, 'status', None)
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def error_content(error):
+    content = getattr(error, 'content', None)
+    if content is None:
+        content = getattr(getattr(error, 'response', None), 'text', '')
+    return str(content)
+
+def is_retryable(error):
+    """True for quota/rate-limit responses, 5xx and dropped connections."""
+    status = error_status(error)
+    if status is not None:
+        if status in RETRYABLE_STATUSES:
+            return True
+        if status == 403:
+            return any(reason in error_content(error) for reason in RATE_LIMIT_REASONS)
+        return False
+    if isinstance(error, (ConnectionError, socket.timeout, TimeoutError)):
+        return True
+    # requests' connection errors don't derive from the builtin ConnectionError
+    return type(error).__name__ in ('ConnectionError', 'Timeout', 'ConnectTimeout', 'ReadTimeout')
+
+def is_rate_limited(error):
+    status = error_status(error)
+    return status == 429 or (status == 403 and is_retryable(error))
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+def record_call(endpoint, seconds, retries=0, failed=False):
+    with _stats_lock:
+        entry = API_STATS.setdefault(endpoint, {'calls': 0, 'retries': 0, 'failures': 0, 'seconds': 0.0})
+        entry['calls'] += 1
+        entry['retries'] += retries
+        entry['seconds'] += seconds
+        if failed:
+            entry['failures'] += 1
+
+def call_with_retry(fn, endpoint, api=None):
+    """
+    Runs `fn()` under the rate limiter for `api`, retrying retryable errors
+    with exponential backoff and jitter. Used for anything that is not a
+    plain HttpRequest (e.g. media chunks).
+    """
+    api = api or endpoint.split('.')[0]
+    bucket = get_bucket(api)
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not is_retryable(e):
+                record_call(endpoint, time.perf_counter() - start, attempt, failed=True)
+                raise
+            if is_rate_limited(e):
+                bucket.drain()
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        record_call(endpoint, time.perf_counter() - start, attempt)
+        return result
+
+def execute(request):
+    """Executes a googleapiclient HttpRequest through the central executor."""
+    endpoint = getattr(request, 'methodId', None) or 'unknown'
+    return call_with_retry(request.execute, endpoint)
+
+def reset_api_stats():
+    """Clears the per-endpoint stats (a new stage or worker cycle starts)."""
+    with _stats_lock:
+        API_STATS.clear()
+
+def report_api_stats():
+    """Prints per-endpoint call counts, retries, failures and mean latency."""
+    with _stats_lock:
+        stats = {k: dict(v) for k, v in API_STATS.items()}
+    for endpoint, s in sorted(stats.items()):
+        mean_ms = 1000 * s['seconds'] / s['calls'] if s['calls'] else 0
+        print(f"   📡 {endpoint}: {s['calls']} calls, {s['retries']} retries, {s['failures']} failed, {mean_ms:.0f} ms avg")
+    return stats
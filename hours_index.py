@@ -0,0 +1,126 @@
+# hours_index.py - Cross-store index of employee hours per pay week
+#
+# payroll stages the Clockset / Paid Break hours of every report it parses
+# as (emp_id, week_start, store, hours) rows; save() merges them into a
+# Parquet table kept on Drive in payroll's output root (INDEX_FOLDER_ID,
+# see drive_table.py). A report
+# replaces what the index held for its store and pay weeks, so re-uploaded
+# reports are not counted twice.
+#
+#   weekly_hours(start='2025-01-06')       # emp x week: total, stores, by store
+#   overtime_exposure(start='2025-01-06')  # weeks over 40h across all stores
+#
+# Both are one groupby over the index, instead of re-parsing every store's
+# report to find employees who clock in at more than one store.
+import os
+
+import pandas as pd
+
+from drive_table import DriveTable
+from sidecar import HAS_PARQUET
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+INDEX_NAME = "payroll_hours.parquet"
+# Drive folder holding the index: payroll's OUTPUT_ROOT_ID
+INDEX_FOLDER_ID = os.environ.get('POPEYES_HOURS_INDEX_FOLDER_ID', "0AEDJ3Yc9IXQcUk9PVA")
+# Weekly hours above this are overtime (as in payroll.prepare_pivot_df)
+OVERTIME_THRESHOLD = 40
+# Set to 0 to stop maintaining the index
+HOURS_INDEX_ENABLED = os.environ.get('POPEYES_HOURS_INDEX', '1') != '0'
+HOUR_TYPES = ('Clockset', 'Paid Break')
+COLUMNS = ['emp_id', 'week_start', 'store', 'hours']
+
+def _empty():
+    return pd.DataFrame({'emp_id': pd.Series(dtype=str), 'week_start': pd.Series(dtype='datetime64[ns]'),
+                         'store': pd.Series(dtype=str), 'hours': pd.Series(dtype=float)})
+
+def _replaces(frame, store_no, weeks):
+    """A report's rows replace its store's rows for the pay weeks it covers."""
+    return (frame['store'] == store_no) & frame['week_start'].isin(weeks)
+
+_table = DriveTable(INDEX_NAME, INDEX_FOLDER_ID, _empty, key=['emp_id', 'week_start', 'store'],
+                    sort=['week_start', 'emp_id', 'store'], replaces=_replaces, label="Hours index",
+                    unit="employee-week(s)")
+
+def enabled():
+    return HOURS_INDEX_ENABLED and HAS_PARQUET
+
+def index_path():
+    return _table.path
+
+# ==============================================================================
+# BUILDING
+# ==============================================================================
+def weekly_rows(df, store_no, pay_period_start):
+    """
+    Hours per (emp_id, pay week) of one parsed report. Weeks start on
+    `pay_period_start` and the day after week 1; days outside the two-week
+    period are dropped, as in payroll.get_week_number.
+    """
+    rows = df[df['type'].isin(HOUR_TYPES)]
+    dates = pd.to_datetime(rows['date'], format='%m/%d/%Y', errors='coerce')
+    days = (dates - pd.Timestamp(pay_period_start).normalize()).dt.days
+    in_period = days.between(0, 13)
+    rows, days = rows[in_period], days[in_period]
+
+    week_start = pd.Timestamp(pay_period_start).normalize() + pd.to_timedelta(days // 7 * 7, unit='D')
+    weekly = (rows.assign(week_start=week_start.values)
+                  .groupby(['emp_id', 'week_start'], sort=True)['decimal_hours'].sum()
+                  .reset_index(name='hours'))
+    weekly['emp_id'] = weekly['emp_id'].astype(str)
+    weekly.insert(2, 'store', str(store_no))
+    return weekly[COLUMNS]
+
+def stage(store_no, pay_period_start, rows):
+    """Queues a report's rows, replacing the store's entries for both weeks of its period."""
+    start = pd.Timestamp(pay_period_start).normalize()
+    _table.stage(str(store_no), {start, start + pd.Timedelta(days=7)}, rows)
+
+# ==============================================================================
+# STORAGE
+# ==============================================================================
+def save():
+    """Merges the staged rows into the index on Drive. Returns the rows it holds."""
+    return _table.save() if enabled() else 0
+
+# ==============================================================================
+# QUERIES
+# ==============================================================================
+def _select(start=None, end=None, emp_ids=None):
+    frame = _table.query()
+    if start is not None:
+        frame = frame[frame['week_start'] >= pd.Timestamp(start)]
+    if end is not None:
+        frame = frame[frame['week_start'] <= pd.Timestamp(end)]
+    if emp_ids is not None:
+        frame = frame[frame['emp_id'].isin([str(e) for e in emp_ids])]
+    return frame
+
+def weekly_hours(start=None, end=None, emp_ids=None):
+    """
+    Chain-wide hours per (emp_id, week_start) for weeks starting in
+    [start, end]: total hours, number of stores, and one column per store.
+    """
+    by_store = _select(start, end, emp_ids).pivot_table(index=['emp_id', 'week_start'], columns='store',
+                                                        values='hours', aggfunc='sum')
+    result = pd.DataFrame({'total_hours': by_store.sum(axis=1), 'stores': by_store.notna().sum(axis=1)})
+    return result.join(by_store.fillna(0))
+
+def overtime_exposure(start=None, end=None, threshold=OVERTIME_THRESHOLD):
+    """
+    Employee-weeks over `threshold` hours across all stores, with the
+    overtime hours and whether they only exceed it when stores are combined.
+    """
+    frame = _select(start, end)
+    grouped = frame.groupby(['emp_id', 'week_start'])['hours']
+    weekly = pd.DataFrame({
+        'total_hours': grouped.sum(),
+        'max_store_hours': grouped.max(),
+        'stores': grouped.size(),
+    })
+    weekly = weekly[weekly['total_hours'] > threshold].copy()
+    weekly['overtime'] = (weekly['total_hours'] - threshold).round(2)
+    weekly['cross_store_only'] = weekly['max_store_hours'] <= threshold
+    return weekly.sort_values('overtime', ascending=False)
@@ -0,0 +1,95 @@
+# ledger.py - Local append-only run ledger
+#
+# Every per-file outcome (and part1's full list of deleted duplicates) is
+# appended as one JSON line to .state/ledger.jsonl. The Sheets only get
+# summarized rows, pushed by sync() in one call per run:
+#
+#   record('part1', store=..., file=..., status=..., details=[...])
+#   sync('part1_log', 'part1', push)   # push(entries) does the bulk write
+#
+# Each sink keeps a byte offset into the ledger, so entries that could not
+# be pushed (API error, crashed run) go out with the next sync.
+import os
+import json
+import datetime
+import threading
+
+from state import state_path, load_state, save_state
+from tracking import RUN_TOKEN
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+LEDGER_NAME = "ledger.jsonl"
+SYNC_STATE_NAME = "ledger_sync.json"
+# Sinks that sync() the ledger (part1's log sheet); the ledger only rotates
+# once each of them has read all of it
+SINKS = ['part1_log']
+# Once every sink has synced past this size, the ledger moves to ledger.jsonl.1
+MAX_BYTES = int(os.environ.get('POPEYES_LEDGER_MAX_MB', 64)) * 1024 * 1024
+
+_lock = threading.Lock()
+
+# ==============================================================================
+# RECORDING
+# ==============================================================================
+def record(stage, **fields):
+    """Appends one entry (timestamp, run token, stage + `fields`) and returns it."""
+    entry = {
+        'ts': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'run': RUN_TOKEN,
+        'stage': stage,
+        **fields,
+    }
+    line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        with open(state_path(LEDGER_NAME), 'a', encoding='utf-8') as f:
+            f.write(line)
+    return entry
+
+# ==============================================================================
+# SYNC
+# ==============================================================================
+def _rotate(offsets, size):
+    path = state_path(LEDGER_NAME)
+    # A configured sink that never synced has read nothing yet
+    sinks = set(SINKS) | set(offsets)
+    if size < MAX_BYTES or any(offsets.get(sink, 0) < size for sink in sinks):
+        return
+    os.replace(path, path + ".1")
+    for sink in sinks:
+        offsets[sink] = 0
+
+def sync(sink, stage, push):
+    """
+    Calls push(entries) once with every `stage` entry recorded since the
+    sink's last sync, then moves the sink's offset past them. If push raises,
+    the offset stays and the exception propagates. Returns the entry count.
+    """
+    with _lock:
+        path = state_path(LEDGER_NAME)
+        offsets = load_state(SYNC_STATE_NAME, {})
+        offset = offsets.get(sink, 0)
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if offset > size:
+                    offset = 0  # ledger was replaced
+                f.seek(offset)
+                data = f.read(size - offset)
+        except FileNotFoundError:
+            return 0
+
+        entries = []
+        for line in data.decode('utf-8').splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                if entry.get('stage') == stage:
+                    entries.append(entry)
+        if entries:
+            push(entries)
+
+        offsets[sink] = offset + len(data)
+        _rotate(offsets, size)
+        save_state(SYNC_STATE_NAME, offsets)
+        return len(entries)
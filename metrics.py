@@ -0,0 +1,182 @@
+# metrics.py - Stage timers, counters and per-run JSON summaries
+#
+# Usage:
+#   with timer('part1.parse'):
+#       ...
+#   incr('blocks_parsed', len(blocks))
+#   write_summary('part1')
+#
+# POPEYES_PROFILE_STAGE=<stage name> writes a cProfile dump for that stage;
+# POPEYES_PROFILE_STAGE=auto profiles every top-level stage (on the main
+# thread) and keeps only the dump of the one that took longest. Only one
+# profiler runs at a time: concurrent profilers raise on Python 3.12+, so
+# calls that start while one is active are timed but not profiled.
+#
+# write_summary() starts the next run afresh (timers, counters, profiles and
+# google_clients.API_STATS), so a long-running worker reports each stage's
+# own numbers; the worker also calls reset() before each stage.
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+import contextlib
+
+from state import state_path
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+PROFILE_STAGE = os.environ.get('POPEYES_PROFILE_STAGE', '')
+METRICS_SUBDIR = "metrics"
+# Older summaries/profiles are pruned so the cached state dir stays small;
+# this many are kept per run name (part1, part2, payroll, backfill, ...)
+KEEP_FILES = 200
+# <run>_<timestamp>.json and <run>_<timestamp>_<stage>.prof
+_FILE_NAME = re.compile(r'^(?P<run>.+)_(?P<stamp>\d{8}T\d{6}Z)(_.*)?\.(json|prof)$')
+
+_lock = threading.Lock()
+_run_started = time.time()
+# True while a profiler is enabled (any thread)
+_profiling = False
+
+# stage -> {'calls', 'seconds', 'max_seconds'}
+STAGE_TIMES = {}
+# counter name -> value
+COUNTERS = {}
+# stage -> merged pstats.Stats (only when profiling)
+_profiles = {}
+
+# ==============================================================================
+# RECORDING
+# ==============================================================================
+def incr(name, n=1):
+    with _lock:
+        COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+def _start_profiler(stage):
+    """A started profiler for `stage`, or None when it is not profiled."""
+    global _profiling
+    if not PROFILE_STAGE or (PROFILE_STAGE != stage and PROFILE_STAGE != 'auto'):
+        return None
+    if PROFILE_STAGE == 'auto' and threading.current_thread() is not threading.main_thread():
+        return None
+    with _lock:
+        if _profiling:
+            return None
+        _profiling = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool is active (e.g. running under a profiler)
+        with _lock:
+            _profiling = False
+        return None
+    return profiler
+
+@contextlib.contextmanager
+def timer(stage):
+    """Times the block under `stage` (thread-safe; stages may nest)."""
+    global _profiling
+    profiler = _start_profiler(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        with _lock:
+            entry = STAGE_TIMES.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += elapsed
+            entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+            if profiler is not None:
+                _profiling = False
+                if stage in _profiles:
+                    _profiles[stage].add(profiler)
+                else:
+                    _profiles[stage] = pstats.Stats(profiler)
+
+def reset():
+    """Starts a new run: clears timers, counters, profiles and the API call stats."""
+    global _run_started
+    from google_clients import reset_api_stats
+
+    with _lock:
+        STAGE_TIMES.clear()
+        COUNTERS.clear()
+        _profiles.clear()
+        _run_started = time.time()
+    reset_api_stats()
+
+# ==============================================================================
+# REPORTING
+# ==============================================================================
+def _dump_profile(run_name, stamp):
+    if not _profiles:
+        return None
+    if PROFILE_STAGE == 'auto':
+        stage = max(_profiles, key=lambda s: STAGE_TIMES.get(s, {}).get('seconds', 0))
+    else:
+        stage = PROFILE_STAGE
+    path = state_path(os.path.join(METRICS_SUBDIR, f"{run_name}_{stamp}_{stage}.prof"))
+    _profiles[stage].dump_stats(path)
+    return path
+
+def snapshot():
+    """Current metrics as a plain dict (also includes API client/call stats)."""
+    from google_clients import CLIENT_STATS, API_STATS
+
+    with _lock:
+        return {
+            'started': datetime.datetime.fromtimestamp(_run_started, datetime.timezone.utc).isoformat(),
+            'wall_seconds': round(time.time() - _run_started, 3),
+            'stages': {k: {**v, 'seconds': round(v['seconds'], 4), 'max_seconds': round(v['max_seconds'], 4)}
+                       for k, v in STAGE_TIMES.items()},
+            'counters': dict(COUNTERS),
+            'api': {k: dict(v) for k, v in API_STATS.items()},
+            'clients': dict(CLIENT_STATS),
+        }
+
+def _prune(directory):
+    """Keeps the newest KEEP_FILES files of each run name, by the timestamp in the name."""
+    by_run = {}
+    for name in os.listdir(directory):
+        match = _FILE_NAME.match(name)
+        if match:
+            by_run.setdefault(match['run'], []).append((match['stamp'], name))
+    for files in by_run.values():
+        files.sort()
+        for _, name in files[:-KEEP_FILES] if len(files) > KEEP_FILES else []:
+            os.remove(os.path.join(directory, name))
+
+def write_summary(run_name):
+    """
+    Writes .state/metrics/<run>_<timestamp>.json (plus a .prof when
+    profiling), prints a one-line-per-stage digest, then reset()s.
+    """
+    os.makedirs(state_path(METRICS_SUBDIR), exist_ok=True)
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    summary = snapshot()
+    summary['run'] = run_name
+    summary['profile'] = _dump_profile(run_name, stamp)
+
+    path = state_path(os.path.join(METRICS_SUBDIR, f"{run_name}_{stamp}.json"))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    _prune(state_path(METRICS_SUBDIR))
+
+    print(f"📊 {run_name} metrics ({summary['wall_seconds']:.1f}s wall) -> {path}")
+    for stage, s in sorted(summary['stages'].items(), key=lambda kv: -kv[1]['seconds']):
+        print(f"   ⏱️ {stage}: {s['seconds']:.2f}s over {s['calls']} call(s)")
+    for name, value in sorted(summary['counters'].items()):
+        print(f"   🔢 {name}: {value}")
+    if summary['profile']:
+        print(f"   🔬 profile: {summary['profile']}")
+    reset()
+    return summary
@@ -6,79 +6,100 @@ import os
 import io
 import csv
 import re
+import itertools
+import collections
 import datetime
-import json
 import pandas as pd
 import threading
 import concurrent.futures
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+import ledger
+import artifacts
+from google_clients import get_service, execute, report_client_stats, report_api_stats
+from metrics import timer, incr, write_summary
+from drive_io import (upsert_file, open_text_stream, get_or_create_folder, get_file_metadata, get_file_sizes,
+                      memory_budget, download_cost)
+from sidecar import enabled as sidecars_enabled, to_parquet_bytes, sidecar_name, PARQUET_MIMETYPE
+from state import load_state, save_state
+from fingerprints import find_identical, remember, save_fingerprints
+from dedup import OrderHistory, dedup_files, load_history
+from scheduler import Schedule
+from tracking import (SALES_TRACKING_SHEET_ID, read_tracking_rows, set_row_statuses, claim_rows, release_rows,
+                      is_leased_by_other, in_shard)
 
 # ==============================================================================
 # CONFIGURATION
 # ==============================================================================
 SALES_ROOT_FOLDER_ID = "1ge-fbJkuph-B5sGR3GThhIKRr5YKO_rS"
 CONVERTED_FOLDER_ID = "0AMqtpoGz7H5RUk9PVA"  # Shared Drive Root Folder
-TRACKING_SHEET_ID = "1r872UNCcsgkdEkV9Y9PnNcuTtPrezs0XE3n8HFZgqyM"
+TRACKING_SHEET_ID = SALES_TRACKING_SHEET_ID  # see tracking.STAGE_TRACKING
 LOG_SHEET_ID = "1XhdFj-fpINNJVveiEk_Qp2FRD-4CV6a1GnUKF7RWlVk"
 MAX_WORKERS = 15
-
-# Load Credentials from Environment Variable
-if 'SERVICE_ACCOUNT_KEY' in os.environ:
-    SERVICE_ACCOUNT_JSON = json.loads(os.environ['SERVICE_ACCOUNT_KEY'])
-    creds = Credentials.from_service_account_info(
-        SERVICE_ACCOUNT_JSON, 
-        scopes=['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-    )
-else:
-    # Fallback for local testing (optional)
-    print("⚠️ SERVICE_ACCOUNT_KEY not found. Authentication may fail.")
-    creds = None
-
-# Thread-local storage
-thread_local = threading.local()
-log_lock = threading.Lock()
-log_entries = []
-
-# ==============================================================================
-# SERVICES
-# ==============================================================================
-def get_service(service_name='drive', version='v3'):
-    key = f"service_{service_name}_{version}"
-    if not hasattr(thread_local, key):
-        setattr(thread_local, key, build(service_name, version, credentials=creds))
-    return getattr(thread_local, key)
+# Bytes of Python object overhead per parsed line (str + list slot) and per block (dict)
+PARSED_LINE_OVERHEAD = 64
+PARSED_BLOCK_OVERHEAD = 256
+# Per-store converted-column layout (see SCHEMA CACHE); 0 always infers it
+SCHEMA_CACHE_ENABLED = os.environ.get('POPEYES_SCHEMA_CACHE', '1') != '0'
+SCHEMAS_NAME = "schemas_part1.json"
+
+# Log sheet cells list at most this many deleted duplicates; the run ledger
+# (ledger.py) keeps the full list
+LOG_DETAIL_LINES = 20
+
+# Credentials and API clients live in google_clients (pooled per thread)
+
+# Download pool, created once per process so its threads (and their API
+# clients) stay warm across stores and across worker cycles
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return _executor
 
 # ==============================================================================
 # LOGGING SYSTEM
 # ==============================================================================
-def add_log(store, month, filename, deleted_ts_status, full_sheet_status):
-    with log_lock:
-        log_entries.append([
-            str(store),
-            str(month) if month else "Unknown",
-            str(filename),
-            str(deleted_ts_status),
-            str(full_sheet_status)
-        ])
+def add_log(store, month, filename, deleted_ts_status, full_sheet_status, details=None):
+    """
+    Records one file's outcome in the run ledger; flush_logs_to_sheet() pushes
+    it. `details` (e.g. every deleted duplicate) is kept in full in the ledger.
+    """
+    ledger.record('part1',
+                  store=str(store),
+                  month=str(month) if month else "Unknown",
+                  file=str(filename),
+                  deleted=str(deleted_ts_status),
+                  status=str(full_sheet_status),
+                  details=details or [])
+
+def summarize_details(details):
+    shown = "\n".join(details[:LOG_DETAIL_LINES])
+    more = len(details) - LOG_DETAIL_LINES
+    return shown + (f"\n... +{more} more (run ledger)" if more > 0 else "")
+
+def log_row(entry):
+    return [entry['store'], entry['month'], entry['file'], entry['deleted'], entry['status']]
+
+def push_log_rows(entries):
+    service = get_service('sheets', 'v4')
+    execute(service.spreadsheets().values().append(
+        spreadsheetId=LOG_SHEET_ID,
+        range="Sheet1!A:E",
+        valueInputOption="RAW",
+        body={'values': [log_row(e) for e in entries]}
+    ))
 
 def flush_logs_to_sheet():
-    with log_lock:
-        if not log_entries: return
-        try:
-            service = get_service('sheets', 'v4')
-            body = {'values': log_entries}
-            service.spreadsheets().values().append(
-                spreadsheetId=LOG_SHEET_ID,
-                range="Sheet1!A:E",
-                valueInputOption="RAW",
-                body=body
-            ).execute()
-            print(f"📝 Logged {len(log_entries)} entries to Log Sheet.")
-            log_entries.clear()
-        except Exception as e:
-            print(f"⚠️ Log Error: {e}")
+    """Appends every not-yet-synced ledger entry to the Log Sheet in one call (once per run)."""
+    try:
+        count = ledger.sync('part1_log', 'part1', push_log_rows)
+        if count:
+            print(f"📝 Logged {count} entries to Log Sheet.")
+    except Exception as e:
+        print(f"⚠️ Log Error (entries stay in the ledger for the next run): {e}")
 
 # ==============================================================================
 # TRACKING SHEET HELPERS
@@ -89,29 +110,28 @@ def get_pending_uploads():
     We group by Store because deduplication logic works Per-Store.
     """
     try:
-        service = get_service('sheets', 'v4')
-        result = service.spreadsheets().values().get(
-            spreadsheetId=TRACKING_SHEET_ID, range="Sheet1!A:D").execute()
-        rows = result.get('values', [])
+        # Only rows after the saved cursor plus still-pending rows are fetched
+        rows = read_tracking_rows(TRACKING_SHEET_ID, 'part1')
         
         pending_by_store = {}
         
-        for i, row in enumerate(rows):
-            if i == 0: continue # Skip header
-            
+        for row_num, row in rows:
             # Format: [FileID, FileName, Date, Status]
             if len(row) >= 4 and row[3] == "UPLOADED":
+                # Skip rows another run is working on (live lease)
+                if is_leased_by_other(row): continue
                 file_id = row[0]
                 file_name = row[1]
                 
                 # Extract Store Number to group them
                 store_num = get_store_number(file_name)
+                if not in_shard(store_num): continue
                 
                 if store_num not in pending_by_store:
                     pending_by_store[store_num] = []
                 
                 # Store tuple: (RowIndex (1-based), FileID, FileName)
-                pending_by_store[store_num].append((i + 1, file_id, file_name))
+                pending_by_store[store_num].append((row_num, file_id, file_name))
                 
         return pending_by_store
     except Exception as e:
@@ -120,18 +140,7 @@ def get_pending_uploads():
 
 def mark_rows_done(row_nums, status="PART1_DONE"):
     """Updates multiple rows to a status."""
-    service = get_service('sheets', 'v4')
-    data = []
-    for r in row_nums:
-        data.append({
-            "range": f"Sheet1!D{r}",
-            "values": [[status]]
-        })
-    
-    if data:
-        body = {"valueInputOption": "RAW", "data": data}
-        service.spreadsheets().values().batchUpdate(
-            spreadsheetId=TRACKING_SHEET_ID, body=body).execute()
+    set_row_statuses(TRACKING_SHEET_ID, {r: status for r in row_nums})
 
 # ==============================================================================
 # FILE HELPERS
@@ -148,47 +157,48 @@ def get_month_folder_name(filename):
         return datetime.date(year, month, 1).strftime('%B %Y')
     return None
 
-def get_file_content(file_id):
+def parsed_cost(headers, blocks):
+    """Rough memory held by a parsed file: its line strings plus per-line and per-block overhead."""
+    lines = sum(len(block['lines']) for block in blocks) + len(headers)
+    chars = sum(len(line) for line in headers) + sum(len(line) for block in blocks for line in block['lines'])
+    return chars + lines * PARSED_LINE_OVERHEAD + len(blocks) * PARSED_BLOCK_OVERHEAD
+
+def get_file_content(file_id, size=None):
+    """
+    Returns a text stream over the downloaded file (see drive_io.open_text_stream).
+    Large files are spooled to disk; close the stream when done.
+    """
     try:
-        service = get_service()
-        request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request, chunksize=1024*1024)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        fh.seek(0)
-        return fh.read().decode('ISO-8859-1')
+        return open_text_stream(file_id, encoding='ISO-8859-1', size=size)
     except Exception:
         return None
 
-def get_or_create_subfolder(parent_id, folder_name):
-    service = get_service()
-    query = f"'{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
-    res = service.files().list(q=query, fields="files(id)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-    files = res.get('files', [])
-    if files: return files[0]['id']
-    
-    metadata = {'name': folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [parent_id]}
-    folder = service.files().create(body=metadata, fields='id', supportsAllDrives=True).execute()
-    return folder['id']
-
 # ==============================================================================
 # PARSING & CLEANING LOGIC (CORE INTELLIGENCE)
 # ==============================================================================
-def parse_pos_csv(content_str):
-    if not content_str: return None, None
-    if "Order #:" not in content_str: return None, None 
+def parse_pos_csv(content):
+    """
+    Accepts the file as a string or as a text stream. A stream is consumed
+    line by line, so only the parsed blocks are ever held in memory.
+    """
+    if not content: return None, None
+    lines = iter(content.splitlines(keepends=True) if isinstance(content, str) else content)
+
+    header_lines = list(itertools.islice(lines, 2))
+    blocks = split_blocks(lines)
+    if not any("Order #:" in line for line in header_lines) and \
+            not any("Order #:" in line for b in blocks for line in b['lines']):
+        return None, None
+    return header_lines, blocks
 
-    lines = content_str.splitlines(keepends=True)
-    header_lines = lines[:2]
+def split_blocks(lines):
+    """Groups lines into order/LOG ON blocks; each block starts at a timestamped line."""
     blocks = []
     
     current_block = {'lines': [], 'data': None}
     block_start_pattern = re.compile(r'^"?[A-Za-z]{3}\s[A-Za-z]{3}\s\d{1,2},\s\d{4}')
     
-    for i in range(2, len(lines)):
-        line = lines[i]
+    for line in lines:
         if block_start_pattern.match(line):
             if current_block['lines']:
                 blocks.append(process_block(current_block))
@@ -199,7 +209,7 @@ def parse_pos_csv(content_str):
     if current_block['lines']:
         blocks.append(process_block(current_block))
         
-    return header_lines, blocks
+    return blocks
 
 def process_block(block_dict):
     first_line = block_dict['lines'][0]
@@ -225,11 +235,59 @@ def process_block(block_dict):
     except:
         return {'id': None, 'lines': block_dict['lines'], 'is_log_on': False, 'timestamp': "Unknown"}
 
+def drop_duplicate_blocks(blocks, file_name, seen_orders):
+    """
+    Drops blocks whose order was already seen in an earlier file.
+    `seen_orders` maps order id -> first file name and is updated in place.
+    Returns (kept_blocks, deleted_details).
+    """
+    new_blocks = []
+    deleted_details = []
+    for block in blocks:
+        bid = block['id']
+        if bid:
+            if bid in seen_orders:
+                # Duplicate found
+                original_file = seen_orders[bid]
+                if original_file != file_name:
+                    timestamp, order_num = bid
+                    details = f"[{timestamp} | Order #{order_num} | Dup of: {original_file}]"
+                    deleted_details.append(details)
+                else:
+                    new_blocks.append(block)
+            else:
+                seen_orders[bid] = file_name
+                new_blocks.append(block)
+        else:
+            new_blocks.append(block)
+    return new_blocks, deleted_details
+
 def get_header_signature(blocks):
     for b in blocks:
         if not b['is_log_on'] and b['id']: return b['id']
     return None
 
+# ==============================================================================
+# DUPLICATE PRE-CHECK (BEFORE FULL DOWNLOAD)
+# ==============================================================================
+def precheck_file(store_num, file_id):
+    """
+    Returns (metadata, duplicate_of). `duplicate_of` names the earlier
+    export when this file is a byte-identical re-upload (md5Checksum); such
+    files are Full Duplicates and are never downloaded. Any other file is
+    downloaded and deduplicated against the store's order history.
+    """
+    try:
+        meta = get_file_metadata(file_id, fields="id, size, md5Checksum")
+        original = find_identical(meta.get('md5Checksum'))
+        if original:
+            incr('precheck_identical')
+            return meta, f"identical to {original}"
+        return meta, None
+    except Exception as e:
+        print(f"  ⚠️ Pre-check failed for {file_id} ({e}), processing in full")
+        return {}, None
+
 # ==============================================================================
 # CONVERSION LOGIC
 # ==============================================================================
@@ -242,19 +300,105 @@ def normalize_csv_from_string(content_str):
     output_io.seek(0)
     return output_io
 
+# ==============================================================================
+# SCHEMA CACHE
+# ==============================================================================
+# A store's export layout does not change between files. The first file is
+# converted with full inference (split every quoted column, keep the Popeye
+# _0/_1/_3/_5 columns, rename); what it found is saved per store:
+#   columns  raw column names after read_csv (the header signature)
+#   splits   {raw column: [split indices kept]}
+#   keep     kept columns, in output order, before renaming
+#   rename   the rename map
+# Later files with the same raw columns split only those columns, and only
+# up to the last kept index. Any mismatch falls back to full inference.
+SPLIT_DELIMITER = '"'
+KEEP_PATTERN = r'(?i).*Popeye.*(_0|_1|_3|_5)$'
+_schemas = None
+_schemas_lock = threading.Lock()
+
+def get_schema(store_num):
+    global _schemas
+    with _schemas_lock:
+        if _schemas is None:
+            _schemas = load_state(SCHEMAS_NAME, {})
+        return _schemas.get(str(store_num))
+
+def set_schema(store_num, schema):
+    with _schemas_lock:
+        if _schemas.get(str(store_num)) != schema:
+            _schemas[str(store_num)] = schema
+            save_state(SCHEMAS_NAME, _schemas)
+            incr('schemas_learned')
+
+def infer_columns(df):
+    """Full inference. Returns (kept and renamed df, schema), or (None, None) when nothing matches."""
+    raw_columns = [str(c) for c in df.columns]
+    splits = {}
+    for col in list(df.columns):
+        if df[col].dtype == 'object':
+            if df[col].str.contains(SPLIT_DELIMITER).any():
+                df_split = df[col].str.split(SPLIT_DELIMITER, expand=True)
+                df_split.columns = [f'{col}_split_{i}' for i in range(len(df_split.columns))]
+                df = pd.concat([df, df_split], axis=1)
+                splits[col] = []
+
+    cols_to_keep = [c for c in df.columns if re.search(KEEP_PATTERN, c)]
+    if not cols_to_keep: return None, None
+    df = df[cols_to_keep]
+
+    rename_map = {}
+    for col in df.columns:
+        if '_split_' in col:
+            parts = col.split('_split_')
+            orig = parts[0]
+            suffix = parts[-1]
+            nums = re.findall(r'\d+', orig)
+            if nums: rename_map[col] = f'POPEYES # {nums[-1]}_split_{suffix}'
+            if orig in splits: splits[orig].append(int(suffix))
+    df = df.rename(columns=rename_map)
+
+    return df, {'columns': raw_columns, 'splits': splits, 'keep': cols_to_keep, 'rename': rename_map}
+
+def apply_schema(df, schema):
+    """Cached path. Returns the kept and renamed df, or None when the file does not fit the schema."""
+    if [str(c) for c in df.columns] != schema['columns']:
+        return None
+    pieces = {}
+    for col in df.columns:
+        indices = schema['splits'].get(col)
+        if indices is None:
+            # A newly quoted column would add split columns of its own
+            if re.search(r'(?i)popeye', str(col)) and df[col].str.contains(SPLIT_DELIMITER).any(): return None
+            pieces[col] = df[col]
+            continue
+        if not indices: return None
+        # Too few pieces (e.g. no quotes at all) means the layout changed
+        df_split = df[col].str.split(SPLIT_DELIMITER, n=max(indices) + 1, expand=True)
+        if df_split.shape[1] <= max(indices): return None
+        for i in indices:
+            pieces[f'{col}_split_{i}'] = df_split[i]
+    if any(c not in pieces for c in schema['keep']):
+        return None
+    return pd.DataFrame({c: pieces[c] for c in schema['keep']}).rename(columns=schema['rename'])
+
 def convert_to_final_format(content_str, file_name):
     try:
-        normalized_io = normalize_csv_from_string(content_str)
-        df = pd.read_csv(normalized_io, delimiter='\t', on_bad_lines='skip', encoding='utf-8')
+        store_num = get_store_number(file_name)
+        schema = get_schema(store_num) if SCHEMA_CACHE_ENABLED else None
 
-        def split_text_in_columns(df, delimiter='"'):
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    if df[col].str.contains(delimiter).any():
-                        df_split = df[col].str.split(delimiter, expand=True)
-                        df_split.columns = [f'{col}_split_{i}' for i in range(len(df_split.columns))]
-                        df = pd.concat([df, df_split], axis=1)
-            return df
+        normalized_io = normalize_csv_from_string(content_str)
+        df = None
+        if schema:
+            # Known layout: fixed string dtype, no type inference
+            df = apply_schema(pd.read_csv(normalized_io, delimiter='\t', on_bad_lines='skip', encoding='utf-8', dtype=str), schema)
+            incr('schema_hits' if df is not None else 'schema_mismatches')
+            normalized_io.seek(0)
+        if df is None:
+            df, learned = infer_columns(pd.read_csv(normalized_io, delimiter='\t', on_bad_lines='skip', encoding='utf-8'))
+            if df is None: return None
+            if SCHEMA_CACHE_ENABLED:
+                set_schema(store_num, learned)
 
         def check_m(string):
             s = str(string)
@@ -262,24 +406,8 @@ def convert_to_final_format(content_str, file_name):
             if re.search(r'[A-Za-z]{3}\s+[A-Za-z]{3}\s+\d{1,2},\s+\d{4}\s+\d{1,2}:\d{2}:\d{2}', s): return "y"
             return "n"
 
-        df = split_text_in_columns(df)
-        pattern = r'(?i).*Popeye.*(_0|_1|_3|_5)$'
-        cols_to_keep = [c for c in df.columns if re.search(pattern, c)]
-        if not cols_to_keep: return None 
-        df = df[cols_to_keep]
-
-        rename_map = {}
-        for col in df.columns:
-            if '_split_' in col:
-                parts = col.split('_split_')
-                orig = parts[0]
-                suffix = parts[-1]
-                nums = re.findall(r'\d+', orig)
-                if nums: rename_map[col] = f'POPEYES # {nums[-1]}_split_{suffix}'
-        df.rename(columns=rename_map, inplace=True)
-
+        col0 = [c for c in df.columns if re.search(r'(?i)popeye.*_0$', c)]
         if not df.empty:
-            col0 = [c for c in df.columns if re.search(r'(?i)popeye.*_0$', c)]
             if col0:
                 target = col0[0]
                 df['flag'] = df[target].apply(check_m)
@@ -287,14 +415,15 @@ def convert_to_final_format(content_str, file_name):
                 df['group'] = df['rn'].where(df['flag'] == 'y').ffill().fillna(1)
                 valid_indices = df['group'].astype(int) - 1
                 valid_indices = valid_indices.clip(0, len(df)-1)
-                dt_vals = df[target].iloc[valid_indices].values
-                pos = df.columns.get_loc(target)
-                df.insert(pos, 'Date_time', dt_vals)
                 df.drop(columns=['flag','rn','group'], inplace=True, errors='ignore')
 
         obj_cols = df.select_dtypes(include=['object']).columns
         for col in obj_cols: df[col] = df[col].str.replace(r'\s+,', ',', regex=True)
 
+        if col0 and not df.empty:
+            # Date_time is a gather of the cleaned _0 column (no second replace pass)
+            df.insert(df.columns.get_loc(target), 'Date_time', df[target].iloc[valid_indices].values)
+
         output_buffer = io.StringIO()
         df.to_csv(output_buffer, index=False)
         return output_buffer.getvalue()
@@ -305,8 +434,12 @@ def convert_to_final_format(content_str, file_name):
 # ==============================================================================
 # LOGIC: PROCESSING A STORE (Batch Context)
 # ==============================================================================
-def process_store_batch(store_num, pending_items):
+def process_store_batch(store_num, pending_items, mark_done=True):
     """
+    `pending_items` are (row_num, file_id, file_name). Returns the row_nums
+    that were processed; with mark_done those rows are set to PART1_DONE
+    (backfill passes False and uses the slot for its own keys).
+
     1. Downloads ALL relevant files for this store (Historical Context + New Pending).
        Note: For optimization in GitHub Actions, we can't download *everything* if the history is huge.
        However, to satisfy the requirement "Duplication logic... must check among all months",
@@ -339,67 +472,76 @@ def process_store_batch(store_num, pending_items):
     
     print(f"\n📍 Processing Store {store_num} with {len(pending_items)} pending files...")
     
-    # 1. Download & Parse ALL pending files
-    parsed_files = []
-    
-    def load_task(item):
+    # Files are handled one at a time in name order (the first file holding an
+    # order keeps it); downloads and parsing run ahead on the pool within the
+    # memory budget, and each file's reservation is held until it is written
+    items = sorted(pending_items, key=lambda item: item[2])
+
+    # 1. Pre-check (metadata only: byte-identical re-uploads)
+    def check(item):
+        with timer('part1.precheck'):
+            return precheck_file(store_num, item[1])
+
+    checks = list(get_executor().map(check, items))
+
+    # Orders of the files done so far: the store's history, or a batch-only one
+    history = load_history(store_num)
+    seen = history if history is not None else OrderHistory(store_num)
+    seen_ids = {}
+
+    def load_task(item, meta, hold):
         row_num, file_id, file_name = item
-        content = get_file_content(file_id)
+        size = int(meta['size']) if meta.get('size') else None
+        with timer('part1.download'):
+            content = get_file_content(file_id, size=size)
         if not content:
             add_log(store_num, "Unknown", file_name, "Download Failed", "Yes")
             return None
-        
-        headers, blocks = parse_pos_csv(content)
+
+        with timer('part1.parse'):
+            with content:
+                headers, blocks = parse_pos_csv(content)
         if headers is None:
             add_log(store_num, get_month_folder_name(file_name), file_name, "N/A", "Yes (Invalid Structure)")
             return None
-            
+        # From here on the reservation covers the parsed blocks, not the download
+        hold['bytes'] = memory_budget.adjust(hold['bytes'], parsed_cost(headers, blocks))
+
+        incr('files_parsed')
+        incr('blocks_parsed', len(blocks))
         return {
             'file_id': file_id,
             'file_name': file_name,
             'row_num': row_num,
+            'md5': meta.get('md5Checksum'),
             'headers': headers,
             'blocks': blocks,
             'header_sig': get_header_signature(blocks)
         }
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        results = list(executor.map(load_task, pending_items))
-        parsed_files = [r for r in results if r]
-
-    # 2. Sort chronologically/alphabetically
-    parsed_files.sort(key=lambda x: x['file_name'])
-
-    # 3. Deduplicate
-    seen_orders = {}
-    
     # Get or Create Store Folder in Destination
-    store_folder_id = get_or_create_subfolder(CONVERTED_FOLDER_ID, store_num)
+    store_folder_id = get_or_create_folder(CONVERTED_FOLDER_ID, store_num)
     
     processed_rows = []
-    
-    for pf in parsed_files:
+    parsed_any = False
+
+    def handle(pf):
+        nonlocal parsed_any
+        if 'duplicate_of' in pf:
+            # Full Duplicate found before download (identical md5): no conversion, no upload
+            add_log(store_num, get_month_folder_name(pf['file_name']), pf['file_name'],
+                    f"Yes ({pf['duplicate_of']})", "Yes (Full Duplicate/Empty)")
+            incr('files_full_duplicate')
+            remember(store_num, pf['file_name'], pf['md5'])
+            processed_rows.append(pf['row_num'])
+            return
+        parsed_any = True
+
+        # 3. Deduplicate against the store's history and the files before it
+        with timer('part1.dedup'):
+            [(new_blocks, deleted_details, order_keys, new_ids)] = dedup_files([(pf['file_name'], pf['blocks'])], seen, seen_ids)
         month = get_month_folder_name(pf['file_name'])
-        new_blocks = []
-        deleted_details = []
-        
-        for block in pf['blocks']:
-            bid = block['id']
-            if bid:
-                if bid in seen_orders:
-                    # Duplicate found
-                    original_file = seen_orders[bid]
-                    if original_file != pf['file_name']:
-                        timestamp, order_num = bid
-                        details = f"[{timestamp} | Order #{order_num} | Dup of: {original_file}]"
-                        deleted_details.append(details)
-                    else:
-                        new_blocks.append(block)
-                else:
-                    seen_orders[bid] = pf['file_name']
-                    new_blocks.append(block)
-            else:
-                new_blocks.append(block)
+        incr('duplicates_dropped', len(deleted_details))
         
         real_orders = any(b['id'] for b in new_blocks)
         
@@ -407,42 +549,57 @@ def process_store_batch(store_num, pending_items):
             # Full Duplicate / Empty
             msg = f"Yes ({len(deleted_details)} deleted)" if deleted_details else "No"
             status = "Yes (Full Duplicate/Empty)"
-            add_log(store_num, month, pf['file_name'], msg, status)
+            add_log(store_num, month, pf['file_name'], msg, status, details=deleted_details)
+            incr('files_full_duplicate')
+            remember(store_num, pf['file_name'], pf['md5'])
+            seen.add(order_keys, pf['file_name'])
+            seen_ids.update(new_ids)
             # Mark as done but don't upload
             processed_rows.append(pf['row_num'])
-            continue
+            return
             
         # Partial Clean or Clean
         cleaned_content = "".join(pf['headers']) + "".join(["".join(b['lines']) for b in new_blocks])
         
-        ts_status = "\n".join(deleted_details) if deleted_details else "No"
-        if len(ts_status) > 49000: ts_status = ts_status[:49000] + "\n... [TRUNCATED]"
-        
-        add_log(store_num, month, pf['file_name'], ts_status, "No")
+        ts_status = summarize_details(deleted_details) if deleted_details else "No"
+        add_log(store_num, month, pf['file_name'], ts_status, "No", details=deleted_details)
         
         # 4. Convert & Upload
-        csv_output = convert_to_final_format(cleaned_content, pf['file_name'])
+        with timer('part1.convert'):
+            csv_output = convert_to_final_format(cleaned_content, pf['file_name'])
         
         if csv_output:
             # Upload
             month_name = get_month_folder_name(pf['file_name'])
-            target_id = get_or_create_subfolder(store_folder_id, month_name) if month_name else store_folder_id
+            target_id = get_or_create_folder(store_folder_id, month_name) if month_name else store_folder_id
             output_name = "converted_" + pf['file_name']
             
-            # Check exist (optional, but good for safety)
-            service = get_service()
-            existing = service.files().list(
-                q=f"'{target_id}' in parents and name='{output_name}' and trashed=false",
-                fields="files(id)", supportsAllDrives=True, includeItemsFromAllDrives=True
-            ).execute().get('files', [])
-            
-            if not existing:
-                media = MediaIoBaseUpload(io.BytesIO(csv_output.encode('utf-8')), mimetype='text/csv')
-                service.files().create(
-                    body={'name': output_name, 'parents': [target_id]},
-                    media_body=media, supportsAllDrives=True
-                ).execute()
-                print(f"✅ Uploaded: {output_name}")
+            with timer('part1.upload'):
+                if artifacts.enabled():
+                    _, action, uploaded_name = artifacts.upload_compressed(target_id, output_name,
+                                                                           lambda out: out.write(csv_output))
+                else:
+                    _, action = upsert_file(target_id, output_name, 'text/csv', data=csv_output.encode('utf-8'))
+                    uploaded_name = output_name
+            incr('files_converted')
+            remember(store_num, pf['file_name'], pf['md5'])
+            seen.add(order_keys, pf['file_name'])
+            seen_ids.update(new_ids)
+            if action == 'unchanged':
+                print(f"⏭️ Unchanged: {uploaded_name}")
+            else:
+                print(f"✅ Uploaded ({action}): {uploaded_name}")
+
+            # Typed Parquet copy for part2 (optional; the CSV stays authoritative)
+            if sidecars_enabled():
+                try:
+                    with timer('part1.sidecar'):
+                        parquet = to_parquet_bytes(csv_output)
+                        if parquet:
+                            upsert_file(target_id, sidecar_name(output_name), PARQUET_MIMETYPE, data=parquet)
+                            incr('sidecars_written')
+                except Exception as e:
+                    print(f"  ⚠️ Parquet sidecar skipped for {output_name}: {e}")
             
             processed_rows.append(pf['row_num'])
         else:
@@ -450,9 +607,47 @@ def process_store_batch(store_num, pending_items):
             # Mark failed in sheet? Or skip? Let's mark done to avoid loops, log captures error.
             processed_rows.append(pf['row_num'])
 
+    # 2. Download & parse ahead, handle in order. A file is only started when
+    # its download fits the budget next to the files already loaded;
+    # otherwise the oldest one is handled first, which frees its share.
+    pending = collections.deque()
+
+    def finish_oldest():
+        future, hold = pending.popleft()
+        try:
+            pf = future.result()
+            if pf:
+                handle(pf)
+        finally:
+            memory_budget.release(hold['bytes'])
+
+    for item, (meta, duplicate_of) in zip(items, checks):
+        if duplicate_of:
+            row_num, _, file_name = item
+            handle({'row_num': row_num, 'file_name': file_name, 'duplicate_of': duplicate_of,
+                    'md5': meta.get('md5Checksum')})
+            continue
+        cost = download_cost(int(meta['size']) if meta.get('size') else None)
+        held = memory_budget.try_acquire(cost)
+        while held is None and pending:
+            finish_oldest()
+            held = memory_budget.try_acquire(cost)
+        if held is None:
+            # Nothing of this batch is loaded: wait for other threads' downloads
+            held = memory_budget.acquire(cost)
+        hold = {'bytes': held}
+        pending.append((get_executor().submit(load_task, item, meta, hold), hold))
+    while pending:
+        finish_oldest()
+
+    save_fingerprints()
+    if history is not None and parsed_any:
+        history.save()
+
     # Update Tracking Sheet for this batch
-    if processed_rows:
+    if processed_rows and mark_done:
         mark_rows_done(processed_rows, "PART1_DONE")
+    return processed_rows
 
 # ==============================================================================
 # MAIN EXECUTION
@@ -461,7 +656,8 @@ def main():
     print("🚀 Starting GitHub Actions Cleanup Workflow...")
     
     # 1. Read Tracking Sheet
-    pending_by_store = get_pending_uploads()
+    with timer('part1.read_tracking'):
+        pending_by_store = get_pending_uploads()
     
     if not pending_by_store:
         print("✅ No 'UPLOADED' files found in tracking sheet.")
@@ -469,11 +665,38 @@ def main():
 
     print(f"📦 Found {sum(len(v) for v in pending_by_store.values())} files across {len(pending_by_store)} stores.")
 
-    # 2. Process per Store (to enable deduplication context)
-    for store_num, items in pending_by_store.items():
-        process_store_batch(store_num, items)
-        flush_logs_to_sheet()
+    # 2. Process per Store (to enable deduplication context), biggest first;
+    # stores that would overrun the time budget stay UPLOADED for the next run
+    with timer('part1.sizes'):
+        sizes = get_file_sizes(file_id for items in pending_by_store.values() for _, file_id, _ in items)
+    plan = Schedule('part1')
+    units = {store_num: (items, sum(sizes.get(file_id) or 0 for _, file_id, _ in items))
+             for store_num, items in pending_by_store.items()}
+    for store_num in plan.ordered(units):
+        if not plan.admit(store_num):
+            continue
+        items = pending_by_store[store_num]
+        # Lease the store's rows; rows a concurrent run claimed first are left to it
+        owned = set(claim_rows(TRACKING_SHEET_ID, [row_num for row_num, _, _ in items],
+                                    expected_statuses={"UPLOADED"}))
+        items = [item for item in items if item[0] in owned]
+        if not items:
+            print(f"⏭️ Store {store_num} is being processed by another run.")
+            plan.release(store_num)
+            continue
+
+        with plan.running(store_num), timer('part1.store'):
+            processed_rows = process_store_batch(store_num, items)
+        # Failed downloads stay UPLOADED; drop our lease so the next run retries them
+        release_rows(TRACKING_SHEET_ID, owned - set(processed_rows))
+    plan.finish()
+
+    # One Log Sheet append for the whole run
+    flush_logs_to_sheet()
 
+    report_client_stats()
+    report_api_stats()
+    write_summary('part1')
     print("🏁 Workflow Complete.")
 
 if __name__ == "__main__":
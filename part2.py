@@ -1,83 +1,109 @@
 # part2.py
 import os
-import io
-import re
 import pandas as pd
 from datetime import datetime, timedelta
 import dateutil.parser
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+import ledger
+import artifacts
+import rollup
+from scheduler import Schedule
 from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
-import json
-import datetime as dt_module
+from google_clients import get_service, execute, report_client_stats, report_api_stats
+from metrics import timer, incr, write_summary
+from state import load_state, save_state
+from drive_io import find_file, find_folder, upsert_file, budgeted_download, get_or_create_folder
+from sidecar import enabled as sidecars_enabled, find_sidecar, read_sidecar
+from part1 import CONVERTED_FOLDER_ID, get_store_number, get_month_folder_name
+from tracking import SALES_TRACKING_SHEET_ID, read_tracking_rows, set_row_statuses, claim_rows, is_leased_by_other, in_shard
 
 # ================= CONFIGURATION =================
 SOURCE_ROOT_ID = "16edTsOusrYf-5LqRgiGqIwMn94H6yzsE"
 DEST_ROOT_ID = "1tlPuBOhnxjQJ_kIGo7-WW6TjG2mxfbgr"
-TRACKING_SHEET_ID = "1r872UNCcsgkdEkV9Y9PnNcuTtPrezs0XE3n8HFZgqyM"
-
-SERVICE_ACCOUNT_JSON = json.loads(os.environ['SERVICE_ACCOUNT_KEY'])
-
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-
-creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_JSON, scopes=SCOPES)
-drive_service = build('drive', 'v3', credentials=creds)
-sheets_service = build('sheets', 'v4', credentials=creds)
+TRACKING_SHEET_ID = SALES_TRACKING_SHEET_ID  # see tracking.STAGE_TRACKING
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# One workbook per store and business month ({store}_{YYYY-MM}_Consolidated_data.xlsx)
+# plus {store}_Summary.xlsx; set to 0 for the single {store}_Consolidated_data.xlsx
+MONTHLY_WORKBOOKS = os.environ.get('POPEYES_MONTHLY_WORKBOOKS', '1') != '0'
+# 'wide': one column per item code/description on the per-transaction sheets.
+# 'long': those sheets list (Date_file, Date_time, code, description, qty,
+# amount, total) rows; only the daily summary sheets stay wide.
+PIVOT_LAYOUT = os.environ.get('POPEYES_PIVOT_LAYOUT', 'wide')
+# Which source files' rows each month workbook already holds, for batches
+# that failed part-way (see process_store_batch)
+PROGRESS_NAME = "part2_progress.json"
+# Source tag of the rows carried over from the single workbook
+LEGACY_SOURCE = "__legacy__"
+
+# Credentials and API clients live in google_clients (built once, reused per call)
 
 # ================= TRACKING HELPERS =================
 def get_part1_done_files():
+    """Returns [(row_num, file_id, file_name)] for unleased rows ready for consolidation."""
     try:
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=TRACKING_SHEET_ID,
-            range="Sheet1!A:D"
-        ).execute()
-        rows = result.get('values', [])
-        if len(rows) <= 1:
-            return []
+        # Watched statuses for the cursor are listed in tracking.STAGE_TRACKING
+        rows = read_tracking_rows(TRACKING_SHEET_ID, 'part2')
         candidates = []
-        for row in rows[1:]:
-            if len(row) >= 4 and row[3] == "PART1_DONE":
+        for row_num, row in rows:
+            if len(row) < 4 or is_leased_by_other(row):
+                continue
+            # A claimed row with no live lease belongs to a run that died mid-way
+            if row[3] == "PART1_DONE" or row[3] == "PART2_CLAIMED":
                 file_id = row[0]
                 file_name = row[1] if len(row) > 1 else "Unknown"
-                candidates.append((file_id, file_name))
+                candidates.append((row_num, file_id, file_name))
         return candidates
     except Exception as e:
         print(f"Error reading tracking sheet: {e}")
         return []
 
-def log_to_sheet(file_id, file_name, stage):
-    timestamp = dt_module.datetime.now().isoformat()
-    body = {'values': [[file_id, file_name, timestamp, stage]]}
-    sheets_service.spreadsheets().values().append(
-        spreadsheetId=TRACKING_SHEET_ID,
-        range="Sheet1!A:D",
-        valueInputOption="RAW",
-        body=body
-    ).execute()
-
 # ================= DRIVE HELPERS =================
-def get_or_create_folder(parent_id, folder_name):
-    query = f"'{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
-    results = drive_service.files().list(q=query, fields="files(id)").execute()
-    files = results.get('files', [])
-    if files:
-        return files[0]['id']
-    metadata = {'name': folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [parent_id]}
-    folder = drive_service.files().create(body=metadata, fields='id').execute()
-    print(f"Created folder: {folder_name}")
-    return folder['id']
-
-def download_csv_to_df(file_id):
-    request = drive_service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    fh.seek(0)
-    return pd.read_csv(fh, dtype=str, low_memory=False)
+def download_csv_to_df(file_id, size=None):
+    # Parsed straight from the buffer (a temp file when the CSV is large)
+    with budgeted_download(file_id, size=size) as fh:
+        return pd.read_csv(fh, dtype=str, low_memory=False)
+
+def converted_folder(file_name):
+    """part1's output folder for a source export (store, then month), or None if it has none."""
+    store_folder_id = find_folder(CONVERTED_FOLDER_ID, get_store_number(file_name))
+    month_name = get_month_folder_name(file_name)
+    if store_folder_id is None or not month_name:
+        return store_folder_id
+    return find_folder(store_folder_id, month_name)
+
+def load_converted_df(file_name):
+    """
+    Reads part1's output for a source export from its converted folder:
+    the typed Parquet sidecar when there is one, then the compressed
+    converted CSV (POPEYES_ARTIFACT_COMPRESSION), then converted_<name>.csv.
+    Returns None when part1 wrote no output (full duplicate or empty file).
+    """
+    folder_id = converted_folder(file_name)
+    if folder_id is None:
+        return None
+    output_name = "converted_" + file_name
+    if sidecars_enabled():
+        try:
+            sidecar = find_sidecar(folder_id, file_name)
+            if sidecar:
+                df = read_sidecar(sidecar)
+                incr('sidecars_read')
+                return df
+        except Exception as e:
+            print(f"Sidecar unavailable for {file_name} ({e}), reading CSV")
+    if artifacts.enabled():
+        try:
+            artifact = artifacts.find_compressed(folder_id, output_name)
+            if artifact:
+                df = artifacts.download_csv(artifact, dtype=str, low_memory=False)
+                incr('compressed_artifacts_read')
+                return df
+        except Exception as e:
+            print(f"Compressed CSV unavailable for {file_name} ({e}), reading CSV")
+    converted = find_file(folder_id, output_name, fields="id, size")
+    if not converted:
+        return None
+    return download_csv_to_df(converted['id'], size=int(converted.get('size') or 0) or None)
 
 def get_date_file_logic(dt):
     if pd.isna(dt):
@@ -88,152 +114,400 @@ def get_date_file_logic(dt):
     else:
         return (dt - timedelta(days=1)).strftime('%m/%d/%Y').lower()
 
-# ================= FULL CONSOLIDATION LOGIC (Your Original) =================
-def process_store_batch(store_name, files_list, dest_folder_id):
-    print(f"Consolidating {len(files_list)} file(s) for store: {store_name}")
-
-    try:
-        df_list = []
-        for file_id, _ in files_list:
-            df_temp = download_csv_to_df(file_id)
-            df_temp['filename'] = "temp"
-            df_temp.columns = df_temp.columns.str.strip()
-
-            if 'Date_time' in df_temp.columns:
-                df_temp['Date_time'] = df_temp['Date_time'].str.replace(',', '', regex=False)
-                df_temp['Date_time'] = df_temp['Date_time'].apply(lambda x: dateutil.parser.parse(x) if pd.notnull(x) else pd.NaT)
-                df_temp['Date_file'] = df_temp['Date_time'].apply(get_date_file_logic)
-                df_temp['display_date'] = (df_temp['Date_time'] - pd.Timedelta(minutes=1)).dt.strftime('%m/%d/%Y %I:%M%p').str.upper()
-                df_temp.insert(0, 'Date_file', df_temp.pop('Date_file'))
-                df_list.append(df_temp)
-
-        if not df_list:
-            return
-
-        df_new = pd.concat(df_list, ignore_index=True)
-
-        split_0_col = [c for c in df_new.columns if c.endswith('_split_0')][0]
-        split_1_col = [c for c in df_new.columns if c.endswith('_split_1')][0]
-        split_3_col = [c for c in df_new.columns if c.endswith('_split_3')][0]
-        split_5_col = [c for c in df_new.columns if c.endswith('_split_5')][0]
-
-        prefix = split_0_col.replace('_split_0', '')
-        split_35_col = prefix + '_split_35'
-
-        df_new[split_5_col] = pd.to_numeric(df_new[split_5_col], errors='coerce')
-        df_new[split_3_col] = pd.to_numeric(df_new[split_3_col], errors='coerce')
-        df_new[split_35_col] = df_new[split_5_col] * df_new[split_3_col]
-
-        output_filename = f"{store_name}_Consolidated_data.xlsx".replace(" ", "_")
-        local_path = f"/tmp/{output_filename}"
-
-        existing = drive_service.files().list(
-            q=f"'{dest_folder_id}' in parents and name='{output_filename}' and trashed=false",
-            fields="files(id)"
-        ).execute().get('files', [])
-
-        if existing:
-            print("Updating existing consolidated file")
-            existing_id = existing[0]['id']
-            req = drive_service.files().get_media(fileId=existing_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, req)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-            fh.seek(0)
-            df_existing = pd.read_excel(fh, sheet_name='Data')
-            df_full = pd.concat([df_existing, df_new], ignore_index=True)
-        else:
-            print("Creating new consolidated file")
-            df_full = df_new
+def add_date_columns(df_temp):
+    """
+    Parses Date_time on a converted part1 CSV and adds Date_file (business
+    day, rolling over at 3am) and display_date. Returns None when the file
+    has no Date_time column.
+    """
+    df_temp['filename'] = "temp"
+    df_temp.columns = df_temp.columns.str.strip()
+    if 'Date_time' not in df_temp.columns:
+        return None
+    # Parquet sidecars already carry Date_time as timestamps
+    if not pd.api.types.is_datetime64_any_dtype(df_temp['Date_time']):
+        df_temp['Date_time'] = df_temp['Date_time'].str.replace(',', '', regex=False)
+        df_temp['Date_time'] = df_temp['Date_time'].apply(lambda x: dateutil.parser.parse(x) if pd.notnull(x) else pd.NaT)
+    df_temp['Date_file'] = df_temp['Date_time'].apply(get_date_file_logic)
+    df_temp['display_date'] = (df_temp['Date_time'] - pd.Timedelta(minutes=1)).dt.strftime('%m/%d/%Y %I:%M%p').str.upper()
+    df_temp.insert(0, 'Date_file', df_temp.pop('Date_file'))
+    return df_temp
+
+def add_line_totals(df_new):
+    """
+    Makes quantity (_split_3) and amount (_split_5) numeric and adds their
+    product as _split_35. Returns the item, name, amount and total columns.
+    """
+    split_0_col = [c for c in df_new.columns if c.endswith('_split_0')][0]
+    split_1_col = [c for c in df_new.columns if c.endswith('_split_1')][0]
+    split_3_col = [c for c in df_new.columns if c.endswith('_split_3')][0]
+    split_5_col = [c for c in df_new.columns if c.endswith('_split_5')][0]
+
+    prefix = split_0_col.replace('_split_0', '')
+    split_35_col = prefix + '_split_35'
+
+    df_new[split_5_col] = pd.to_numeric(df_new[split_5_col], errors='coerce')
+    df_new[split_3_col] = pd.to_numeric(df_new[split_3_col], errors='coerce')
+    df_new[split_35_col] = df_new[split_5_col] * df_new[split_3_col]
+    return split_0_col, split_1_col, split_5_col, split_35_col
+
+def pivot_categories():
+    """Item codes per category sheet: {sheet_name: [split_0 codes]}."""
+    # === ALL YOUR PIVOT TABLES ===
+    categories = [ '10000000,', '30000000,', '30004001,', '30004002,', '30004003,', '30004004,', '30006007,', '30004029,', '30009100,', '30009101,', '30009102,', '30009103,', '30009112,', '30009113,', '30009114,', '30009115,', '30009131,', '40001001,', '40001002,', '40001003,', '40002002,', '7019900,', '40001004', '30009123,', '30009120,', '30009122,', '30009121,', '30009129,', '30009092,', '30009093,', '30009094,', '30009095,', '30009096,', '30009097,', '30009098,', '30009099,', '30009100,', '30009101,', '30009102,', '30009103,', '30009104,', '30009105,', '30009106,', '30009107,', '30009108,', '30009109,', '30009110,', '30009111,', '30009112,', '30009113,', '30009114,', '30009115,', '30009131,', '30009132,', '30009133,', '30009134,', '30009135,', '30009136,', '30004007,', '40002010,', '19999984,', '19999980,', '7019395,', '40002001,', '9001600,', '30003010,', '40002011,', '7019910,', '30009145,', '30009146,', '30009147,', '30009148,', '30009149,', '30009150,', '30009151,', '30009152,', '30009153,', '30009154,', '30009155,', '30006006,', '30009124,', '30009125,', '30009126,', '30009129,', '30009127,', '30004055,', '30004035,', '30004035,' ]
+    categories2 = [ '30004025,', '30004024,', '30004026,', '30004027,', '20000033,', '20000030,', '20000031,', '19999999,', '20000000,', '20000005,', '20000006,', '20000010,', '20000011,', '20000015,', '30009112,', '30009113,', '30009114,', '30009115,', '30009122,', '30009123,', '30009146,', '30009149,', '30009151,', '30009154,' ]
+    categories3_bev = [ '20000002,', '29000160,', '80101,', '80102,', '80103,', '80201,', '80202,', '80203,', '80301,', '80302,', '80303,', '80601,', '80602,', '80603,' ]
+    donation_key = ['7019910,']
+
+    cc = set(categories) | set(categories2) | set(categories3_bev)
+    cc1 = list(cc)
+    cc_bev = set(categories2) | set(categories3_bev)
+    cc2 = list(cc_bev)
+    ccd = set(categories) | set(categories2)
+    ccd1 = list(ccd)
+    don = set(donation_key)
+    dona = list(don)
+
+    return {
+        'PivotTable_total': cc1,
+        'Pivot_Delv': categories2,
+        'Soda_dinein_sales': ccd1,
+        'Donation': dona,
+    }
+
+def build_pivot_tables(df_full, split_0_col, split_1_col, split_5_col, split_35_col):
+    """Returns [(sheet_name, pivot_table)] in the order they are written to the workbook."""
+    categories = pivot_categories()
+    category_filter1 = df_full[split_0_col].isin(categories['PivotTable_total'])
+    category_filter2 = df_full[split_0_col].isin(categories['Pivot_Delv'])
+    category_filter4 = df_full[split_0_col].isin(categories['Soda_dinein_sales'])
+    category_filter5 = df_full[split_0_col].isin(categories['Donation'])
+
+    filtered_df21 = df_full[category_filter1].copy()
+    pivot_table11 = filtered_df21.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=split_35_col, aggfunc="sum")
+
+    filtered_df22 = df_full[category_filter2].copy()
+    pivot_table22 = filtered_df22.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=split_5_col, aggfunc="sum")
+
+    filtered_df33 = df_full[category_filter4].copy()
+    pivot_table33 = filtered_df33.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=[split_5_col, split_35_col], aggfunc="sum")
+
+    filtered_df34 = df_full[category_filter5].copy()
+    pivot_table34 = filtered_df34.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=[split_5_col], aggfunc="sum")
+
+    pivot_table11_with_totals = pivot_table11.groupby(level=1, observed=True).apply(lambda x: x._append(x.sum().rename((x.name, 'Total'))))
+    pivot_table12_with_totals = pivot_table11.groupby(level=1, observed=True).apply(lambda x: x.sum().rename((x.name, 'Total')))
+    pivot_table22_with_totals = pivot_table22.groupby(level=1, observed=True).apply(lambda x: x._append(x.sum().rename((x.name, 'Total'))))
+    pivot_table33_with_totals = pivot_table33.groupby(level=1, observed=True).apply(lambda x: x._append(x.sum().rename((x.name, 'Total'))))
+    pivot_table34_with_totals = pivot_table34.groupby(level=1, observed=True).apply(lambda x: x.sum().rename((x.name, 'Total')))
+
+    return [
+        ('Pivot_Delv', pivot_table22_with_totals),
+        ('PivotTable_total', pivot_table11_with_totals),
+        ('Total_summary', pivot_table12_with_totals),
+        ('Donation', pivot_table34_with_totals),
+        ('Soda_dinein_sales', pivot_table33_with_totals),
+    ]
+
+# ================= LONG LAYOUT =================
+def build_long_table(df_full, split_0_col, split_1_col, split_5_col, split_35_col):
+    """
+    One row per (Date_file, Date_time, code, description) for the items of
+    every category sheet, with qty (_split_3), amount (_split_5) and total
+    (_split_35) summed in a single groupby.
+    """
+    split_3_col = split_5_col.replace('_split_5', '_split_3')
+    codes = set().union(*pivot_categories().values())
+    rows = df_full[df_full[split_0_col].isin(codes)]
+    long_df = (rows.groupby(['Date_file', 'Date_time', split_0_col, split_1_col], sort=True)
+                   [[split_3_col, split_5_col, split_35_col]].sum(min_count=1))
+    long_df.index.names = ['Date_file', 'Date_time', 'code', 'description']
+    long_df.columns = ['qty', 'amount', 'total']
+    return long_df.reset_index()
+
+def daily_wide(long_df, codes, value, split_0_col, split_1_col):
+    """Per-business-day wide table of `value` by item, as the wide pivots sum it."""
+    rows = long_df[long_df['code'].isin(codes)]
+    daily = rows.groupby(['Date_file', 'code', 'description'])[value].sum(min_count=1).unstack(['code', 'description'])
+    daily = daily.dropna(axis=1, how='all').fillna(0)
+    daily.columns.names = [split_0_col, split_1_col]
+    return daily
+
+def build_long_pivot_tables(long_df, split_0_col, split_1_col, split_5_col):
+    """Same sheets as build_pivot_tables; per-transaction sheets in long layout."""
+    categories = pivot_categories()
+
+    def transactions(sheet_name):
+        # Flat (RangeIndex) tables are written without an index: no merged cells
+        return long_df[long_df['code'].isin(categories[sheet_name])].reset_index(drop=True)
+
+    donation = pd.concat({split_5_col: daily_wide(long_df, categories['Donation'], 'amount', split_0_col, split_1_col)},
+                         axis=1)
+    return [
+        ('Pivot_Delv', transactions('Pivot_Delv')),
+        ('PivotTable_total', transactions('PivotTable_total')),
+        ('Total_summary', daily_wide(long_df, categories['PivotTable_total'], 'total', split_0_col, split_1_col)),
+        ('Donation', donation),
+        ('Soda_dinein_sales', transactions('Soda_dinein_sales')),
+    ]
+
+def customer_counts(df_full, split_0_col):
+    """
+    Customer_Count sheet: distinct order timestamps per business day
+    (Date_file) on PivotTable_total items, counted from the data rows. That
+    is the number of PivotTable_total rows per day the sheet was counted
+    from before, without the day's 'Total' row, which re-read as midnight
+    added one to the previous business day.
+    """
+    rows = df_full[df_full[split_0_col].isin(pivot_categories()['PivotTable_total'])]
+    counts = rows.groupby('Date_file')['Date_time'].nunique()
+    counts = counts[counts > 0]
+    return pd.DataFrame({'Date_only': counts.index, 'Customer_Count': counts.values, 'Total Count': counts.values})
+
+# ================= WORKBOOK NAMES =================
+def month_of(date_file):
+    """'mm/dd/yyyy' business day -> 'YYYY-MM' (None when missing)."""
+    if pd.isna(date_file):
+        return None
+    month, _, year = str(date_file).split('/')
+    return f"{year}-{month}"
+
+def workbook_name(store_name, month=None):
+    if month:
+        return f"{store_name}_{month}_Consolidated_data.xlsx".replace(" ", "_")
+    return f"{store_name}_Consolidated_data.xlsx".replace(" ", "_")
+
+def summary_name(store_name):
+    return f"{store_name}_Summary.xlsx".replace(" ", "_")
+
+def split_by_month(df):
+    """{'YYYY-MM': rows} by Date_file; undated rows go with the rows just before them."""
+    months = df['Date_file'].map(month_of).ffill().bfill()
+    return {month: part.reset_index(drop=True) for month, part in df.groupby(months, sort=True)}
+
+def read_existing_sheets(dest_folder_id, filename, sheets):
+    """
+    Downloads a workbook in `dest_folder_id` once and reads `sheets`
+    ({sheet_name: read_excel kwargs}). Returns {sheet_name: df}, or None
+    when the workbook does not exist.
+    """
+    existing = find_file(dest_folder_id, filename, fields="id, size")
+    if not existing:
+        return None
+    with budgeted_download(existing['id'], size=int(existing.get('size') or 0) or None) as fh:
+        with pd.ExcelFile(fh) as xls:
+            return {name: xls.parse(name, **kwargs) for name, kwargs in sheets.items()}
+
+def read_existing_data(dest_folder_id, filename):
+    sheets = read_existing_sheets(dest_folder_id, filename, {'Data': {}})
+    return sheets['Data'] if sheets else None
+
+def format_workbook(local_path):
+    wb = load_workbook(local_path)
+    for ws in wb.worksheets:
+        last_row = ws.max_row
+        last_col = ws.max_column
+        ws.auto_filter.ref = f"A3:{get_column_letter(last_col)}{last_row}"
+        ws.freeze_panes = "D4"
+    wb.save(local_path)
 
+# ================= FULL CONSOLIDATION LOGIC (Your Original) =================
+def write_consolidated_workbook(local_path, df_full, split_0_col, split_1_col, split_5_col, split_35_col):
+    """
+    Writes Data, the pivot sheets (PIVOT_LAYOUT) and Customer_Count.
+    Returns {sheet_name: table} for Total_summary and Customer_Count.
+    """
+    with timer('part2.write_data'):
         df_full.to_excel(local_path, sheet_name='Data', index=False)
 
-        # === ALL YOUR PIVOT TABLES ===
-        categories = [ '10000000,', '30000000,', '30004001,', '30004002,', '30004003,', '30004004,', '30006007,', '30004029,', '30009100,', '30009101,', '30009102,', '30009103,', '30009112,', '30009113,', '30009114,', '30009115,', '30009131,', '40001001,', '40001002,', '40001003,', '40002002,', '7019900,', '40001004', '30009123,', '30009120,', '30009122,', '30009121,', '30009129,', '30009092,', '30009093,', '30009094,', '30009095,', '30009096,', '30009097,', '30009098,', '30009099,', '30009100,', '30009101,', '30009102,', '30009103,', '30009104,', '30009105,', '30009106,', '30009107,', '30009108,', '30009109,', '30009110,', '30009111,', '30009112,', '30009113,', '30009114,', '30009115,', '30009131,', '30009132,', '30009133,', '30009134,', '30009135,', '30009136,', '30004007,', '40002010,', '19999984,', '19999980,', '7019395,', '40002001,', '9001600,', '30003010,', '40002011,', '7019910,', '30009145,', '30009146,', '30009147,', '30009148,', '30009149,', '30009150,', '30009151,', '30009152,', '30009153,', '30009154,', '30009155,', '30006006,', '30009124,', '30009125,', '30009126,', '30009129,', '30009127,', '30004055,', '30004035,', '30004035,' ]
-        categories2 = [ '30004025,', '30004024,', '30004026,', '30004027,', '20000033,', '20000030,', '20000031,', '19999999,', '20000000,', '20000005,', '20000006,', '20000010,', '20000011,', '20000015,', '30009112,', '30009113,', '30009114,', '30009115,', '30009122,', '30009123,', '30009146,', '30009149,', '30009151,', '30009154,' ]
-        categories3_bev = [ '20000002,', '29000160,', '80101,', '80102,', '80103,', '80201,', '80202,', '80203,', '80301,', '80302,', '80303,', '80601,', '80602,', '80603,' ]
-        donation_key = ['7019910,']
-
-        cc = set(categories) | set(categories2) | set(categories3_bev)
-        cc1 = list(cc)
-        cc_bev = set(categories2) | set(categories3_bev)
-        cc2 = list(cc_bev)
-        ccd = set(categories) | set(categories2)
-        ccd1 = list(ccd)
-        don = set(donation_key)
-        dona = list(don)
+    long_layout = PIVOT_LAYOUT == 'long'
+    with timer('part2.pivot'):
+        if long_layout:
+            long_df = build_long_table(df_full, split_0_col, split_1_col, split_5_col, split_35_col)
+            pivots = build_long_pivot_tables(long_df, split_0_col, split_1_col, split_5_col)
+        else:
+            pivots = build_pivot_tables(df_full, split_0_col, split_1_col, split_5_col, split_35_col)
 
-        category_filter1 = df_full[split_0_col].isin(cc1)
-        category_filter2 = df_full[split_0_col].isin(categories2)
-        category_filter4 = df_full[split_0_col].isin(ccd1)
-        category_filter5 = df_full[split_0_col].isin(dona)
+    with timer('part2.write_xlsx'):
+        with pd.ExcelWriter(local_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+            for sheet_name, table in pivots:
+                table.to_excel(writer, sheet_name=sheet_name, index=not isinstance(table.index, pd.RangeIndex))
 
-        filtered_df21 = df_full[category_filter1].copy()
-        pivot_table11 = filtered_df21.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=split_35_col, aggfunc="sum")
+        # Customer Count (by business day from the data rows; the wide
+        # PivotTable_total sheet's per-day Total rows are not orders)
+        result_df = customer_counts(df_full, split_0_col)
 
-        filtered_df22 = df_full[category_filter2].copy()
-        pivot_table22 = filtered_df22.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=split_5_col, aggfunc="sum")
+        with pd.ExcelWriter(local_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+            result_df.to_excel(writer, index=False, sheet_name='Customer_Count')
 
-        filtered_df33 = df_full[category_filter4].copy()
-        pivot_table33 = filtered_df33.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=[split_5_col, split_35_col], aggfunc="sum")
+        format_workbook(local_path)
+
+    return {'Total_summary': dict(pivots)['Total_summary'], 'Customer_Count': result_df}
+
+def update_summary_workbook(store_name, dest_folder_id, month_tables):
+    """
+    Replaces the rows of the rewritten months in {store}_Summary.xlsx with
+    `month_tables` ({month: {sheet: table}}); other months are kept as they are.
+    """
+    filename = summary_name(store_name)
+    local_path = f"/tmp/{filename}"
+    touched = set(month_tables)
+
+    with timer('part2.summary'):
+        existing = read_existing_sheets(dest_folder_id, filename, {
+            'Total_summary': {'header': [0, 1], 'index_col': 0},
+            'Customer_Count': {},
+        }) or {}
+
+        # Rows are replaced per business day: a rewritten month drops its old
+        # days, and any day the new tables carry replaces the existing one
+        new_total = pd.concat([t['Total_summary'] for t in month_tables.values()])
+        total = existing.get('Total_summary')
+        kept_total = [total[~total.index.map(month_of).isin(touched) & ~total.index.isin(new_total.index)]] \
+            if total is not None else []
+        total = pd.concat(kept_total + [new_total])
+        total = total[~total.index.duplicated(keep='first')]
+        total = total.loc[sorted(total.index, key=lambda d: datetime.strptime(d, '%m/%d/%Y'))]
+
+        new_counts = pd.concat([t['Customer_Count'] for t in month_tables.values()], ignore_index=True)
+        counts = existing.get('Customer_Count')
+        kept_counts = [counts[~counts['Date_only'].map(month_of).isin(touched)
+                              & ~counts['Date_only'].isin(new_counts['Date_only'])]] if counts is not None else []
+        # Summaries from older runs may hold a day twice; its first row is the real one
+        counts = pd.concat(kept_counts + [new_counts], ignore_index=True).drop_duplicates('Date_only', keep='first')
+        counts = counts.sort_values('Date_only', key=lambda s: pd.to_datetime(s, format='%m/%d/%Y')).reset_index(drop=True)
+
+        with pd.ExcelWriter(local_path, engine='openpyxl') as writer:
+            total.to_excel(writer, sheet_name='Total_summary')
+            counts.to_excel(writer, index=False, sheet_name='Customer_Count')
+        format_workbook(local_path)
+
+    with timer('part2.upload'):
+        _, action = upsert_file(dest_folder_id, filename, XLSX_MIMETYPE, path=local_path)
+    print(f"{action.capitalize()} {filename}")
+    os.remove(local_path)
+
+def process_store_batch(store_name, files_list, dest_folder_id, rebuilt_months=None):
+    """
+    Consolidates `files_list` into the store's workbooks. With MONTHLY_WORKBOOKS
+    only the months the new rows fall in are downloaded and rewritten, then
+    the summary workbook is updated. Files are read from part1's converted
+    outputs (see load_converted_df). Returns True on success, including a
+    batch with nothing to add (only Full Duplicate or empty exports, which
+    part1 writes no output for); False only when something raised.
+
+    `rebuilt_months` (backfill) is a set of months already rewritten in this
+    rebuild: other months are written from the new rows alone instead of
+    appended to, then added to the set.
+    """
+    print(f"Consolidating {len(files_list)} file(s) for store: {store_name}")
 
-        filtered_df34 = df_full[category_filter5].copy()
-        pivot_table34 = filtered_df34.pivot_table(index=['Date_time', 'Date_file'], columns=[split_0_col, split_1_col], values=[split_5_col], aggfunc="sum")
+    try:
+        progress = load_state(PROGRESS_NAME, {}) if rebuilt_months is None else None
+        written = progress.setdefault(store_name, {}) if progress is not None else {}
+        df_list = []
+        for _, file_name in files_list:
+            with timer('part2.download'):
+                df_temp = load_converted_df(file_name)
+            if df_temp is None:
+                print(f"  No converted output for {file_name} (duplicate or empty), skipping")
+                incr('converted_missing')
+                continue
+            with timer('part2.parse_dates'):
+                df_temp = add_date_columns(df_temp)
+            if df_temp is not None:
+                df_list.append(df_temp.assign(_source=file_name))
 
-        pivot_table11_with_totals = pivot_table11.groupby(level=1, observed=True).apply(lambda x: x._append(x.sum().rename((x.name, 'Total'))))
-        pivot_table12_with_totals = pivot_table11.groupby(level=1, observed=True).apply(lambda x: x.sum().rename((x.name, 'Total')))
-        pivot_table22_with_totals = pivot_table22.groupby(level=1, observed=True).apply(lambda x: x._append(x.sum().rename((x.name, 'Total'))))
-        pivot_table33_with_totals = pivot_table33.groupby(level=1, observed=True).apply(lambda x: x._append(x.sum().rename((x.name, 'Total'))))
-        pivot_table34_with_totals = pivot_table34.groupby(level=1, observed=True).apply(lambda x: x.sum().rename((x.name, 'Total')))
+        if not df_list:
+            print(f"No new rows for {store_name} (duplicate or empty exports only)")
+            return True
 
-        with pd.ExcelWriter(local_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-            pivot_table22_with_totals.to_excel(writer, sheet_name='Pivot_Delv')
-            pivot_table11_with_totals.to_excel(writer, sheet_name='PivotTable_total')
-            pivot_table12_with_totals.to_excel(writer, sheet_name='Total_summary')
-            pivot_table34_with_totals.to_excel(writer, sheet_name='Donation')
-            pivot_table33_with_totals.to_excel(writer, sheet_name='Soda_dinein_sales')
-
-        # Customer Count
-        wb = load_workbook(local_path)
-        df_pivot_total = pd.read_excel(local_path, sheet_name='PivotTable_total', header=2)
-        df_pivot_total['Date_time'] = pd.to_datetime(df_pivot_total['Date_time'], errors='coerce')
-        df_pivot_total['Date_only'] = df_pivot_total['Date_time'].apply(get_date_file_logic)
-        customer_count_df = df_pivot_total.groupby('Date_only').size().reset_index(name='Customer_Count')
-        pivot_table_cnt = pd.pivot_table(df_pivot_total, values='Date_time', index='Date_only', aggfunc='count').reset_index()
-        pivot_table_cnt.columns = ['Date_only', 'Total Count']
-        result_df = pd.merge(customer_count_df, pivot_table_cnt, on='Date_only', how='left')
+        df_new = pd.concat(df_list, ignore_index=True)
 
-        with pd.ExcelWriter(local_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-            result_df.to_excel(writer, index=False, sheet_name='Customer_Count')
+        split_0_col, split_1_col, split_5_col, split_35_col = add_line_totals(df_new)
+        incr('rows_consolidated', len(df_new))
 
-        # Formatting
-        wb = load_workbook(local_path)
-        for ws in wb.worksheets:
-            last_row = ws.max_row
-            last_col = ws.max_column
-            ws.auto_filter.ref = f"A3:{get_column_letter(last_col)}{last_row}"
-            ws.freeze_panes = "D4"
-        wb.save(local_path)
-
-        # Upload
-        media = MediaFileUpload(local_path, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        if existing:
-            drive_service.files().update(fileId=existing_id, media_body=media).execute()
-            print(f"Updated {output_filename}")
+        if not MONTHLY_WORKBOOKS:
+            partitions = {None: df_new}
         else:
-            drive_service.files().create(body={'name': output_filename, 'parents': [dest_folder_id]}, media_body=media).execute()
-            print(f"Created {output_filename}")
-
-        os.remove(local_path)
+            partitions = split_by_month(df_new)
+            # First monthly run for a store: carry the single workbook's rows over
+            if rebuilt_months is None and not find_file(dest_folder_id, summary_name(store_name)):
+                with timer('part2.load_existing'):
+                    df_legacy = read_existing_data(dest_folder_id, workbook_name(store_name))
+                if df_legacy is not None:
+                    print(f"Splitting {workbook_name(store_name)} into monthly workbooks")
+                    df_legacy = df_legacy.assign(_source=LEGACY_SOURCE)
+                    for month, rows in split_by_month(df_legacy).items():
+                        partitions[month] = pd.concat([rows, partitions[month]], ignore_index=True) if month in partitions else rows
+
+        month_tables = {}
+        rollup_rows = []
+        for month, df_month in partitions.items():
+            output_filename = workbook_name(store_name, month)
+            local_path = f"/tmp/{output_filename}"
+            # Appends are not idempotent: rows of files a failed earlier attempt
+            # already wrote into this month are not appended again
+            month_key = month or 'all'
+            done_sources = set(written.get(month_key, []))
+            df_month = df_month[~df_month['_source'].isin(done_sources)]
+            sources = sorted(df_month['_source'].unique())
+            df_month = df_month.drop(columns='_source')
+
+            df_existing = None
+            if rebuilt_months is None or month in rebuilt_months:
+                with timer('part2.load_existing'):
+                    df_existing = read_existing_data(dest_folder_id, output_filename)
+            if df_existing is not None:
+                print(f"Updating {output_filename}")
+                df_full = pd.concat([df_existing, df_month], ignore_index=True)
+            else:
+                print(f"Creating {output_filename}")
+                df_full = df_month
+
+            month_tables[month] = write_consolidated_workbook(local_path, df_full, split_0_col, split_1_col,
+                                                              split_5_col, split_35_col)
+            if rollup.enabled():
+                rollup_rows.append(rollup.daily_rows(store_name, df_full, split_0_col, split_5_col, split_35_col,
+                                                     pivot_categories()))
+
+            if not sources:
+                # Written by an earlier attempt; its tables still go into the summary
+                os.remove(local_path)
+                continue
+
+            # Upload (in place when the workbook already exists)
+            with timer('part2.upload'):
+                _, action = upsert_file(dest_folder_id, output_filename, XLSX_MIMETYPE, path=local_path)
+            print(f"{action.capitalize()} {output_filename}")
+            incr('workbooks_written')
+            os.remove(local_path)
+            if rebuilt_months is not None:
+                rebuilt_months.add(month)
+            if progress is not None:
+                written[month_key] = sorted(done_sources | set(sources))
+                save_state(PROGRESS_NAME, progress)
+
+        if MONTHLY_WORKBOOKS:
+            update_summary_workbook(store_name, dest_folder_id, month_tables)
+        if rollup_rows:
+            # The single workbook holds every month, so it replaces all of the store's rows
+            rollup.stage(store_name, set(month_tables) if MONTHLY_WORKBOOKS else None,
+                         pd.concat(rollup_rows, ignore_index=True))
+        if progress is not None and written:
+            # Done: these rows are PART2_DONE now and never come back
+            progress.pop(store_name, None)
+            save_state(PROGRESS_NAME, progress)
+        return True
 
     except Exception as e:
         print(f"Error consolidating {store_name}: {e}")
+        return False
 
 # ================= MAIN =================
 def main():
-    files = get_part1_done_files()
+    with timer('part2.read_tracking'):
+        files = get_part1_done_files()
     if not files:
         print("No files ready for consolidation.")
         return
@@ -241,21 +515,49 @@ def main():
     print(f"Found {len(files)} converted file(s) to consolidate.")
 
     store_groups = {}
-    for file_id, file_name in files:
+    store_bytes = {}
+    for row_num, file_id, file_name in files:
         try:
-            parents = drive_service.files().get(fileId=file_id, fields="parents").execute().get('parents', [])
+            meta = execute(get_service().files().get(fileId=file_id, fields="parents, size"))
+            parents = meta.get('parents', [])
             if parents:
-                parent_name = drive_service.files().get(fileId=parents[0], fields="name").execute()['name']
-                store_groups.setdefault(parent_name, []).append((file_id, file_name))
+                parent_name = execute(get_service().files().get(fileId=parents[0], fields="name"))['name']
+                store_groups.setdefault(parent_name, []).append((row_num, file_id, file_name))
+                store_bytes[parent_name] = store_bytes.get(parent_name, 0) + int(meta.get('size') or 0)
         except:
             continue
 
-    for store_name, file_list in store_groups.items():
-        dest_id = get_or_create_folder(DEST_ROOT_ID, store_name)
-        process_store_batch(store_name, file_list, dest_id)
-        for file_id, file_name in file_list:
-            log_to_sheet(file_id, file_name, "PART2_DONE")
+    # Biggest stores first; stores that would overrun the time budget stay
+    # PART1_DONE for the next run
+    plan = Schedule('part2')
+    units = {store_name: (file_list, store_bytes.get(store_name, 0))
+             for store_name, file_list in store_groups.items() if in_shard(store_name)}
+    for store_name in plan.ordered(units):
+        if not plan.admit(store_name):
+            continue
+        file_list = store_groups[store_name]
+        # Lease + claim the store's rows in one write; a concurrent run keeps what it won
+        owned = set(claim_rows(TRACKING_SHEET_ID, [row_num for row_num, _, _ in file_list], status="PART2_CLAIMED",
+                                    expected_statuses={"PART1_DONE", "PART2_CLAIMED"}))
+        file_list = [item for item in file_list if item[0] in owned]
+        if not file_list:
+            print(f"Skipping {store_name}: claimed by another run")
+            plan.release(store_name)
+            continue
 
+        dest_id = get_or_create_folder(DEST_ROOT_ID, store_name)
+        with plan.running(store_name), timer('part2.store'):
+            ok = process_store_batch(store_name, [(file_id, file_name) for _, file_id, file_name in file_list], dest_id)
+        for _, _, file_name in file_list:
+            ledger.record('part2', store=store_name, file=file_name, status="PART2_DONE" if ok else "Failed")
+        # Failed stores are released back to PART1_DONE for the next run
+        set_row_statuses(TRACKING_SHEET_ID, {row_num: "PART2_DONE" if ok else "PART1_DONE" for row_num, _, _ in file_list})
+    plan.finish()
+    rollup.save()
+
+    report_client_stats()
+    report_api_stats()
+    write_summary('part2')
     print(f"\nPART2 Complete – Updated {len(store_groups)} store(s).")
 
 if __name__ == "__main__":
@@ -1,14 +1,17 @@
 # payroll.py - Automated Payroll Processor (GitHub Actions Version)
-import os
 import io
 import re
-import csv
-import json
 import datetime
 import pandas as pd
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+import ledger
+import artifacts
+import hours_index
+from google_clients import report_client_stats, report_api_stats
+from metrics import timer, incr, write_summary
+from drive_io import upsert_file, budgeted_download, get_or_create_folder, get_file_sizes
+from scheduler import Schedule
+from tracking import (PAYROLL_TRACKING_SHEET_ID, read_tracking_rows, claim_rows, is_leased_by_other, in_shard,
+                      set_row_statuses)
 
 # ==============================================================================
 # 1. CONFIGURATION
@@ -18,15 +21,10 @@ from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 OUTPUT_ROOT_ID = "0AEDJ3Yc9IXQcUk9PVA"
 
 # The Payroll Tracking Sheet ID
-TRACKING_SHEET_ID = "1O4aYE5mdXdAXtlvyQfcHoaQtqj3GoEyOOGE_UDK0DfI"
+TRACKING_SHEET_ID = PAYROLL_TRACKING_SHEET_ID  # see tracking.STAGE_TRACKING
 
-# Auth Setup
-SERVICE_ACCOUNT_JSON = json.loads(os.environ['SERVICE_ACCOUNT_KEY'])
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_JSON, scopes=SCOPES)
-
-def get_service(service_name='drive', version='v3'):
-    return build(service_name, version, credentials=creds)
+# Rows leased per claim (one write + one read-back per batch)
+CLAIM_BATCH_SIZE = 20
 
 # ==============================================================================
 # 2. CORE LOGIC
@@ -325,190 +323,190 @@ def get_pending_payroll_uploads():
     Only selects rows where Status (Col D) is 'PAYROLL UPLOADED'.
     """
     try:
-        service = get_service('sheets', 'v4')
-        result = service.spreadsheets().values().get(
-            spreadsheetId=TRACKING_SHEET_ID,
-            range="Sheet1!A:D"
-        ).execute()
-        rows = result.get('values', [])
+        # Delta read: new rows since the saved cursor plus still-pending rows
+        rows = read_tracking_rows(TRACKING_SHEET_ID, 'payroll')
         
         pending = []
-        if len(rows) > 1:
-            for i, row in enumerate(rows):
-                current_row_num = i + 1
-                if current_row_num == 1: continue
-
-                if len(row) >= 4 and row[3] == "PAYROLL UPLOADED":
-                    file_id = row[0]
-                    file_name = row[1] if len(row) > 1 else "Unknown.csv"
-                    pending.append((file_id, file_name, current_row_num))
+        for current_row_num, row in rows:
+            if len(row) >= 4 and row[3] == "PAYROLL UPLOADED":
+                # Another run holds a live lease on this row
+                if is_leased_by_other(row): continue
+                file_id = row[0]
+                file_name = row[1] if len(row) > 1 else "Unknown.csv"
+                store_match = re.search(r'^(\d+)', file_name)
+                if not in_shard(store_match.group(1) if store_match else "Unknown_Store"): continue
+                pending.append((file_id, file_name, current_row_num))
         return pending
     except Exception as e:
         print(f"Error reading tracking sheet: {e}")
         return []
 
-def mark_payroll_status(row_num, status_message):
-    """Updates column D (Status) of the SPECIFIC row number."""
+# row_num -> status, written in one batchUpdate by flush_payroll_statuses()
+pending_statuses = {}
+
+def mark_payroll_status(row_num, file_name, status_message):
+    """Queues column D (Status) for the row and records the outcome in the run ledger."""
+    pending_statuses[row_num] = status_message
+    ledger.record('payroll', row=row_num, file=file_name, status=status_message)
+    print(f"   -> Row {row_num}: {status_message}")
+
+def flush_payroll_statuses():
+    """Writes every queued status (and releases those leases) in a single call."""
+    if not pending_statuses:
+        return
     try:
-        service = get_service('sheets', 'v4')
-        range_name = f"Sheet1!D{row_num}"
-        body = {'values': [[status_message]]}
-        service.spreadsheets().values().update(
-            spreadsheetId=TRACKING_SHEET_ID,
-            range=range_name,
-            valueInputOption="RAW",
-            body=body
-        ).execute()
-        print(f"   -> Row {row_num} updated to: {status_message}")
+        set_row_statuses(TRACKING_SHEET_ID, pending_statuses)
+        print(f"Updated {len(pending_statuses)} tracking row(s).")
+        pending_statuses.clear()
     except Exception as e:
-        print(f"Error updating status for row {row_num}: {e}")
+        # Leases expire, so these rows are picked up again by a later run
+        print(f"Error updating tracking statuses: {e}")
 
 def get_file_content(file_id):
     try:
-        service = get_service('drive', 'v3')
-        request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        fh.seek(0)
-        return fh.read().decode('utf-8', errors='replace')
+        # Decodes straight from the download buffer (no intermediate bytes copy);
+        # reports are small, so the parsers still get a single string
+        with budgeted_download(file_id) as fh:
+            return io.TextIOWrapper(fh, encoding='utf-8', errors='replace', newline='').read()
     except Exception as e:
         print(f"Error downloading {file_id}: {e}")
         return None
 
-def get_or_create_folder(parent_id, folder_name):
-    service = get_service('drive', 'v3')
-    query = f"'{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and trashed=false"
-    
-    results = service.files().list(
-        q=query, 
-        fields="files(id)", 
-        includeItemsFromAllDrives=True, 
-        supportsAllDrives=True
-    ).execute()
-    files = results.get('files', [])
-    
-    if files:
-        return files[0]['id']
-    else:
-        metadata = {
-            'name': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder',
-            'parents': [parent_id]
-        }
-        folder = service.files().create(
-            body=metadata, 
-            fields='id', 
-            supportsAllDrives=True
-        ).execute()
-        return folder['id']
-
 def upload_csv_to_drive(df, filename, folder_id):
     if df.empty: return
-    service = get_service('drive', 'v3')
-    
-    query = f"'{folder_id}' in parents and name='{filename}' and trashed=false"
-    results = service.files().list(
-        q=query, 
-        fields="files(id)", 
-        includeItemsFromAllDrives=True, 
-        supportsAllDrives=True
-    ).execute()
-    
-    if results.get('files'):
-        print(f"   - File exists (Updating): {filename}")
-        file_id = results.get('files')[0]['id']
-        service.files().delete(fileId=file_id, supportsAllDrives=True).execute()
 
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    
-    media = MediaIoBaseUpload(io.BytesIO(csv_buffer.getvalue().encode('utf-8')), mimetype='text/csv')
-    metadata = {'name': filename, 'parents': [folder_id]}
-    
-    service.files().create(
-        body=metadata, 
-        media_body=media, 
-        fields='id', 
-        supportsAllDrives=True
-    ).execute()
-    print(f"   - Uploaded: {filename}")
+    # Upsert keeps the file ID stable and skips identical re-uploads
+    if artifacts.enabled():
+        # Streamed through the compressor; uploaded as <filename>.gz/.zst
+        _, action, filename = artifacts.upload_compressed(folder_id, filename, lambda out: df.to_csv(out, index=False))
+    else:
+        csv_buffer = io.StringIO()
+        df.to_csv(csv_buffer, index=False)
+        _, action = upsert_file(folder_id, filename, 'text/csv', data=csv_buffer.getvalue().encode('utf-8'))
+    if action == 'unchanged':
+        print(f"   - Unchanged (skipped): {filename}")
+    elif action == 'updated':
+        print(f"   - Updated in place: {filename}")
+    else:
+        print(f"   - Uploaded: {filename}")
 
 # ==============================================================================
 # 6. MAIN EXECUTION
 # ==============================================================================
 
-def main():
-    print(">>> Starting Payroll Automation (GitHub Actions)...")
-    pending_files = get_pending_payroll_uploads()
-    if not pending_files:
-        print("No new payroll files to process.")
-        return
-
-    print(f"Found {len(pending_files)} pending payroll files.")
-
-    for file_id, file_name, row_num in pending_files:
-        print(f"\nProcessing Row {row_num}: {file_name}")
-        
-        # --- SAFE PROCESS BLOCK ---
-        try:
-            # 1. Download Content
+def process_payroll_file(file_id, file_name, row_num):
+    print(f"\nProcessing Row {row_num}: {file_name}")
+    
+    # --- SAFE PROCESS BLOCK ---
+    try:
+        # 1. Download Content
+        with timer('payroll.download'):
             content = get_file_content(file_id)
-            if not content:
-                mark_payroll_status(row_num, "PAYROLL FAULTY: Download Failed")
-                continue
+        if not content:
+            mark_payroll_status(row_num, file_name, "PAYROLL FAULTY: Download Failed")
+            return
 
-            # 2. Extract Date (Auto-detection)
-            pay_period_start = extract_start_date(file_name)
-            if not pay_period_start:
-                mark_payroll_status(row_num, "PAYROLL FAULTY: Bad Date")
-                continue
+        # 2. Extract Date (Auto-detection)
+        pay_period_start = extract_start_date(file_name)
+        if not pay_period_start:
+            mark_payroll_status(row_num, file_name, "PAYROLL FAULTY: Bad Date")
+            return
 
-            # 3. Detect Format & Parse
-            try:
-                fmt = detect_format_from_content(content)
-                df = pd.DataFrame()
-                store_no = None
+        # 3. Detect Format & Parse
+        try:
+            fmt = detect_format_from_content(content)
+            df = pd.DataFrame()
+            store_no = None
 
+            with timer('payroll.parse'):
                 if fmt == 'payroll':
                     df, store_no = parse_payroll_content(content, pay_period_start.year)
                 elif fmt == 'timeclock':
                     df, store_no = parse_timeclock_content(content)
-                
-                if not store_no:
-                    match = re.search(r'^(\d+)', file_name)
-                    store_no = match.group(1) if match else "Unknown_Store"
+            incr('payroll_rows_parsed', len(df))
+            
+            if not store_no:
+                match = re.search(r'^(\d+)', file_name)
+                store_no = match.group(1) if match else "Unknown_Store"
 
-                if df.empty:
-                    mark_payroll_status(row_num, "PAYROLL FAULTY: Empty Data")
-                    continue
+            if df.empty:
+                mark_payroll_status(row_num, file_name, "PAYROLL FAULTY: Empty Data")
+                return
 
-            except Exception as e:
-                print(f"Parse error for {file_name}: {e}")
-                mark_payroll_status(row_num, "PAYROLL FAULTY: Parse Error")
-                continue
+        except Exception as e:
+            print(f"Parse error for {file_name}: {e}")
+            mark_payroll_status(row_num, file_name, "PAYROLL FAULTY: Parse Error")
+            return
 
-            # 4. Generate & Upload
+        # 4. Generate & Upload
+        with timer('payroll.prepare'):
             formatted_df = prepare_formatted_df(df, store_no)
             pivot_df = prepare_pivot_df(df, store_no, pay_period_start)
+            if hours_index.enabled():
+                weekly = hours_index.weekly_rows(df, store_no, pay_period_start)
 
-            store_folder_id = get_or_create_folder(OUTPUT_ROOT_ID, str(store_no))
-            
-            base_name = file_name.replace('.csv', '')
+        store_folder_id = get_or_create_folder(OUTPUT_ROOT_ID, str(store_no))
+        
+        base_name = file_name.replace('.csv', '')
+        with timer('payroll.upload'):
             upload_csv_to_drive(formatted_df, f"{base_name}_Formatted.csv", store_folder_id)
             upload_csv_to_drive(pivot_df, f"{base_name}_Pivot.csv", store_folder_id)
 
-            # 5. Success
-            mark_payroll_status(row_num, "PAYROLL DONE")
-            print(f"Completed: {file_name}")
+        # 5. Success (the hours only count chain-wide once the outputs are up)
+        if hours_index.enabled():
+            hours_index.stage(store_no, pay_period_start, weekly)
+        mark_payroll_status(row_num, file_name, "PAYROLL DONE")
+        incr('payroll_files_done')
+        print(f"Completed: {file_name}")
 
-        except Exception as e:
-            # Catch-all for any other crash to prevent stopping the whole script
-            print(f"Critical error on file {file_name}: {e}")
-            mark_payroll_status(row_num, "PAYROLL FAULTY: Critical Error")
-            continue
+    except Exception as e:
+        # Catch-all for any other crash to prevent stopping the whole script
+        print(f"Critical error on file {file_name}: {e}")
+        mark_payroll_status(row_num, file_name, "PAYROLL FAULTY: Critical Error")
+
+def main():
+    print(">>> Starting Payroll Automation (GitHub Actions)...")
+    with timer('payroll.read_tracking'):
+        pending_files = get_pending_payroll_uploads()
+    if not pending_files:
+        print("No new payroll files to process.")
+        return
+
+    print(f"Found {len(pending_files)} pending payroll files.")
+
+    # Biggest files first; files that would overrun the time budget stay
+    # PAYROLL UPLOADED for the next run
+    with timer('payroll.sizes'):
+        sizes = get_file_sizes(file_id for file_id, _, _ in pending_files)
+    plan = Schedule('payroll', per_key=False)
+    by_row = {row_num: (file_id, file_name) for file_id, file_name, row_num in pending_files}
+    ordered = plan.ordered({row_num: ([file_id], sizes.get(file_id) or 0) for row_num, (file_id, _) in by_row.items()})
+
+    # Lease files in small batches so overlapping runs split the backlog
+    try:
+        for start in range(0, len(ordered), CLAIM_BATCH_SIZE):
+            batch = [row_num for row_num in ordered[start:start + CLAIM_BATCH_SIZE] if plan.admit(row_num)]
+            owned = set(claim_rows(TRACKING_SHEET_ID, batch, expected_statuses={"PAYROLL UPLOADED"}))
+            for row_num in batch:
+                if row_num not in owned:
+                    print(f"Skipping Row {row_num}: claimed by another run")
+                    plan.release(row_num)
+                    continue
+                file_id, file_name = by_row[row_num]
+                with plan.running(row_num), timer('payroll.file'):
+                    process_payroll_file(file_id, file_name, row_num)
+            # One status write per claim batch, so finished files are marked
+            # before their leases expire; the index first, so no DONE row is missing from it
+            hours_index.save()
+            flush_payroll_statuses()
+    finally:
+        hours_index.save()
+        flush_payroll_statuses()
+        plan.finish()
+
+    report_client_stats()
+    report_api_stats()
+    write_summary('payroll')
 
 if __name__ == "__main__":
     main()
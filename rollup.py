@@ -0,0 +1,116 @@
+# rollup.py - Chain-wide daily sales rollup across consolidated stores
+#
+# Whenever part2 rewrites a store's months it also stages one row per
+# (store, business day): the day's total for each pivot category sheet and
+# the customer count. save() merges the staged rows into a date-sorted
+# Parquet table kept on Drive next to the store folders (ROLLUP_FOLDER_ID,
+# see drive_table.py). So
+#
+#   sales_by_store('2025-01-01', '2025-01-31')              # store x totals
+#   sales_by_store('2025-01-06', '2025-01-12', stores=['1234'], daily=True)
+#
+# answer from that one file instead of opening every store's workbook: it
+# is downloaded and parsed only when it changes, and the sorted date column
+# is the index, sliced by binary search.
+import os
+
+import pandas as pd
+
+from drive_table import DriveTable
+from sidecar import HAS_PARQUET
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+ROLLUP_NAME = "sales_daily.parquet"
+# Drive folder holding the rollup: part2's DEST_ROOT_ID
+ROLLUP_FOLDER_ID = os.environ.get('POPEYES_ROLLUP_FOLDER_ID', "1tlPuBOhnxjQJ_kIGo7-WW6TjG2mxfbgr")
+# Set to 0 to stop maintaining the rollup
+ROLLUP_ENABLED = os.environ.get('POPEYES_ROLLUP', '1') != '0'
+# Category sheet -> summed measure, as on the sheets (amount = _split_5, total = _split_35)
+CATEGORY_MEASURES = {
+    'PivotTable_total': 'total',
+    'Pivot_Delv': 'amount',
+    'Soda_dinein_sales': 'total',
+    'Donation': 'amount',
+}
+COLUMNS = ['date', 'store', *CATEGORY_MEASURES, 'customers']
+
+def _empty():
+    return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'store': pd.Series(dtype=str)}, columns=COLUMNS)
+
+def _replaces(frame, store_name, months):
+    """A store's staged rows replace its rows for `months`, or all of them for None."""
+    mask = frame['store'] == store_name
+    if months is not None:
+        mask &= frame['date'].dt.strftime('%Y-%m').isin(months)
+    return mask
+
+_table = DriveTable(ROLLUP_NAME, ROLLUP_FOLDER_ID, _empty, key=['date', 'store'], sort=['date', 'store'],
+                    replaces=_replaces, label="Rollup", unit="store-day(s)")
+
+def enabled():
+    return ROLLUP_ENABLED and HAS_PARQUET
+
+def rollup_path():
+    return _table.path
+
+# ==============================================================================
+# BUILDING
+# ==============================================================================
+def daily_rows(store_name, df_full, split_0_col, split_5_col, split_35_col, categories):
+    """One row per business day of `df_full` (a consolidated month), in COLUMNS order."""
+    dated = df_full[df_full['Date_file'].notna()]
+    days = pd.Index(sorted(dated['Date_file'].astype(str).unique()), name='Date_file')
+    rows = pd.DataFrame(index=days)
+    measure_cols = {'amount': split_5_col, 'total': split_35_col}
+    for sheet_name, measure in CATEGORY_MEASURES.items():
+        items = dated[dated[split_0_col].isin(categories[sheet_name])]
+        values = pd.to_numeric(items[measure_cols[measure]], errors='coerce')
+        rows[sheet_name] = values.groupby(items['Date_file'].astype(str)).sum()
+    # Distinct order timestamps on PivotTable_total, as the Customer_Count sheet
+    items = dated[dated[split_0_col].isin(categories['PivotTable_total'])]
+    rows['customers'] = items.groupby(items['Date_file'].astype(str))['Date_time'].nunique()
+
+    rows = rows.fillna(0).reset_index()
+    rows.insert(0, 'date', pd.to_datetime(rows.pop('Date_file'), format='%m/%d/%Y'))
+    rows.insert(1, 'store', str(store_name))
+    rows['customers'] = rows['customers'].astype('int64')
+    return rows[COLUMNS]
+
+def stage(store_name, months, rows):
+    """
+    Queues `rows` for the store, replacing what the rollup holds for
+    `months` ('YYYY-MM' strings) or, with months=None, for every month.
+    """
+    _table.stage(str(store_name), None if months is None else set(months), rows)
+
+# ==============================================================================
+# STORAGE
+# ==============================================================================
+def save():
+    """Merges the staged rows into the rollup on Drive. Returns the rows it holds."""
+    return _table.save() if enabled() else 0
+
+# ==============================================================================
+# QUERIES
+# ==============================================================================
+def load_range(start, end, stores=None):
+    """Rollup rows with start <= date <= end (dates or 'YYYY-MM-DD'), optionally for `stores`."""
+    frame = _table.query()
+    lo = frame['date'].searchsorted(pd.Timestamp(start), side='left')
+    hi = frame['date'].searchsorted(pd.Timestamp(end), side='right')
+    rows = frame.iloc[lo:hi]
+    if stores is not None:
+        rows = rows[rows['store'].isin([str(s) for s in stores])]
+    return rows
+
+def sales_by_store(start, end, stores=None, daily=False):
+    """
+    Category totals and customer counts per store for the date range; with
+    daily=True one row per (store, date) instead of the range total.
+    """
+    rows = load_range(start, end, stores)
+    if daily:
+        return rows.set_index(['store', 'date']).sort_index()
+    return rows.drop(columns='date').groupby('store').sum()
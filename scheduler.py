@@ -0,0 +1,182 @@
+# scheduler.py - Time-budgeted, size-aware ordering of a run's work
+#
+#   plan = Schedule('part1')
+#   for key in plan.ordered({store: (items, total_bytes)}):
+#       if not plan.admit(key):
+#           continue                      # would overrun: left for the next run
+#       with plan.running(key):
+#           process(...)
+#   plan.finish()                         # saves the cost model and deferred keys
+#
+# A unit of work (a store for part1/part2, a file for payroll) is estimated
+# as  files * seconds_per_file + MB * seconds_per_mb, both rates fitted per
+# stage from earlier runs (decayed least squares, pulled towards the
+# defaults until there is history). Units run longest-first, which with
+# several workers (backfill) is the classic LPT makespan heuristic. Once the
+# run's window is nearly used up, units that would not finish in time are
+# deferred; they are checkpointed and go first on the next run, so a big
+# store waits at most one run.
+import os
+import time
+import threading
+import contextlib
+
+from metrics import incr
+from state import load_state, save_state
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+STATE_NAME = "schedule.json"
+# Seconds of work a run may start; the cron fires every 5 minutes. 0 = no limit
+TIME_BUDGET = float(os.environ.get('POPEYES_TIME_BUDGET', 240))
+# Cost model priors, used until a stage has history
+DEFAULT_SECONDS_PER_FILE = 3.0
+DEFAULT_SECONDS_PER_MB = 2.0
+# Weight of the priors, in observations
+PRIOR_WEIGHT = 2.0
+# Each new observation scales the weight of older ones by this
+DECAY = 0.95
+# Per-key correction (observed / estimated) is kept for at most this many keys
+MAX_KEY_FACTORS = 2000
+KEY_FACTOR_RANGE = (0.25, 8.0)
+
+_lock = threading.Lock()
+# time.monotonic() deadline shared by every stage of the current run; None
+# once a window is started means no limit
+_deadline = None
+_window_started = False
+
+# ==============================================================================
+# RUN WINDOW
+# ==============================================================================
+def start_window(budget=None):
+    """Starts the run's time window (the worker calls this once per cycle)."""
+    global _deadline, _window_started
+    budget = TIME_BUDGET if budget is None else budget
+    _deadline = time.monotonic() + budget if budget > 0 else None
+    _window_started = True
+
+def remaining():
+    """Seconds left in the window, or None when there is no budget."""
+    if _deadline is None:
+        return None
+    return _deadline - time.monotonic()
+
+# ==============================================================================
+# COST MODEL
+# ==============================================================================
+def _fit(model):
+    # Ridge towards the priors: solve (A + w I) c = b + w * prior for the 2x2 case
+    (a, b_), (_, d) = model['xx']
+    y0, y1 = model['xy']
+    p0, p1 = DEFAULT_SECONDS_PER_FILE, DEFAULT_SECONDS_PER_MB
+    a, d = a + PRIOR_WEIGHT, d + PRIOR_WEIGHT
+    y0, y1 = y0 + PRIOR_WEIGHT * p0, y1 + PRIOR_WEIGHT * p1
+    det = a * d - b_ * b_
+    per_file = (d * y0 - b_ * y1) / det
+    per_mb = (a * y1 - b_ * y0) / det
+    return max(per_file, 0.0), max(per_mb, 0.0)
+
+def _empty_model():
+    return {'xx': [[0.0, 0.0], [0.0, 0.0]], 'xy': [0.0, 0.0], 'runs': 0}
+
+class Schedule:
+    """Orders, admits and times one stage's units of work for the current run."""
+
+    def __init__(self, stage, per_key=True):
+        self.stage = stage
+        self.per_key = per_key
+        state = load_state(STATE_NAME, {}).get(stage, {})
+        self.model = state.get('model') or _empty_model()
+        self.factors = state.get('factors', {})
+        self.carried = set(state.get('deferred', []))
+        self.per_file, self.per_mb = _fit(self.model)
+        self.units = {}
+        self.estimates = {}
+        self.deferred = []
+        self.started = 0
+        # Estimated seconds of units admitted but not finished yet
+        self.reserved = {}
+        # Scripts run standalone get the default window; an unlimited one stays unlimited
+        if not _window_started:
+            start_window()
+
+    def base_estimate(self, files, size):
+        return files * self.per_file + (size or 0) / 2**20 * self.per_mb
+
+    def estimate(self, key, files, size):
+        return self.base_estimate(files, size) * self.factors.get(str(key), 1.0)
+
+    def ordered(self, units):
+        """
+        `units` is {key: (items, total_bytes)}. Returns the keys, deferred
+        ones from the last run first, then by estimated cost, longest first.
+        """
+        self.units.update(units)
+        for key, (items, size) in units.items():
+            self.estimates[key] = self.estimate(key, len(items), size)
+        return sorted(units, key=lambda k: (str(k) not in self.carried, -self.estimates[k]))
+
+    def admit(self, key):
+        """
+        True if the unit should run now. A unit that would not finish in the
+        window (after the units already admitted) is deferred, unless it was
+        already deferred last run and nothing of this stage has started yet,
+        so oversized units still run. Admitted units that end up not running
+        are handed back with release().
+        """
+        left = remaining()
+        if left is not None:
+            left -= sum(self.reserved.values())
+        estimate = self.estimates.get(key, 0.0)
+        if left is None or (left > 0 and estimate <= left) or (left > 0 and self.started == 0 and str(key) in self.carried):
+            self.started += 1
+            self.reserved[key] = estimate
+            return True
+        self.deferred.append(key)
+        incr(f'{self.stage}.deferred')
+        return False
+
+    @contextlib.contextmanager
+    def running(self, key):
+        """Times the unit's work; successful runs update the cost model."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(key)
+        self.observe(key, time.monotonic() - start)
+
+    def release(self, key):
+        self.reserved.pop(key, None)
+
+    def observe(self, key, seconds):
+        items, size = self.units.get(key, ((), 0))
+        x = (float(len(items)), (size or 0) / 2**20)
+        with _lock:
+            for i in range(2):
+                self.model['xy'][i] = self.model['xy'][i] * DECAY + x[i] * seconds
+                for j in range(2):
+                    self.model['xx'][i][j] = self.model['xx'][i][j] * DECAY + x[i] * x[j]
+            self.model['runs'] += 1
+            base = self.base_estimate(len(items), size)
+            if self.per_key and base > 0:
+                ratio = seconds / base
+                previous = self.factors.pop(str(key), 1.0)
+                low, high = KEY_FACTOR_RANGE
+                self.factors[str(key)] = min(max(0.5 * previous + 0.5 * ratio, low), high)
+
+    def finish(self):
+        """Saves the updated model and this run's deferred keys."""
+        with _lock:
+            if self.deferred:
+                print(f"⏳ {self.stage}: {len(self.deferred)} unit(s) deferred to the next run (time budget)")
+            factors = dict(list(self.factors.items())[-MAX_KEY_FACTORS:])
+            state = load_state(STATE_NAME, {})
+            state[self.stage] = {
+                'model': self.model,
+                'factors': factors,
+                'deferred': sorted({str(k) for k in self.deferred}),
+            }
+            save_state(STATE_NAME, state)
@@ -0,0 +1,83 @@
+# sidecar.py - Typed Parquet copies of part1's converted CSVs
+#
+# part1 uploads converted_<name>.parquet next to converted_<name>.csv.
+# part2 reads the Parquet file when it exists: columns arrive typed
+# (Date_time as timestamps, quantity/amount as floats) and compressed, so
+# there is no string parsing of dates and a much smaller download.
+# The CSV stays the human-facing artifact and the fallback.
+import io
+import os
+
+import pandas as pd
+
+from drive_io import budgeted_download, find_first
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+PARQUET_COMPRESSION = 'zstd'
+# Converted CSV timestamps look like "Mon Jan 6, 2025 10:31:22 AM,"
+DATE_TIME_FORMAT = '%a %b %d %Y %I:%M:%S %p'
+# Set to 0 to neither write nor read sidecars
+SIDECARS_ENABLED = os.environ.get('POPEYES_SIDECARS', '1') != '0'
+
+try:
+    import pyarrow  # noqa: F401  (pandas' Parquet engine)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# ==============================================================================
+# HELPERS
+# ==============================================================================
+def enabled():
+    return SIDECARS_ENABLED and HAS_PARQUET
+
+def sidecar_name(csv_name):
+    return os.path.splitext(csv_name)[0] + '.parquet'
+
+def _column(df, suffix):
+    matches = [c for c in df.columns if c.endswith(suffix)]
+    return matches[0] if matches else None
+
+def typed_frame(csv_text):
+    """
+    Reads a converted CSV exactly as part2 does (all strings), then types it:
+    Date_time -> timestamp, _split_3 (quantity) and _split_5 (amount) -> float.
+    Returns None when a Date_time value does not parse, so the CSV path (and
+    its error handling) stays in charge of odd files.
+    """
+    df = pd.read_csv(io.StringIO(csv_text), dtype=str, low_memory=False)
+    df.columns = df.columns.str.strip()
+    if 'Date_time' in df.columns:
+        raw = df['Date_time'].str.replace(',', '', regex=False)
+        parsed = pd.to_datetime(raw, format=DATE_TIME_FORMAT, errors='coerce')
+        if (parsed.isna() & raw.notna()).any():
+            return None
+        df['Date_time'] = parsed
+    for suffix in ('_split_3', '_split_5'):
+        col = _column(df, suffix)
+        if col:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+def to_parquet_bytes(csv_text):
+    """Parquet bytes for a converted CSV, or None when it cannot be typed."""
+    df = typed_frame(csv_text)
+    if df is None:
+        return None
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False, compression=PARQUET_COMPRESSION)
+    return buf.getvalue()
+
+# ==============================================================================
+# PART2 SIDE
+# ==============================================================================
+def find_sidecar(folder_id, source_name):
+    """converted_<source_name>.parquet in `folder_id` (part1's store/month folder), or None."""
+    return find_first(folder_id, [sidecar_name("converted_" + source_name)])
+
+def read_sidecar(sidecar):
+    with budgeted_download(sidecar['id'], size=int(sidecar.get('size') or 0) or None) as fh:
+        return pd.read_parquet(fh)
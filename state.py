@@ -0,0 +1,42 @@
+# state.py - Small persistent JSON state shared across cron runs
+import os
+import json
+import tempfile
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+# In GitHub Actions this directory is restored/saved with actions/cache.
+STATE_DIR = os.environ.get(
+    'POPEYES_STATE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.state')
+)
+
+# ==============================================================================
+# HELPERS
+# ==============================================================================
+def state_path(name):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, name)
+
+def load_state(name, default=None):
+    """Returns the JSON stored under `name`, or `default` if missing/unreadable."""
+    path = state_path(name)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_state(name, data):
+    """Writes atomically (temp file + rename) so a killed run never leaves half a file."""
+    path = state_path(name)
+    fd, tmp_path = tempfile.mkstemp(dir=STATE_DIR, prefix=f".{name}.")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,22 @@
+# tests/conftest.py - Makes the repo modules (and bench/synthetic.py) importable
+# and keeps every test's persisted state in its own temp dir
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+os.environ.setdefault('POPEYES_STATE_DIR', tempfile.mkdtemp(prefix='popeyes-test-'))
+
+import state
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'state'
+    path.mkdir()
+    monkeypatch.setattr(state, 'STATE_DIR', str(path))
+    return path
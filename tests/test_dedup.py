@@ -0,0 +1,76 @@
+# tests/test_dedup.py - Packed-key dedup and the order history
+import io
+
+import synthetic
+import part1
+from dedup import OrderHistory, pack_keys, dedup_files
+
+
+def parse(content):
+    headers, blocks = part1.parse_pos_csv(io.StringIO(content))
+    assert headers is not None
+    return blocks
+
+
+def history_of(store, files):
+    history = OrderHistory(store)
+    for file_name, blocks in files:
+        keys, _ = pack_keys([b['id'] for b in blocks if b['id']])
+        history.add(keys, file_name)
+    return history
+
+
+def reference(files, history_files=()):
+    """part1.drop_duplicate_blocks over the files in order, seeded with the history's orders."""
+    seen = {}
+    for name, blocks in history_files:
+        for b in blocks:
+            if b['id']:
+                seen.setdefault(b['id'], name)
+    return [part1.drop_duplicate_blocks(blocks, name, seen) for name, blocks in files]
+
+
+def test_dedup_files_matches_drop_duplicate_blocks():
+    files = [(name, parse(content)) for name, content in synthetic.pos_series(files=5, orders=80, overlap=0.3, seed=3)]
+    history_files = files[:2]
+    batch = files[2:]
+    # A repeat inside one file is kept, as in drop_duplicate_blocks
+    name, blocks = batch[0]
+    batch[0] = (name, blocks + [b for b in blocks if b['id']][:3])
+
+    for history in (None, history_of('12345', history_files)):
+        expected = reference(batch, history_files if history is not None else ())
+        got = dedup_files(batch, history)
+        assert [(kept, deleted) for kept, deleted, _, _ in got] == expected
+
+
+def test_dedup_file_by_file_matches_the_batch():
+    files = [(name, parse(content)) for name, content in synthetic.pos_series(files=4, orders=60, overlap=0.5, seed=5)]
+    batch = dedup_files(files)
+
+    history = OrderHistory('12345')
+    seen_ids = {}
+    one_by_one = []
+    for name, blocks in files:
+        [(kept, deleted, keys, new_ids)] = dedup_files([(name, blocks)], history, seen_ids)
+        history.add(keys, name)
+        seen_ids.update(new_ids)
+        one_by_one.append((kept, deleted))
+    assert one_by_one == [(kept, deleted) for kept, deleted, _, _ in batch]
+
+
+def test_unpacked_ids_are_committed_by_the_caller():
+    # An order number that does not pack takes the dict path
+    blocks = [{'id': ('Mon Jan 6, 2025 10:31:22 AM', 'A-17')}]
+    seen_ids = {}
+
+    [(kept, _, _, new_ids)] = dedup_files([('first.csv', blocks)], None, seen_ids)
+    assert kept == blocks and new_ids == {blocks[0]['id']: 'first.csv'}
+    # first.csv failed before its keys were committed: the order is still new
+    assert seen_ids == {}
+    [(kept, _, _, _)] = dedup_files([('retry.csv', blocks)], None, seen_ids)
+    assert kept == blocks
+
+    seen_ids.update(new_ids)
+    [(kept, deleted, _, new_ids)] = dedup_files([('later.csv', blocks)], None, seen_ids)
+    assert kept == [] and len(deleted) == 1 and new_ids == {}
@@ -0,0 +1,33 @@
+# tests/test_drive_io.py - Drive queries escape the names they look up
+import pytest
+
+import drive_io
+
+NAME = "O'Hare \\ Terminal 5"
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """The `q` of every files.list call; every lookup finds one file."""
+    seen = []
+
+    class Files:
+        def list(self, q, **kwargs):
+            seen.append(q)
+            return {'files': [{'id': 'found'}]}
+
+    class Service:
+        def files(self):
+            return Files()
+
+    monkeypatch.setattr(drive_io, 'get_service', lambda *args: Service())
+    monkeypatch.setattr(drive_io, 'execute', lambda request: request)
+    monkeypatch.setattr(drive_io, '_folder_cache', {})
+    return seen
+
+
+def test_lookups_quote_the_name(queries):
+    assert drive_io.get_or_create_folder('parent', NAME) == 'found'
+    assert drive_io.find_file('folder', NAME) == {'id': 'found'}
+
+    assert all("name='O\\'Hare \\\\ Terminal 5'" in q for q in queries)
@@ -0,0 +1,65 @@
+# tests/test_hours_index.py - The hours index lives on Drive; the state dir only caches it
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import drive_table
+import hours_index
+
+WEEK = pd.Timestamp('2025-01-06')
+
+
+def rows(store, hours):
+    return pd.DataFrame({'emp_id': ['E1'], 'week_start': [WEEK], 'store': [store], 'hours': [hours]})
+
+
+@pytest.fixture
+def drive(tmp_path, monkeypatch):
+    """The index folder as a local directory."""
+    folder = tmp_path / 'drive'
+    folder.mkdir()
+
+    def fetch_copy(folder_id, name, path):
+        if not (folder / name).exists():
+            return False
+        shutil.copy(folder / name, path)
+        return True
+
+    def upsert_file(folder_id, name, mimetype, data=None, path=None):
+        shutil.copy(path, folder / name)
+        return name, 'updated'
+
+    monkeypatch.setattr(drive_table, 'fetch_copy', fetch_copy)
+    monkeypatch.setattr(drive_table, 'upsert_file', upsert_file)
+    monkeypatch.setattr(hours_index._table, '_cache', None)
+    monkeypatch.setattr(hours_index._table, '_staged', [])
+    monkeypatch.setattr(hours_index._table, '_synced_at', None)
+    return folder
+
+
+def test_index_survives_a_lost_cache_and_merges_across_runs(drive):
+    hours_index.stage('1234', WEEK, rows('1234', 30.0))
+    hours_index.save()
+    assert (drive / hours_index.INDEX_NAME).exists()
+
+    # The next run starts without the state dir cache
+    os.remove(hours_index.index_path())
+    hours_index.stage('5678', WEEK, rows('5678', 15.0))
+    assert hours_index.save() == 2
+
+    os.remove(hours_index.index_path())
+    exposure = hours_index.overtime_exposure()
+    assert exposure.loc[('E1', WEEK), 'overtime'] == 5.0
+    assert exposure.loc[('E1', WEEK), 'cross_store_only']
+
+
+def test_failed_upload_keeps_rows_staged(drive, monkeypatch):
+    def offline(*args, **kwargs):
+        raise OSError("offline")
+    monkeypatch.setattr(drive_table, 'upsert_file', offline)
+    hours_index.stage('1234', WEEK, rows('1234', 30.0))
+    hours_index.save()
+
+    assert len(hours_index._table._staged) == 1
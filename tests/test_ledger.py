@@ -0,0 +1,30 @@
+# tests/test_ledger.py - The ledger rotates only once every sink has read it
+import pytest
+
+import ledger
+
+
+@pytest.fixture
+def small_ledger(monkeypatch):
+    monkeypatch.setattr(ledger, 'MAX_BYTES', 1)
+    monkeypatch.setattr(ledger, 'SINKS', ['part1_log', 'payroll_log'])
+
+
+def test_waits_for_a_sink_that_never_synced(small_ledger):
+    ledger.record('part1', file='a.csv')
+    ledger.record('payroll', file='a_payroll.csv')
+
+    assert ledger.sync('part1_log', 'part1', lambda entries: None) == 1
+    # payroll_log has not read the ledger yet: still there for it
+    pushed = []
+    assert ledger.sync('payroll_log', 'payroll', pushed.extend) == 1
+    assert pushed[0]['file'] == 'a_payroll.csv'
+
+
+def test_rotates_once_every_sink_has_synced(small_ledger):
+    ledger.record('part1', file='a.csv')
+    ledger.sync('part1_log', 'part1', lambda entries: None)
+    ledger.sync('payroll_log', 'payroll', lambda entries: None)
+
+    assert ledger.load_state(ledger.SYNC_STATE_NAME, {}) == {'part1_log': 0, 'payroll_log': 0}
+    assert ledger.sync('part1_log', 'part1', lambda entries: None) == 0
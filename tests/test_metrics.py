@@ -0,0 +1,58 @@
+# tests/test_metrics.py - Per-run reset and profiling under threads
+import time
+import concurrent.futures
+
+import google_clients
+import metrics
+
+
+def test_write_summary_starts_the_next_run_afresh():
+    with metrics.timer('part1.parse'):
+        metrics.incr('files_parsed', 3)
+    google_clients.record_call('drive.files.get', 0.01)
+
+    summary = metrics.write_summary('part1')
+    assert summary['counters'] == {'files_parsed': 3}
+    assert summary['api']['drive.files.get']['calls'] == 1
+
+    with metrics.timer('part2.pivot'):
+        pass
+    summary = metrics.write_summary('part2')
+    assert list(summary['stages']) == ['part2.pivot']
+    assert summary['counters'] == {} and summary['api'] == {}
+
+
+def test_profiling_with_worker_threads(monkeypatch):
+    def busy(stage):
+        with metrics.timer(stage):
+            time.sleep(0.01)
+            sum(range(10000))
+
+    for mode in ('auto', 'part1.parse'):
+        monkeypatch.setattr(metrics, 'PROFILE_STAGE', mode)
+        with metrics.timer('part1.store'):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(busy, ['part1.parse'] * 8))
+
+        summary = metrics.write_summary('part1')
+        assert summary['stages']['part1.parse']['calls'] == 8
+        assert summary['profile'] is not None
+        assert not metrics._profiling
+
+
+def test_prune_keeps_the_newest_files_of_each_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'KEEP_FILES', 2)
+    directory = tmp_path / 'metrics'
+    directory.mkdir()
+    names = ['backfill_20250101T000000Z.json',
+             'part1_20250101T000000Z.json', 'part1_20250102T000000Z.json', 'part1_20250103T000000Z.json',
+             'part1_20250103T000000Z_part1.parse.prof', 'part2_20250103T000000Z.json']
+    for name in names:
+        (directory / name).write_text('{}')
+
+    metrics._prune(str(directory))
+
+    # Sorted by name alone, backfill_ would have gone first
+    assert sorted(p.name for p in directory.iterdir()) == [
+        'backfill_20250101T000000Z.json', 'part1_20250103T000000Z.json',
+        'part1_20250103T000000Z_part1.parse.prof', 'part2_20250103T000000Z.json']
@@ -0,0 +1,87 @@
+# tests/test_part1_batch.py - process_store_batch: file-by-file dedup within the memory budget
+import io
+
+import pytest
+
+import synthetic
+import part1
+import dedup
+import fingerprints
+from drive_io import MemoryBudget
+
+STORE = '12345'
+
+
+@pytest.fixture
+def fake_part1(monkeypatch):
+    """Source exports served from memory; uploads captured as {name: cleaned POS text}."""
+    sources = {}
+    uploads = {}
+
+    def upsert_file(folder_id, name, mimetype, data=None, path=None):
+        uploads[name] = data.decode('utf-8')
+        return name, 'created'
+
+    monkeypatch.setattr(part1, 'precheck_file',
+                        lambda store, file_id: ({'size': str(len(sources[file_id])), 'md5Checksum': f"md5-{file_id}"}, None))
+    monkeypatch.setattr(part1, 'get_file_content', lambda file_id, size=None: io.StringIO(sources[file_id]))
+    monkeypatch.setattr(part1, 'get_or_create_folder', lambda parent_id, name: f"{parent_id}/{name}")
+    monkeypatch.setattr(part1, 'upsert_file', upsert_file)
+    # Keep the deduplicated POS text, so the kept orders can be read back
+    monkeypatch.setattr(part1, 'convert_to_final_format', lambda content, file_name: content)
+    monkeypatch.setattr(part1.artifacts, 'enabled', lambda: False)
+    monkeypatch.setattr(part1, 'sidecars_enabled', lambda: False)
+    monkeypatch.setattr(part1.ledger, 'record', lambda *args, **kwargs: None)
+    monkeypatch.setattr(dedup, '_histories', {})
+    monkeypatch.setattr(fingerprints, '_fingerprints', {'md5': {}})
+    return sources, uploads
+
+
+def order_ids(text):
+    _, blocks = part1.parse_pos_csv(io.StringIO(text))
+    return [b['id'] for b in blocks if b['id']]
+
+
+@pytest.mark.parametrize('budget', [1, 10**9])
+def test_batch_keeps_each_order_once_within_the_budget(fake_part1, monkeypatch, budget):
+    sources, uploads = fake_part1
+    series = synthetic.pos_series(store=STORE, files=4, orders=80, overlap=0.25)
+    # Out of name order on purpose: the batch is processed by file name
+    items = [(n, f"id-{name}", name) for n, (name, _) in reversed(list(enumerate(series)))]
+    sources.update({f"id-{name}": content for name, content in series})
+    memory = MemoryBudget(budget)
+    monkeypatch.setattr(part1, 'memory_budget', memory)
+
+    processed = part1.process_store_batch(STORE, items, mark_done=False)
+
+    assert sorted(processed) == [0, 1, 2, 3]
+    assert memory.used == 0
+    kept = {name[len('converted_'):]: order_ids(text) for name, text in uploads.items()}
+    every_order = {bid for _, content in series for bid in order_ids(content)}
+    assert sorted(bid for ids in kept.values() for bid in ids) == sorted(every_order)
+    # The first export keeps all its orders; later ones lose the repeated quarter
+    first_name = series[0][0]
+    assert kept[first_name] == order_ids(series[0][1])
+    for name, content in series[1:]:
+        assert len(kept[name]) == len(order_ids(content)) - 20
+
+
+def test_parsed_cost_grows_with_the_file():
+    small = part1.parse_pos_csv(io.StringIO(synthetic.pos_export(orders=10)))
+    large = part1.parse_pos_csv(io.StringIO(synthetic.pos_export(orders=100)))
+
+    assert part1.parsed_cost(*large) > 5 * part1.parsed_cost(*small) > 0
+
+
+def test_full_duplicates_are_fingerprinted(fake_part1):
+    sources, uploads = fake_part1
+    [(name, content)] = synthetic.pos_series(store=STORE, files=1, orders=40)
+    reexport = name.replace('.csv', '_again.csv')
+    sources.update({'id-first': content, 'id-again': content})
+
+    part1.process_store_batch(STORE, [(2, 'id-first', name), (3, 'id-again', reexport)], mark_done=False)
+
+    assert list(uploads) == ['converted_' + name]
+    # The re-export's own md5 is skipped before download next time
+    assert fingerprints.find_identical('md5-id-again') == reexport
+    assert fingerprints.find_identical('md5-id-first') == name
@@ -0,0 +1,61 @@
+# tests/test_part2_converted.py - part2 reads part1's outputs from the converted store/month folder
+import io
+
+import pandas as pd
+import pytest
+
+import part2
+
+SOURCE = "1234_2025-01-31_sales.csv"
+
+
+@pytest.fixture
+def converted_drive(monkeypatch):
+    """{(parent_id, name): file} folders and files; downloads return the file's CSV text."""
+    folders = {(part2.CONVERTED_FOLDER_ID, '1234'): 'store-1234', ('store-1234', 'January 2025'): 'jan-2025'}
+    files = {}
+
+    def find_file(folder_id, name, fields="id, md5Checksum"):
+        return files.get((folder_id, name))
+
+    def download_csv_to_df(file_id, size=None):
+        text = next(f['text'] for f in files.values() if f['id'] == file_id)
+        return pd.read_csv(io.StringIO(text), dtype=str)
+
+    monkeypatch.setattr(part2, 'find_folder', lambda parent_id, name: folders.get((parent_id, name)))
+    monkeypatch.setattr(part2, 'find_file', find_file)
+    monkeypatch.setattr(part2, 'download_csv_to_df', download_csv_to_df)
+    monkeypatch.setattr(part2, 'sidecars_enabled', lambda: False)
+    monkeypatch.setattr(part2.artifacts, 'enabled', lambda: False)
+    return files
+
+
+def test_reads_converted_csv_from_store_month_folder(converted_drive):
+    converted_drive[('jan-2025', 'converted_' + SOURCE)] = {'id': 'conv', 'text': "a,b\n1,2\n"}
+    # Same name elsewhere (another store's folder) is not picked up
+    converted_drive[('store-9999', 'converted_' + SOURCE)] = {'id': 'stale', 'text': "a,b\n9,9\n"}
+
+    df = part2.load_converted_df(SOURCE)
+
+    assert df.to_dict('list') == {'a': ['1'], 'b': ['2']}
+
+
+def test_missing_converted_output_is_none(converted_drive):
+    assert part2.load_converted_df(SOURCE) is None
+    assert part2.load_converted_df("5678_2025-01-31_sales.csv") is None
+
+
+def test_batch_of_duplicates_only_succeeds_without_writing(converted_drive, monkeypatch):
+    monkeypatch.setattr(part2, 'upsert_file', lambda *args, **kwargs: pytest.fail("nothing should be written"))
+
+    assert part2.process_store_batch("1234 Main St", [('source-id', SOURCE)], 'dest') is True
+
+
+def test_batch_fails_when_a_read_raises(converted_drive, monkeypatch):
+    converted_drive[('jan-2025', 'converted_' + SOURCE)] = {'id': 'conv', 'text': "a,b\n1,2\n"}
+
+    def broken(file_id, size=None):
+        raise OSError("download failed")
+    monkeypatch.setattr(part2, 'download_csv_to_df', broken)
+
+    assert part2.process_store_batch("1234 Main St", [('source-id', SOURCE)], 'dest') is False
@@ -0,0 +1,110 @@
+# tests/test_part2_summary.py - Monthly workbooks and the store summary across a month boundary
+import io
+import shutil
+import datetime
+
+import pandas as pd
+import pytest
+
+import synthetic
+import part2
+
+# Orders run from 10:30 to past midnight, so 01/31's business day ends on Feb 1
+DAYS = [datetime.date(2025, 1, 31), datetime.date(2025, 2, 1)]
+ORDERS = 50
+
+
+def consolidated_frame():
+    frames = [pd.read_csv(io.StringIO(synthetic.converted_csv(day=day, orders=ORDERS, seed=n)), dtype=str)
+              for n, day in enumerate(DAYS)]
+    df = part2.add_date_columns(pd.concat(frames, ignore_index=True))
+    return df, part2.add_line_totals(df)
+
+
+@pytest.fixture
+def fake_drive(tmp_path, monkeypatch):
+    """Stores uploaded files under tmp_path; read_existing_sheets reads them back."""
+    drive = tmp_path / 'drive'
+    drive.mkdir()
+
+    def upsert_file(folder_id, name, mimetype, data=None, path=None):
+        existed = (drive / name).exists()
+        shutil.copy(path, drive / name)
+        return name, 'updated' if existed else 'created'
+
+    def read_existing_sheets(folder_id, filename, sheets):
+        if not (drive / filename).exists():
+            return None
+        with pd.ExcelFile(drive / filename) as xls:
+            return {name: xls.parse(name, **kwargs) for name, kwargs in sheets.items()}
+
+    monkeypatch.setattr(part2, 'upsert_file', upsert_file)
+    monkeypatch.setattr(part2, 'read_existing_sheets', read_existing_sheets)
+    return drive
+
+
+@pytest.mark.parametrize('layout', ['wide', 'long'])
+def test_summary_counts_one_row_per_business_day(layout, tmp_path, fake_drive, monkeypatch):
+    monkeypatch.setattr(part2, 'PIVOT_LAYOUT', layout)
+    df, cols = consolidated_frame()
+    partitions = part2.split_by_month(df)
+    assert set(partitions) == {'2025-01', '2025-02'}
+
+    month_tables = {month: part2.write_consolidated_workbook(str(tmp_path / f"{month}.xlsx"), rows, *cols)
+                    for month, rows in partitions.items()}
+    part2.update_summary_workbook('1234', 'dest', month_tables)
+    # Rewriting only February must not disturb January's rows
+    part2.update_summary_workbook('1234', 'dest', {'2025-02': month_tables['2025-02']})
+
+    counts = pd.read_excel(fake_drive / part2.summary_name('1234'), sheet_name='Customer_Count', dtype={'Date_only': str})
+    assert counts['Date_only'].tolist() == ['01/31/2025', '02/01/2025']
+    assert counts['Customer_Count'].tolist() == [ORDERS, ORDERS]
+    assert counts['Total Count'].tolist() == [ORDERS, ORDERS]
+
+    total = pd.read_excel(fake_drive / part2.summary_name('1234'), sheet_name='Total_summary', header=[0, 1], index_col=0)
+    assert total.index.tolist() == ['01/31/2025', '02/01/2025']
+
+
+def test_summary_replaces_duplicate_days_left_by_older_runs(tmp_path, fake_drive):
+    df, cols = consolidated_frame()
+    month_tables = {month: part2.write_consolidated_workbook(str(tmp_path / f"{month}.xlsx"), rows, *cols)
+                    for month, rows in part2.split_by_month(df).items()}
+    # Summary written by the old sheet-based counting: a stray 01/31 row from February
+    stale = pd.DataFrame({'Date_only': ['01/31/2025', '01/31/2025'], 'Customer_Count': [ORDERS, 1],
+                          'Total Count': [ORDERS, 1]})
+    with pd.ExcelWriter(fake_drive / part2.summary_name('1234'), engine='openpyxl') as writer:
+        month_tables['2025-01']['Total_summary'].to_excel(writer, sheet_name='Total_summary')
+        stale.to_excel(writer, index=False, sheet_name='Customer_Count')
+
+    part2.update_summary_workbook('1234', 'dest', {'2025-02': month_tables['2025-02']})
+
+    counts = pd.read_excel(fake_drive / part2.summary_name('1234'), sheet_name='Customer_Count', dtype={'Date_only': str})
+    assert counts['Date_only'].tolist() == ['01/31/2025', '02/01/2025']
+    assert counts['Customer_Count'].tolist() == [ORDERS, ORDERS]
+
+
+def test_retry_after_a_failed_summary_does_not_append_twice(fake_drive, monkeypatch):
+    sources = {f"1234_{day}_sales.csv": synthetic.converted_csv(day=day, orders=ORDERS, seed=n)
+               for n, day in enumerate(DAYS)}
+    monkeypatch.setattr(part2, 'load_converted_df',
+                        lambda file_name: pd.read_csv(io.StringIO(sources[file_name]), dtype=str))
+    monkeypatch.setattr(part2, 'find_file', lambda folder_id, name, fields=None: None)
+    monkeypatch.setattr(part2.rollup, 'enabled', lambda: False)
+    batch = [(f"id-{name}", name) for name in sources]
+    update_summary = part2.update_summary_workbook
+
+    def offline(*args):
+        raise OSError("upload failed")
+    monkeypatch.setattr(part2, 'update_summary_workbook', offline)
+    assert part2.process_store_batch('1234', batch, 'dest') is False
+    monkeypatch.setattr(part2, 'update_summary_workbook', update_summary)
+    assert part2.process_store_batch('1234', batch, 'dest') is True
+
+    rows = {month: len(pd.read_excel(fake_drive / part2.workbook_name('1234', month), sheet_name='Data'))
+            for month in ('2025-01', '2025-02')}
+    one_pass = {month: len(df) for month, df in part2.split_by_month(consolidated_frame()[0]).items()}
+    assert rows == one_pass
+    counts = pd.read_excel(fake_drive / part2.summary_name('1234'), sheet_name='Customer_Count')
+    assert counts['Customer_Count'].tolist() == [ORDERS, ORDERS]
+    # Finished batches leave no progress behind
+    assert part2.load_state(part2.PROGRESS_NAME, {}) == {}
@@ -0,0 +1,59 @@
+# tests/test_payroll_main.py - payroll.main writes statuses after every claim batch
+import pytest
+
+import payroll
+import scheduler
+
+
+@pytest.fixture
+def fake_payroll(monkeypatch):
+    """45 pending files; returns the status writes ([{row: status}] in call order)."""
+    pending = [(f"file-{row}", f"{row}_payroll.csv", row) for row in range(2, 47)]
+    writes = []
+
+    def process_payroll_file(file_id, file_name, row_num):
+        payroll.mark_payroll_status(row_num, file_name, "PAYROLL DONE")
+
+    monkeypatch.setattr(payroll, 'get_pending_payroll_uploads', lambda: pending)
+    monkeypatch.setattr(payroll, 'get_file_sizes', lambda file_ids: {file_id: 1000 for file_id in file_ids})
+    monkeypatch.setattr(payroll, 'claim_rows', lambda sheet_id, rows, **kwargs: list(rows))
+    monkeypatch.setattr(payroll, 'process_payroll_file', process_payroll_file)
+    monkeypatch.setattr(payroll, 'set_row_statuses', lambda sheet_id, statuses: writes.append(dict(statuses)))
+    monkeypatch.setattr(payroll.hours_index, 'save', lambda: 0)
+    monkeypatch.setattr(payroll.ledger, 'record', lambda *args, **kwargs: None)
+    monkeypatch.setattr(payroll, 'report_client_stats', lambda: None)
+    monkeypatch.setattr(payroll, 'pending_statuses', {})
+    # An unlimited window
+    monkeypatch.setattr(scheduler, '_deadline', None)
+    monkeypatch.setattr(scheduler, '_window_started', True)
+    return writes
+
+
+def test_statuses_flushed_per_claim_batch(fake_payroll):
+    payroll.main()
+
+    assert [len(w) for w in fake_payroll] == [20, 20, 5]
+    assert sorted(row for w in fake_payroll for row in w) == list(range(2, 47))
+
+
+def test_statuses_of_finished_batches_survive_a_crash(fake_payroll, monkeypatch):
+    done = []
+
+    def process_payroll_file(file_id, file_name, row_num):
+        if len(done) == 25:
+            raise RuntimeError("runner killed")
+        done.append(row_num)
+        payroll.mark_payroll_status(row_num, file_name, "PAYROLL DONE")
+    monkeypatch.setattr(payroll, 'process_payroll_file', process_payroll_file)
+    # The final flush fails too (e.g. the runner lost its network)
+    writes = fake_payroll
+
+    def set_row_statuses(sheet_id, statuses):
+        if len(writes) == 1:
+            raise OSError("offline")
+        writes.append(dict(statuses))
+    monkeypatch.setattr(payroll, 'set_row_statuses', set_row_statuses)
+
+    with pytest.raises(RuntimeError):
+        payroll.main()
+    assert [len(w) for w in writes] == [20]
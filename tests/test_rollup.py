@@ -0,0 +1,82 @@
+# tests/test_rollup.py - The daily sales rollup lives on Drive; the state dir only caches it
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import drive_table
+import rollup
+
+
+def day_rows(store, day, total):
+    return pd.DataFrame({'date': [pd.Timestamp(day)], 'store': [store], 'PivotTable_total': [total],
+                         'Pivot_Delv': [0.0], 'Soda_dinein_sales': [0.0], 'Donation': [0.0], 'customers': [10]})
+
+
+@pytest.fixture
+def drive(tmp_path, monkeypatch):
+    """The rollup folder as a local directory."""
+    folder = tmp_path / 'drive'
+    folder.mkdir()
+
+    def fetch_copy(folder_id, name, path):
+        if not (folder / name).exists():
+            return False
+        shutil.copy(folder / name, path)
+        return True
+
+    def upsert_file(folder_id, name, mimetype, data=None, path=None):
+        shutil.copy(path, folder / name)
+        return name, 'updated'
+
+    monkeypatch.setattr(drive_table, 'fetch_copy', fetch_copy)
+    monkeypatch.setattr(drive_table, 'upsert_file', upsert_file)
+    monkeypatch.setattr(rollup._table, '_cache', None)
+    monkeypatch.setattr(rollup._table, '_staged', [])
+    monkeypatch.setattr(rollup._table, '_synced_at', None)
+    return folder
+
+
+def test_save_uploads_and_queries_survive_a_lost_cache(drive):
+    rollup.stage('1234', {'2025-01'}, day_rows('1234', '2025-01-31', 100.0))
+    assert rollup.save() == 1
+    assert (drive / rollup.ROLLUP_NAME).exists()
+
+    # A run restored without the state dir cache
+    os.remove(rollup.rollup_path())
+    totals = rollup.sales_by_store('2025-01-01', '2025-01-31')
+    assert totals.loc['1234', 'PivotTable_total'] == 100.0
+
+
+def test_save_merges_onto_the_drive_copy_not_a_stale_cache(drive):
+    rollup.stage('1234', {'2025-01'}, day_rows('1234', '2025-01-31', 100.0))
+    rollup.save()
+    stale = rollup.rollup_path() + '.stale'
+    shutil.copy(rollup.rollup_path(), stale)
+
+    # Another run adds a store...
+    rollup.stage('5678', {'2025-01'}, day_rows('5678', '2025-01-31', 50.0))
+    rollup.save()
+    # ...while this run's cache still holds the older copy
+    os.replace(stale, rollup.rollup_path())
+    rollup.stage('1234', {'2025-01'}, day_rows('1234', '2025-01-31', 120.0))
+    rollup.save()
+
+    totals = rollup.sales_by_store('2025-01-01', '2025-01-31')
+    assert totals['PivotTable_total'].to_dict() == {'1234': 120.0, '5678': 50.0}
+
+
+def test_queries_sync_with_drive_once_per_interval(drive, monkeypatch):
+    rollup.stage('1234', {'2025-01'}, day_rows('1234', '2025-01-31', 100.0))
+    rollup.save()
+    syncs = []
+    monkeypatch.setattr(drive_table, 'fetch_copy', lambda *args: syncs.append(args))
+
+    for _ in range(3):
+        rollup.sales_by_store('2025-01-01', '2025-01-31')
+    assert syncs == []
+
+    monkeypatch.setattr(drive_table, 'QUERY_SYNC_SECONDS', 0)
+    rollup.sales_by_store('2025-01-01', '2025-01-31')
+    assert len(syncs) == 1
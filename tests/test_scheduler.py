@@ -0,0 +1,95 @@
+# tests/test_scheduler.py - Schedule ordering and admission within the run's time budget
+import pytest
+
+import scheduler
+from scheduler import Schedule
+
+# With no history a unit costs files * DEFAULT_SECONDS_PER_FILE (3s per file)
+UNITS = {'small': (['f'], 0), 'big': (['f', 'f'], 0), 'bigger': (['f', 'f'], 2 * 2**20)}
+
+
+@pytest.fixture(autouse=True)
+def run_window(monkeypatch):
+    """Restores the module's run window after each test."""
+    monkeypatch.setattr(scheduler, '_deadline', None)
+    monkeypatch.setattr(scheduler, '_window_started', False)
+
+
+def test_no_budget_admits_everything():
+    scheduler.start_window(0)
+    plan = Schedule('part1')
+
+    assert all(plan.admit(key) for key in plan.ordered(UNITS))
+    assert plan.deferred == []
+
+
+def test_no_budget_admits_units_beyond_the_default_window():
+    # Five 500MB stores: about 1000s each at the prior rates, far over TIME_BUDGET
+    stores = {f"store-{n}": (['f'] * 10, 500 * 2**20) for n in range(5)}
+    scheduler.start_window(0)
+    plan = Schedule('backfill')
+
+    assert scheduler.remaining() is None
+    assert [key for key in plan.ordered(stores) if plan.admit(key)] == sorted(stores)
+
+
+def test_standalone_schedule_opens_the_default_window():
+    plan = Schedule('part1')
+
+    assert 0 < scheduler.remaining() <= scheduler.TIME_BUDGET
+    big = {'store': (['f'] * 10, 500 * 2**20)}
+    assert [key for key in plan.ordered(big) if plan.admit(key)] == []
+
+
+def test_admits_longest_first_while_they_fit():
+    # bigger = 10s, big = 6s, small = 3s
+    scheduler.start_window(14.5)
+    plan = Schedule('part1')
+    order = plan.ordered(UNITS)
+    assert order == ['bigger', 'big', 'small']
+
+    admitted = [key for key in order if plan.admit(key)]
+    # 10s admitted, 4.5s left: big would overrun, small still fits
+    assert admitted == ['bigger', 'small']
+    assert plan.deferred == ['big']
+
+
+def test_finished_units_free_their_share():
+    scheduler.start_window(10.5)
+    plan = Schedule('part1')
+    plan.ordered(UNITS)
+
+    assert plan.admit('big')
+    assert not plan.admit('bigger')
+    with plan.running('big'):
+        pass
+    # Released right away, so only the (tiny) elapsed time counts against the window
+    assert plan.admit('small')
+    assert plan.reserved == {'small': 3.0}
+
+
+def test_deferred_units_go_first_next_run_even_when_oversized():
+    scheduler.start_window(5)
+    plan = Schedule('part2')
+    order = plan.ordered(UNITS)
+    assert [key for key in order if plan.admit(key)] == ['small']
+    plan.finish()
+
+    scheduler.start_window(5)
+    plan = Schedule('part2')
+    order = plan.ordered(UNITS)
+    assert order[:2] == ['bigger', 'big']
+    # Carried over and nothing started yet: runs despite not fitting
+    assert plan.admit('bigger')
+    assert not plan.admit('big')
+
+
+def test_observed_runs_update_the_cost_model():
+    scheduler.start_window(0)
+    plan = Schedule('payroll', per_key=False)
+    plan.ordered({'report': (['f'] * 4, 0)})
+    for _ in range(20):
+        plan.observe('report', 40.0)
+    plan.finish()
+
+    assert Schedule('payroll').per_file > scheduler.DEFAULT_SECONDS_PER_FILE * 2
@@ -0,0 +1,125 @@
+# tests/test_tracking.py - Row leases against an in-memory tracking sheet
+import re
+import datetime
+
+import pytest
+
+import tracking
+
+OTHER = "other-host-1-deadbeef"
+
+
+def expiry(seconds):
+    return (tracking._utcnow() + datetime.timedelta(seconds=seconds)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeSheet:
+    """Rows as lists (A:F); batchUpdate writes land through execute()."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.writes = []
+        # Called after each batchUpdate, to let a competing run write during the settle delay
+        self.after_write = None
+
+    def read(self, sheet_id, row_nums):
+        return {r: list(self.rows.get(r, [])) for r in row_nums}
+
+    def apply(self, body):
+        for update in body['data']:
+            first, row = re.match(r".*!([A-F])(\d+):", update['range']).groups()
+            row = int(row)
+            cells = self.rows.setdefault(row, [])
+            start = ord(first) - ord('A')
+            cells.extend([''] * (start + len(update['values'][0]) - len(cells)))
+            cells[start:start + len(update['values'][0])] = update['values'][0]
+            self.writes.append(row)
+        if self.after_write:
+            self.after_write(self)
+
+
+@pytest.fixture
+def sheet(monkeypatch):
+    sheet = FakeSheet({})
+
+    class Values:
+        def batchUpdate(self, spreadsheetId, body):
+            return body
+
+    class Spreadsheets:
+        def values(self):
+            return Values()
+
+    class Service:
+        def spreadsheets(self):
+            return Spreadsheets()
+
+    monkeypatch.setattr(tracking, 'get_service', lambda *args: Service())
+    monkeypatch.setattr(tracking, 'execute', sheet.apply)
+    monkeypatch.setattr(tracking, '_read_rows', sheet.read)
+    monkeypatch.setattr(tracking, 'CLAIM_SETTLE_SECONDS', 0)
+    return sheet
+
+
+def test_claims_unleased_rows(sheet):
+    sheet.rows.update({2: ['f2', 'a.csv', '', 'UPLOADED'], 3: ['f3', 'b.csv', '', 'UPLOADED', '', '']})
+
+    assert tracking.claim_rows('sheet', [3, 2, 3]) == [2, 3]
+    assert sheet.rows[2][4] == tracking.RUN_TOKEN
+    assert sheet.rows[3][3] == 'UPLOADED'
+
+
+def test_skips_live_lease_of_another_run_without_overwriting(sheet):
+    held = ['f2', 'a.csv', '', 'PART2_CLAIMED', OTHER, expiry(600)]
+    sheet.rows.update({2: list(held), 3: ['f3', 'b.csv', '', 'PART1_DONE']})
+
+    assert tracking.claim_rows('sheet', [2, 3], status='PART2_CLAIMED') == [3]
+    assert sheet.rows[2] == held
+    assert sheet.writes == [3]
+
+
+def test_claims_expired_lease(sheet):
+    sheet.rows[2] = ['f2', 'a.csv', '', 'PART2_CLAIMED', OTHER, expiry(-60)]
+
+    assert tracking.claim_rows('sheet', [2], status='PART2_CLAIMED') == [2]
+    assert sheet.rows[2][4] == tracking.RUN_TOKEN
+
+
+def test_skips_rows_whose_status_moved_on(sheet):
+    # Finished by another run after this run listed it as pending
+    sheet.rows.update({2: ['f2', 'a.csv', '', 'PART1_DONE', '', ''], 3: ['f3', 'b.csv', '', 'UPLOADED']})
+
+    assert tracking.claim_rows('sheet', [2, 3], expected_statuses={'UPLOADED'}) == [3]
+    assert sheet.writes == [3]
+
+
+def test_drops_rows_overwritten_during_settle(sheet):
+    sheet.rows.update({2: ['f2', 'a.csv', '', 'UPLOADED'], 3: ['f3', 'b.csv', '', 'UPLOADED']})
+
+    def competing_run(sheet):
+        sheet.after_write = None
+        sheet.rows[3][4:6] = [OTHER, expiry(600)]
+    sheet.after_write = competing_run
+
+    assert tracking.claim_rows('sheet', [2, 3]) == [2]
+
+
+def test_nothing_to_claim_skips_the_write(sheet):
+    sheet.rows[2] = ['f2', 'a.csv', '', 'PAYROLL UPLOADED', OTHER, expiry(600)]
+
+    assert tracking.claim_rows('sheet', [2]) == []
+    assert tracking.claim_rows('sheet', []) == []
+    assert sheet.writes == []
+
+
+def test_status_transition_clears_the_lease_in_place(sheet):
+    sheet.rows.update({2: ['f2', 'a.csv', '', 'PART1_DONE'], 3: ['f3', 'b.csv', '', 'PART1_DONE']})
+    tracking.claim_rows('sheet', [2, 3], status='PART2_CLAIMED')
+
+    tracking.set_row_statuses('sheet', {2: 'PART2_DONE'})
+    tracking.release_rows('sheet', [3])
+
+    assert sheet.rows[2] == ['f2', 'a.csv', '', 'PART2_DONE', '', '']
+    assert sheet.rows[3][3:] == ['PART2_CLAIMED', '', '']
+    # Released without a status change: the next run picks it up again
+    assert not tracking.is_leased_by_other(sheet.rows[3])
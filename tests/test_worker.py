@@ -0,0 +1,44 @@
+# tests/test_worker.py - worker --once reports failed stages through its exit status
+import sys
+
+import pytest
+
+import worker
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """{stage: callable} run in place of the stage modules."""
+    runs = {}
+    monkeypatch.setattr(worker, 'has_pending_work', lambda stage: True)
+    monkeypatch.setattr(worker, 'load_stage', lambda stage: runs[stage])
+    monkeypatch.setattr(worker, 'reset_metrics', lambda: None)
+    monkeypatch.setattr(worker.signal, 'signal', lambda *args: None)
+    monkeypatch.setattr(worker.stop_event, 'is_set', lambda: False)
+    return runs
+
+
+def run_once(monkeypatch, stages):
+    monkeypatch.setattr(sys, 'argv', ['worker.py', '--once', '--stages', ','.join(stages)])
+    worker.main()
+
+
+def test_once_exits_nonzero_when_a_stage_raised(stages, monkeypatch):
+    def broken():
+        raise RuntimeError("sheet unavailable")
+    stages.update({'part1': broken, 'part2': lambda: None})
+
+    with pytest.raises(SystemExit) as exit_info:
+        run_once(monkeypatch, ['part1', 'part2'])
+    assert exit_info.value.code == 1
+    # The remaining stages still ran and were checkpointed
+    assert worker.load_checkpoint()['stages']['part2']['ok'] is True
+    assert worker.load_checkpoint()['stages']['part1']['ok'] is False
+
+
+def test_once_exits_cleanly_when_every_stage_succeeded(stages, monkeypatch):
+    stages.update({'part1': lambda: None, 'part2': lambda: None})
+
+    run_once(monkeypatch, ['part1', 'part2'])
+
+    assert worker.load_checkpoint()['cycles'] == 1
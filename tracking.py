@@ -0,0 +1,291 @@
+# tracking.py - Delta-only reads, leases and status updates for the tracking sheets
+import os
+import time
+import uuid
+import zlib
+import socket
+import datetime
+
+from google_clients import get_service, execute, call_with_retry, get_authorized_session, error_status, error_content
+from state import load_state, save_state
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+SALES_TRACKING_SHEET_ID = "1r872UNCcsgkdEkV9Y9PnNcuTtPrezs0XE3n8HFZgqyM"
+PAYROLL_TRACKING_SHEET_ID = "1O4aYE5mdXdAXtlvyQfcHoaQtqj3GoEyOOGE_UDK0DfI"
+
+# Per stage: its sheet, the statuses kept in the cursor's pending index
+# ('watch'), and the statuses that mean there is work to do ('ready').
+STAGE_TRACKING = {
+    'part1': {
+        'sheet_id': SALES_TRACKING_SHEET_ID,
+        'watch': {"UPLOADED"},
+        'ready': {"UPLOADED"},
+    },
+    'part2': {
+        # UPLOADED rows are watched too: they become PART1_DONE later.
+        # Claimed rows stay watched so a crashed run's claims remain visible.
+        'sheet_id': SALES_TRACKING_SHEET_ID,
+        'watch': {"UPLOADED", "PART1_DONE", "PART2_CLAIMED"},
+        'ready': {"PART1_DONE", "PART2_CLAIMED"},
+    },
+    'payroll': {
+        'sheet_id': PAYROLL_TRACKING_SHEET_ID,
+        'watch': {"PAYROLL UPLOADED"},
+        'ready': {"PAYROLL UPLOADED"},
+    },
+}
+
+SHEET_NAME = "Sheet1"
+SHEETS_API = "https://sheets.googleapis.com/v4/spreadsheets"
+# Row layout: [FileID, FileName, Date, Status, LeaseToken, LeaseExpiry]
+LAST_COLUMN = "F"
+# Pending rows are re-read with batchGet, this many ranges per call.
+BATCH_GET_SIZE = 200
+# Set to 1 to ignore the cursor and scan the whole sheet once (e.g. after
+# statuses were edited by hand).
+FULL_RESCAN = os.environ.get('POPEYES_FULL_RESCAN') == '1'
+
+# Leases: a run stamps its token and an expiry on the rows it works on.
+# Other runs skip those rows until the expiry passes (crashed runs recover).
+RUN_TOKEN = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+LEASE_SECONDS = int(os.environ.get('POPEYES_LEASE_SECONDS', 1800))
+# Pause between writing a claim and reading it back, so a competing claim
+# written in the same window is visible to both runs and only one keeps the row.
+CLAIM_SETTLE_SECONDS = float(os.environ.get('POPEYES_CLAIM_SETTLE_SECONDS', 2))
+
+# Sharding: POPEYES_SHARD="i/n" limits this run to stores hashing to bucket i.
+SHARD = os.environ.get('POPEYES_SHARD', '')
+
+# ==============================================================================
+# CURSOR STATE
+# ==============================================================================
+def _state_name(sheet_id, stage):
+    return f"cursor_{stage}_{sheet_id}.json"
+
+def load_cursor(sheet_id, stage):
+    """
+    Returns {'cursor': last_row_read, 'pending': [row_nums]}.
+    Row 1 is the header, so a fresh cursor starts at 1.
+    """
+    fresh = {'cursor': 1, 'pending': []}
+    if FULL_RESCAN:
+        return fresh
+    return load_state(_state_name(sheet_id, stage), fresh)
+
+def save_cursor(sheet_id, stage, cursor, pending):
+    save_state(_state_name(sheet_id, stage), {'cursor': cursor, 'pending': sorted(pending)})
+
+# ==============================================================================
+# READERS
+# ==============================================================================
+def _exceeds_grid(error):
+    # Cursor already sits on the last grid row: nothing new
+    return error_status(error) == 400 and 'exceeds grid limits' in error_content(error)
+
+def _read_tail(sheet_id, first_row):
+    service = get_service('sheets', 'v4')
+    try:
+        result = execute(service.spreadsheets().values().get(
+            spreadsheetId=sheet_id,
+            range=f"{SHEET_NAME}!A{first_row}:{LAST_COLUMN}"
+        ))
+    except Exception as e:
+        if _exceeds_grid(e):
+            return []
+        raise
+    return result.get('values', [])
+
+def _read_rows(sheet_id, row_nums):
+    """Re-reads specific rows with batchGet. Returns {row_num: row}."""
+    service = get_service('sheets', 'v4')
+    rows = {}
+    row_nums = sorted(row_nums)
+    for start in range(0, len(row_nums), BATCH_GET_SIZE):
+        chunk = row_nums[start:start + BATCH_GET_SIZE]
+        result = execute(service.spreadsheets().values().batchGet(
+            spreadsheetId=sheet_id,
+            ranges=[f"{SHEET_NAME}!A{r}:{LAST_COLUMN}{r}" for r in chunk]
+        ))
+        for r, value_range in zip(chunk, result.get('valueRanges', [])):
+            values = value_range.get('values', [])
+            rows[r] = values[0] if values else []
+    return rows
+
+# Lightweight readers: plain REST on column D only, no googleapiclient.
+# Rows come back padded to the usual layout so the status is still row[3].
+def _rest_get(url, params, endpoint):
+    def call():
+        response = get_authorized_session().get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+    return call_with_retry(call, endpoint)
+
+def _status_only(values):
+    return ["", "", "", values[0]] if values else []
+
+def _read_tail_status(sheet_id, first_row):
+    try:
+        result = _rest_get(
+            f"{SHEETS_API}/{sheet_id}/values/{SHEET_NAME}!D{first_row}:D",
+            {}, 'sheets.spreadsheets.values.get'
+        )
+    except Exception as e:
+        if _exceeds_grid(e):
+            return []
+        raise
+    return [_status_only(values) for values in result.get('values', [])]
+
+def _read_rows_status(sheet_id, row_nums):
+    rows = {}
+    row_nums = sorted(row_nums)
+    for start in range(0, len(row_nums), BATCH_GET_SIZE):
+        chunk = row_nums[start:start + BATCH_GET_SIZE]
+        result = _rest_get(
+            f"{SHEETS_API}/{sheet_id}/values:batchGet",
+            {'ranges': [f"{SHEET_NAME}!D{r}" for r in chunk]},
+            'sheets.spreadsheets.values.batchGet'
+        )
+        for r, value_range in zip(chunk, result.get('valueRanges', [])):
+            values = value_range.get('values', [])
+            rows[r] = _status_only(values[0]) if values else []
+    return rows
+
+def _scan(sheet_id, stage, watch_statuses, read_tail, read_rows):
+    state = load_cursor(sheet_id, stage)
+    cursor = state['cursor']
+
+    tail = read_tail(sheet_id, cursor + 1)
+    rows = {cursor + 1 + i: row for i, row in enumerate(tail)}
+    rows.update(read_rows(sheet_id, [r for r in state['pending'] if r not in rows]))
+
+    pending = [r for r, row in rows.items() if len(row) >= 4 and row[3] in watch_statuses]
+    save_cursor(sheet_id, stage, cursor + len(tail), pending)
+
+    return sorted(rows.items())
+
+def read_tracking_rows(sheet_id, stage, watch_statuses=None):
+    """
+    Returns [(row_num, row)] for rows appended since the last call plus rows
+    that were still in one of `watch_statuses` when last seen, in row order.
+
+    Each call costs O(new rows + still-pending rows) instead of O(all rows):
+    only the tail after the cursor and the remembered pending rows are
+    fetched. Rows whose status leaves `watch_statuses` drop out of the index;
+    rows moved back into it by hand are picked up with POPEYES_FULL_RESCAN=1.
+    """
+    watch_statuses = watch_statuses or STAGE_TRACKING[stage]['watch']
+    return _scan(sheet_id, stage, watch_statuses, _read_tail, _read_rows)
+
+def has_pending_work(stage):
+    """
+    Cheap startup check: advances the stage's cursor using column D only,
+    over a plain authorized REST session (no pandas, no googleapiclient,
+    no discovery), and reports whether any row is in a 'ready' status.
+    """
+    spec = STAGE_TRACKING[stage]
+    rows = _scan(spec['sheet_id'], stage, spec['watch'], _read_tail_status, _read_rows_status)
+    return any(len(row) >= 4 and row[3] in spec['ready'] for _, row in rows)
+
+# ==============================================================================
+# SHARDING
+# ==============================================================================
+def in_shard(store_key):
+    """True when `store_key` belongs to this run's shard (always true if unsharded)."""
+    if not SHARD:
+        return True
+    index, count = (int(x) for x in SHARD.split('/'))
+    return zlib.crc32(str(store_key).encode('utf-8')) % count == index
+
+# ==============================================================================
+# LEASES
+# ==============================================================================
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _parse_expiry(value):
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+def is_leased_by_other(row, now=None):
+    """True if another run holds a live lease on this row."""
+    if len(row) < 6 or not row[4] or row[4] == RUN_TOKEN:
+        return False
+    expiry = _parse_expiry(row[5])
+    return expiry is not None and expiry > (now or _utcnow())
+
+def claim_rows(sheet_id, row_nums, status=None, lease_seconds=None, expected_statuses=None):
+    """
+    Leases `row_nums` to this run and returns the subset it actually owns.
+
+    The rows are re-read right before the write, and rows another run holds
+    a live lease on (or, with `expected_statuses`, whose status has moved on,
+    e.g. finished by another run since this run's scan) are skipped rather
+    than overwritten. Token and expiry (and optionally a new status) for the
+    remaining rows go out in a single batchUpdate, then the rows are read
+    back after a short settle delay and rows whose token was overwritten are
+    dropped.
+
+    Sheets has no compare-and-set, so this narrows the race to two claims
+    landing within the same few seconds; it does not rule it out.
+    """
+    row_nums = sorted(set(row_nums))
+    if not row_nums:
+        return []
+
+    current = _read_rows(sheet_id, row_nums)
+    now = _utcnow()
+    row_nums = [r for r in row_nums if not is_leased_by_other(current.get(r, []), now)
+                and (expected_statuses is None or (len(current.get(r, [])) >= 4 and current[r][3] in expected_statuses))]
+    if not row_nums:
+        return []
+
+    expiry = (now + datetime.timedelta(seconds=lease_seconds or LEASE_SECONDS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    if status is None:
+        data = [{"range": f"{SHEET_NAME}!E{r}:F{r}", "values": [[RUN_TOKEN, expiry]]} for r in row_nums]
+    else:
+        data = [{"range": f"{SHEET_NAME}!D{r}:F{r}", "values": [[status, RUN_TOKEN, expiry]]} for r in row_nums]
+
+    service = get_service('sheets', 'v4')
+    execute(service.spreadsheets().values().batchUpdate(
+        spreadsheetId=sheet_id,
+        body={"valueInputOption": "RAW", "data": data}
+    ))
+
+    time.sleep(CLAIM_SETTLE_SECONDS)
+    rows = _read_rows(sheet_id, row_nums)
+    return [r for r in row_nums if len(rows.get(r, [])) >= 5 and rows[r][4] == RUN_TOKEN]
+
+def release_rows(sheet_id, row_nums):
+    """Clears this run's lease without touching the status."""
+    data = [{"range": f"{SHEET_NAME}!E{r}:F{r}", "values": [["", ""]]} for r in sorted(set(row_nums))]
+    if not data:
+        return
+    service = get_service('sheets', 'v4')
+    execute(service.spreadsheets().values().batchUpdate(
+        spreadsheetId=sheet_id,
+        body={"valueInputOption": "RAW", "data": data}
+    ))
+
+# ==============================================================================
+# STATUS UPDATES
+# ==============================================================================
+def set_row_statuses(sheet_id, statuses):
+    """
+    Writes {row_num: status} into column D with a single batchUpdate and
+    clears the lease on those rows in the same call.
+    """
+    data = [
+        {"range": f"{SHEET_NAME}!D{r}:F{r}", "values": [[status, "", ""]]}
+        for r, status in sorted(statuses.items())
+    ]
+    if not data:
+        return
+    service = get_service('sheets', 'v4')
+    execute(service.spreadsheets().values().batchUpdate(
+        spreadsheetId=sheet_id,
+        body={"valueInputOption": "RAW", "data": data}
+    ))
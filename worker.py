@@ -0,0 +1,140 @@
+# worker.py - Long-running worker: runs part1, part2 and payroll in a loop
+#
+#   python worker.py                      # poll every 5 minutes until stopped
+#   python worker.py --interval 60        # poll every minute
+#   python worker.py --once               # one cycle, then exit (cron mode; exit status 1 if a stage failed)
+#   python worker.py --stages part1,part2 # subset of stages
+import sys
+import time
+import signal
+import argparse
+import datetime
+import threading
+
+from state import load_state, save_state
+from metrics import reset as reset_metrics
+from scheduler import start_window
+from tracking import has_pending_work
+
+# ==============================================================================
+# CONFIGURATION
+# ==============================================================================
+STAGES = ['part1', 'part2', 'payroll']
+DEFAULT_INTERVAL = 300
+CHECKPOINT_NAME = "worker.json"
+
+# Set by SIGTERM/SIGINT; the current stage finishes, then the loop exits.
+stop_event = threading.Event()
+
+# ==============================================================================
+# SHUTDOWN & CHECKPOINTS
+# ==============================================================================
+def request_stop(signum, frame):
+    if not stop_event.is_set():
+        print(f"\n🛑 Signal {signum} received, finishing the current stage before exiting...")
+    stop_event.set()
+
+def load_checkpoint():
+    return load_state(CHECKPOINT_NAME, {'cycles': 0, 'stages': {}})
+
+def save_checkpoint(checkpoint, stage, ok, seconds):
+    checkpoint['stages'][stage] = {
+        'last_run': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'ok': ok,
+        'seconds': round(seconds, 3),
+    }
+    save_state(CHECKPOINT_NAME, checkpoint)
+
+# ==============================================================================
+# STAGES
+# ==============================================================================
+def load_stage(stage):
+    """
+    Imports the stage module once. Modules stay loaded between cycles, so
+    API clients, the part1 download pool and folder-ID caches stay warm.
+    """
+    if stage == 'part1':
+        import part1
+        return part1.main
+    if stage == 'part2':
+        import part2
+        return part2.main
+    if stage == 'payroll':
+        import payroll
+        return payroll.main
+    raise ValueError(f"Unknown stage: {stage}")
+
+def run_cycle(stages, checkpoint):
+    """Runs one cycle of `stages`; returns the stages that raised."""
+    # All stages of the cycle share one time budget (scheduler.TIME_BUDGET)
+    start_window()
+    failed = []
+    for stage in stages:
+        if stop_event.is_set():
+            break
+        # Each stage's summary covers that stage alone, even after an early return
+        reset_metrics()
+        start = time.perf_counter()
+        try:
+            # Checked with column D reads only; pandas and the stage module
+            # are imported only when there is something to do
+            pending = has_pending_work(stage)
+        except Exception as e:
+            print(f"⚠️ Pending check for {stage} failed ({e}), running the stage anyway")
+            pending = True
+        if not pending:
+            print(f"💤 {stage}: nothing to do ({time.perf_counter() - start:.2f}s)")
+            continue
+
+        print(f"\n▶️ Stage {stage}")
+        ok = True
+        try:
+            load_stage(stage)()
+        except Exception as e:
+            # One failing stage must not take the worker down
+            ok = False
+            failed.append(stage)
+            print(f"❌ Stage {stage} failed: {e}")
+        save_checkpoint(checkpoint, stage, ok, time.perf_counter() - start)
+
+    checkpoint['cycles'] += 1
+    save_state(CHECKPOINT_NAME, checkpoint)
+    return failed
+
+# ==============================================================================
+# MAIN
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Run the Popeyes pipeline stages in a loop.")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="seconds between cycles")
+    parser.add_argument('--stages', default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument('--once', action='store_true', help="run a single cycle and exit")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"unknown stage: {stage}")
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    checkpoint = load_checkpoint()
+    print(f"🚀 Worker starting (stages: {', '.join(stages)}, previous cycles: {checkpoint['cycles']})")
+
+    while not stop_event.is_set():
+        cycle_start = time.monotonic()
+        failed = run_cycle(stages, checkpoint)
+        if args.once:
+            if failed:
+                # Let CI see the failure; the loop mode keeps going instead
+                print(f"❌ Failed stages: {', '.join(failed)}")
+                sys.exit(1)
+            break
+        # Sleep out the remainder of the interval, waking early on shutdown
+        stop_event.wait(max(0.0, args.interval - (time.monotonic() - cycle_start)))
+
+    print("👋 Worker stopped.")
+
+if __name__ == "__main__":
+    main()